@@ -0,0 +1,71 @@
+"""Micro-benchmark of response serialization on scan-sized payloads.
+
+    python benchmarks/serialization_bench.py [--items 1000 10000] [--repeat 5]
+
+Compares the float-converting `json.dumps(default=...)` the handlers used
+before with lambda/serialization.py on the stdlib and (when installed)
+orjson (>= 3.9) encoders.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "lambda"))
+
+import serialization  # noqa: E402
+
+
+def legacy_default(obj):
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError
+
+
+def scan_page(count):
+    """Items shaped like a MetaDataFilms scan as boto3 returns them."""
+    random.seed(count)
+    return {
+        "items": [{
+            "film_id": f"film-{index:06d}",
+            "title": f"Title {index}",
+            "director": f"Director {index % 500}",
+            "year": Decimal(1950 + index % 75),
+            "version": Decimal(index % 7 + 1),
+            "rating": Decimal(f"{random.randint(10, 99) / 10:.1f}"),
+            "views": Decimal(random.randint(0, 10 ** 6)),
+            "genres": {"drama", "noir"} if index % 2 else {"comedy"},
+            "updated_at": "2026-10-18T10:00:00.000000+00:00"
+        } for index in range(count)],
+        "next_token": None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    def legacy(page):
+        return json.dumps(page, default=lambda obj: sorted(obj) if isinstance(obj, set) else legacy_default(obj))
+
+    encoders = {"json.dumps + float default": legacy,
+                "serialization (json)": lambda page: serialization.dumps(page, encoder="json")}
+    if serialization._fragments:
+        encoders["serialization (orjson)"] = lambda page: serialization.dumps(page, encoder="orjson")
+
+    for count in args.items:
+        page = scan_page(count)
+        print(f"{count} items")
+        for name, encode in encoders.items():
+            number = max(1, 20000 // count)
+            best = min(timeit.repeat(lambda: encode(page), number=number, repeat=args.repeat)) / number
+            print(f"  {name:<28} {best * 1000:8.2f} ms  {len(encode(page)) / 1024:8.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
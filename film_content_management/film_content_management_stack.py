@@ -1,9 +1,14 @@
 from aws_cdk import (
     core,
     aws_s3 as s3,
+    aws_s3_notifications as s3n,
     aws_dynamodb as dynamodb,
     aws_lambda as _lambda,
+    aws_lambda_event_sources as lambda_event_sources,
     aws_apigateway as apigateway,
+    aws_events as events,
+    aws_events_targets as targets,
+    aws_sqs as sqs,
     aws_iam as iam
 
 )
@@ -27,12 +32,112 @@ class FilmContentManagementStack(Stack):
 
         
         # KREIRANJE S3 I METADATA TABELE ZA DYNAMO-DB
-        content_bucket = s3.Bucket(self, "ContentBucket")
+        # Browsers upload and play content straight from the bucket with
+        # presigned URLs; players seek with Range requests
+        content_bucket = s3.Bucket(self, "ContentBucket",
+            cors=[s3.CorsRule(
+                allowed_methods=[s3.HttpMethods.PUT, s3.HttpMethods.GET, s3.HttpMethods.HEAD],
+                allowed_origins=["*"],
+                allowed_headers=["*"],
+                exposed_headers=["ETag", "Content-Range", "Accept-Ranges", "Content-Length"]
+            )],
+            # Staged uploads are moved within minutes; anything
+            # left behind is abandoned
+            lifecycle_rules=[s3.LifecycleRule(
+                prefix="uploads/",
+                abort_incomplete_multipart_upload_after=core.Duration.days(7),
+                expiration=core.Duration.days(7)
+            )]
+        )
 
         metadata_table = dynamodb.Table(
             self, "MetadataTable",
             table_name="MetaDataFilms",
-            partition_key={"name": "film_id", "type": dynamodb.AttributeType.STRING}
+            partition_key={"name": "film_id", "type": dynamodb.AttributeType.STRING},
+            stream=dynamodb.StreamViewType.NEW_AND_OLD_IMAGES
+        )
+
+        # Browse lookups: films by director and by year, both sorted by title
+        metadata_table.add_global_secondary_index(
+            index_name="director-title-index",
+            partition_key={"name": "director", "type": dynamodb.AttributeType.STRING},
+            sort_key={"name": "title", "type": dynamodb.AttributeType.STRING}
+        )
+        metadata_table.add_global_secondary_index(
+            index_name="year-title-index",
+            partition_key={"name": "year", "type": dynamodb.AttributeType.NUMBER},
+            sort_key={"name": "title", "type": dynamodb.AttributeType.STRING}
+        )
+
+        # Sparse change feed: only items stamped with change_day/change_seq appear;
+        # change_day is "<day>#<shard>" so one day's writes span several partitions
+        metadata_table.add_global_secondary_index(
+            index_name="changes-index",
+            partition_key={"name": "change_day", "type": dynamodb.AttributeType.STRING},
+            sort_key={"name": "change_seq", "type": dynamodb.AttributeType.STRING}
+        )
+
+        # Films by content blob, so probed media metadata reaches every film sharing it
+        metadata_table.add_global_secondary_index(
+            index_name="content-index",
+            partition_key={"name": "content_key", "type": dynamodb.AttributeType.STRING},
+            projection_type=dynamodb.ProjectionType.KEYS_ONLY
+        )
+
+        # Browse views kept up to date from the metadata table's stream
+        views_table = dynamodb.Table(
+            self, "ViewsTable",
+            table_name="FilmViews",
+            partition_key={"name": "view_id", "type": dynamodb.AttributeType.STRING},
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST
+        )
+
+        # Search: one entry per (normalized title/director word prefix, film),
+        # sorted by rank (score, title, film_id) so a page is one Query
+        search_index_table = dynamodb.Table(
+            self, "SearchRankTable",
+            table_name="FilmSearchRanks",
+            partition_key={"name": "token", "type": dynamodb.AttributeType.STRING},
+            sort_key={"name": "rank", "type": dynamodb.AttributeType.STRING},
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST
+        )
+        # Lets the write paths find and drop a film's stale tokens
+        search_index_table.add_global_secondary_index(
+            index_name="film_id-index",
+            partition_key={"name": "film_id", "type": dynamodb.AttributeType.STRING},
+            projection_type=dynamodb.ProjectionType.KEYS_ONLY
+        )
+
+        # Idempotency-Key records for create requests; DynamoDB expires them
+        idempotency_table = dynamodb.Table(
+            self, "IdempotencyTable",
+            table_name="FilmIdempotency",
+            partition_key={"name": "idempotency_key", "type": dynamodb.AttributeType.STRING},
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            time_to_live_attribute="expires_at"
+        )
+
+        # Content-addressed blobs (content/sha256/<parts_sha256>) and how many films use each
+        content_blobs_table = dynamodb.Table(
+            self, "ContentBlobsTable",
+            table_name="FilmContentBlobs",
+            partition_key={"name": "content_hash", "type": dynamodb.AttributeType.STRING},
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST
+        )
+
+        # Async writes: one FIFO message group per film keeps its writes in order
+        write_dead_letter_queue = sqs.Queue(
+            self, "FilmWriteDeadLetterQueue",
+            fifo=True,
+            retention_period=core.Duration.days(14)
+        )
+        write_queue = sqs.Queue(
+            self, "FilmWriteQueue",
+            fifo=True,
+            deduplication_scope=sqs.DeduplicationScope.MESSAGE_GROUP,
+            fifo_throughput_limit=sqs.FifoThroughputLimit.PER_MESSAGE_GROUP_ID,
+            visibility_timeout=core.Duration.seconds(180),
+            dead_letter_queue=sqs.DeadLetterQueue(max_receive_count=5, queue=write_dead_letter_queue)
         )
 
         # Create the IAM role for Lambda execution
@@ -103,7 +208,43 @@ class FilmContentManagementStack(Stack):
             code=_lambda.Code.from_asset("lambda"),
             environment={
                 'CONTENT_BUCKET': content_bucket.bucket_name,
-                'METADATA_TABLE': metadata_table.table_name
+                'METADATA_TABLE': metadata_table.table_name,
+                'IDEMPOTENCY_TABLE': idempotency_table.table_name,
+                'IDEMPOTENCY_TTL_SECONDS': '86400',
+                'WRITE_QUEUE_URL': write_queue.queue_url,
+                'WRITE_MODE': 'sync'
+            }
+        )
+
+        batch_create_film_function=_lambda.Function(
+            self, "BatchCreateFilmFunction",
+            runtime=_lambda.Runtime.PYTHON_3_9,
+            handler="batch_create_film_handler.handler",
+            code=_lambda.Code.from_asset("lambda"),
+            timeout=core.Duration.seconds(29),
+            memory_size=1024,
+            environment={
+                'METADATA_TABLE': metadata_table.table_name,
+                'MAX_BATCH_FILMS': '5000',
+                'BATCH_WRITE_WORKERS': '8',
+                'IDEMPOTENCY_TABLE': idempotency_table.table_name,
+                'IDEMPOTENCY_TTL_SECONDS': '86400'
+            }
+        )
+
+        # Catalog import, triggered by uploads under imports/ in the content bucket
+        import_films_function=_lambda.Function(
+            self, "ImportFilmsFunction",
+            function_name="FilmCatalogImport",
+            runtime=_lambda.Runtime.PYTHON_3_9,
+            handler="import_films_handler.handler",
+            code=_lambda.Code.from_asset("lambda"),
+            timeout=core.Duration.minutes(15),
+            memory_size=1024,
+            environment={
+                'METADATA_TABLE': metadata_table.table_name,
+                'IMPORT_BATCH_LINES': '1000',
+                'BATCH_WRITE_WORKERS': '8'
             }
         )
 
@@ -113,17 +254,213 @@ class FilmContentManagementStack(Stack):
             handler="update_film_handler.handler",
             code=_lambda.Code.from_asset("lambda"),
             environment={
+                'METADATA_TABLE': metadata_table.table_name,
+                'WRITE_QUEUE_URL': write_queue.queue_url,
+                'WRITE_MODE': 'sync'
+            }
+        )
+
+        # Multipart uploads of film content straight to S3
+        content_upload_function=_lambda.Function(
+            self, "ContentUploadFunction",
+            runtime=_lambda.Runtime.PYTHON_3_9,
+            handler="content_upload_handler.handler",
+            code=_lambda.Code.from_asset("lambda"),
+            timeout=core.Duration.seconds(15),
+            environment={
+                'CONTENT_BUCKET': content_bucket.bucket_name,
+                'METADATA_TABLE': metadata_table.table_name,
+                'UPLOAD_URL_TTL_SECONDS': '3600',
+                'CONTENT_BLOBS_TABLE': content_blobs_table.table_name
+            }
+        )
+
+        # Moves finished uploads to their content-addressed key
+        content_finalize_function=_lambda.Function(
+            self, "ContentFinalizeFunction",
+            runtime=_lambda.Runtime.PYTHON_3_9,
+            handler="content_finalize_handler.handler",
+            code=_lambda.Code.from_asset("lambda"),
+            timeout=core.Duration.minutes(15),
+            memory_size=1024,
+            environment={
+                'CONTENT_BUCKET': content_bucket.bucket_name,
+                'METADATA_TABLE': metadata_table.table_name,
+                'CONTENT_BLOBS_TABLE': content_blobs_table.table_name
+            }
+        )
+
+        # Reads container headers of new blobs with ranged GETs
+        media_extract_function=_lambda.Function(
+            self, "MediaExtractFunction",
+            runtime=_lambda.Runtime.PYTHON_3_9,
+            handler="media_extract_handler.handler",
+            code=_lambda.Code.from_asset("lambda"),
+            timeout=core.Duration.seconds(60),
+            environment={
+                'METADATA_TABLE': metadata_table.table_name,
+                'CONTENT_INDEX': 'content-index',
+                'CONTENT_BLOBS_TABLE': content_blobs_table.table_name
+            }
+        )
+
+        # Nightly removal of blobs no film has referred to for a day
+        content_gc_function=_lambda.Function(
+            self, "ContentGcFunction",
+            runtime=_lambda.Runtime.PYTHON_3_9,
+            handler="content_gc_handler.handler",
+            code=_lambda.Code.from_asset("lambda"),
+            timeout=core.Duration.minutes(15),
+            environment={
+                'CONTENT_BUCKET': content_bucket.bucket_name,
+                'CONTENT_BLOBS_TABLE': content_blobs_table.table_name,
+                'CONTENT_GC_GRACE_SECONDS': '86400'
+            }
+        )
+        events.Rule(
+            self, "ContentGcSchedule",
+            schedule=events.Schedule.cron(minute="30", hour="4"),
+            targets=[targets.LambdaFunction(content_gc_function)]
+        )
+
+        content_download_function=_lambda.Function(
+            self, "ContentDownloadFunction",
+            runtime=_lambda.Runtime.PYTHON_3_9,
+            handler="content_download_handler.handler",
+            code=_lambda.Code.from_asset("lambda"),
+            timeout=core.Duration.seconds(10),
+            environment={
+                'CONTENT_BUCKET': content_bucket.bucket_name,
+                'METADATA_TABLE': metadata_table.table_name,
+                'CONTENT_URL_TTL_SECONDS': '900',
+                'CONTENT_URL_CACHE_SECONDS': '300'
+            }
+        )
+
+        # Drains the write queue, coalescing writes per film
+        write_consumer_function=_lambda.Function(
+            self, "WriteConsumerFunction",
+            runtime=_lambda.Runtime.PYTHON_3_9,
+            handler="write_consumer_handler.handler",
+            code=_lambda.Code.from_asset("lambda"),
+            timeout=core.Duration.seconds(30),
+            environment={
+                'METADATA_TABLE': metadata_table.table_name
+            }
+        )
+        write_consumer_function.add_event_source(lambda_event_sources.SqsEventSource(
+            write_queue,
+            batch_size=10,
+            report_batch_item_failures=True
+        ))
+
+        # Keeps the search index in line with the films, off the request paths;
+        # invoked with {"rebuild": {}} it backfills the index from the table
+        search_index_function=_lambda.Function(
+            self, "SearchIndexFunction",
+            function_name="FilmSearchIndexer",
+            runtime=_lambda.Runtime.PYTHON_3_9,
+            handler="search_index_handler.handler",
+            code=_lambda.Code.from_asset("lambda"),
+            timeout=core.Duration.minutes(5),
+            environment={
+                'SEARCH_INDEX_TABLE': search_index_table.table_name,
                 'METADATA_TABLE': metadata_table.table_name
             }
         )
+        search_index_function.add_event_source(lambda_event_sources.DynamoEventSource(
+            metadata_table,
+            starting_position=_lambda.StartingPosition.TRIM_HORIZON,
+            batch_size=100,
+            max_batching_window=core.Duration.seconds(5),
+            bisect_batch_on_error=True,
+            retry_attempts=10
+        ))
 
         get_film_function=_lambda.Function(
             self, "GetFilmFunction",
             runtime=_lambda.Runtime.PYTHON_3_9,
             handler="get_film_handler.handler",
             code=_lambda.Code.from_asset("lambda"),
+            # API Gateway gives up after 29 s; batch reads may back off for
+            # up to ~11 s and parallel scans run several pages, neither fits 3 s
+            timeout=core.Duration.seconds(29),
             environment={
-                'METADATA_TABLE': metadata_table.table_name
+                'METADATA_TABLE': metadata_table.table_name,
+                'DIRECTOR_INDEX': 'director-title-index',
+                'YEAR_INDEX': 'year-title-index',
+                'VIEWS_TABLE': views_table.table_name,
+                'CHANGES_INDEX': 'changes-index',
+                'SCAN_MAX_SEGMENTS': '8',
+                'FILM_CACHE_TTL_SECONDS': '30',
+                'FILM_CACHE_NEGATIVE_TTL_SECONDS': '5',
+                'FILM_CACHE_MAX_ENTRIES': '2000',
+                'DYNAMODB_READ_PATH': 'client'
+            }
+        )
+
+        views_function=_lambda.Function(
+            self, "ViewsFunction",
+            runtime=_lambda.Runtime.PYTHON_3_9,
+            handler="views_handler.handler",
+            code=_lambda.Code.from_asset("lambda"),
+            timeout=core.Duration.seconds(60),
+            environment={
+                'VIEWS_TABLE': views_table.table_name,
+                'LATEST_FILMS_LIMIT': '50'
+            }
+        )
+        views_function.add_event_source(lambda_event_sources.DynamoEventSource(
+            metadata_table,
+            starting_position=_lambda.StartingPosition.TRIM_HORIZON,
+            batch_size=100,
+            max_batching_window=core.Duration.seconds(5),
+            bisect_batch_on_error=True,
+            retry_attempts=10
+        ))
+
+        # Catalog snapshot export: nightly, or invoked directly by an admin
+        export_films_function=_lambda.Function(
+            self, "ExportFilmsFunction",
+            runtime=_lambda.Runtime.PYTHON_3_9,
+            handler="export_films_handler.handler",
+            code=_lambda.Code.from_asset("lambda"),
+            timeout=core.Duration.minutes(15),
+            memory_size=1024,
+            environment={
+                'CONTENT_BUCKET': content_bucket.bucket_name,
+                'METADATA_TABLE': metadata_table.table_name,
+                'SCAN_SEGMENTS': '8',
+                'EXPORT_FORMATS': 'jsonl',
+                'DYNAMODB_READ_PATH': 'client'
+            }
+        )
+
+        events.Rule(
+            self, "NightlyExportRule",
+            schedule=events.Schedule.cron(minute="0", hour="3"),
+            targets=[targets.LambdaFunction(export_films_function)]
+        )
+
+        search_film_function=_lambda.Function(
+            self, "SearchFilmFunction",
+            runtime=_lambda.Runtime.PYTHON_3_9,
+            handler="search_film_handler.handler",
+            code=_lambda.Code.from_asset("lambda"),
+            timeout=core.Duration.seconds(10),
+            environment={
+                'SEARCH_INDEX_TABLE': search_index_table.table_name
+            }
+        )
+
+        get_export_function=_lambda.Function(
+            self, "GetExportFunction",
+            runtime=_lambda.Runtime.PYTHON_3_9,
+            handler="get_export_handler.handler",
+            code=_lambda.Code.from_asset("lambda"),
+            environment={
+                'CONTENT_BUCKET': content_bucket.bucket_name,
+                'EXPORT_URL_TTL_SECONDS': '900'
             }
         )
 
@@ -132,16 +469,96 @@ class FilmContentManagementStack(Stack):
 
         metadata_table.grant_full_access(create_film_function)
 
+        metadata_table.grant_write_data(batch_create_film_function)
+
+        metadata_table.grant_write_data(import_films_function)
+        content_bucket.grant_read(import_films_function, "imports/*")
+        content_bucket.grant_read_write(import_films_function, "import-checkpoints/*")
+        content_bucket.grant_put(import_films_function, "import-reports/*")
+        # Long files continue in a fresh invocation of the same function; the ARN
+        # is built from the fixed name to avoid a role <-> function dependency cycle
+        import_films_function.add_to_role_policy(iam.PolicyStatement(
+            actions=["lambda:InvokeFunction"],
+            resources=[self.format_arn(
+                service="lambda",
+                resource="function",
+                resource_name="FilmCatalogImport",
+                arn_format=core.ArnFormat.COLON_RESOURCE_NAME
+            )]
+        ))
+        content_bucket.add_event_notification(
+            s3.EventType.OBJECT_CREATED,
+            s3n.LambdaDestination(import_films_function),
+            s3.NotificationKeyFilter(prefix="imports/")
+        )
+
         metadata_table.grant_read_data(update_film_function)
         metadata_table.grant_write_data(update_film_function)
 
         metadata_table.grant_read_data(get_film_function)
+        views_table.grant_read_data(get_film_function)
+        views_table.grant_read_write_data(views_function)
+
+        metadata_table.grant_read_data(export_films_function)
+        content_bucket.grant_write(export_films_function, "exports/*")
+
+        content_bucket.grant_read(get_export_function, "exports/*")
+
+        content_bucket.grant_read_write(content_upload_function, "uploads/*")
+        content_bucket.grant_delete(content_upload_function, "content/*")
+        metadata_table.grant_read_write_data(content_upload_function)
+        content_bucket.grant_read_write(content_finalize_function, "uploads/*")
+        content_bucket.grant_read_write(content_finalize_function, "content/*")
+        metadata_table.grant_read_write_data(content_finalize_function)
+        content_bucket.add_event_notification(
+            s3.EventType.OBJECT_CREATED,
+            s3n.LambdaDestination(content_finalize_function),
+            s3.NotificationKeyFilter(prefix="uploads/")
+        )
+        content_bucket.grant_read(media_extract_function, "content/sha256/*")
+        metadata_table.grant_read_write_data(media_extract_function)
+        content_bucket.add_event_notification(
+            s3.EventType.OBJECT_CREATED,
+            s3n.LambdaDestination(media_extract_function),
+            s3.NotificationKeyFilter(prefix="content/sha256/")
+        )
+        content_bucket.grant_delete(content_gc_function, "content/sha256/*")
+        for function in (content_upload_function, content_finalize_function,
+                         content_gc_function, media_extract_function):
+            content_blobs_table.grant_read_write_data(function)
+        content_bucket.grant_read(content_download_function, "content/*")
+        metadata_table.grant_read_data(content_download_function)
+
+        for function in (create_film_function, update_film_function):
+            write_queue.grant_send_messages(function)
+        metadata_table.grant_read_write_data(write_consumer_function)
+
+        search_index_table.grant_read_write_data(search_index_function)
+        metadata_table.grant_read_data(search_index_function)
+        # A rebuild continues in a fresh invocation, as the catalog import does
+        search_index_function.add_to_role_policy(iam.PolicyStatement(
+            actions=["lambda:InvokeFunction"],
+            resources=[self.format_arn(
+                service="lambda",
+                resource="function",
+                resource_name="FilmSearchIndexer",
+                arn_format=core.ArnFormat.COLON_RESOURCE_NAME
+            )]
+        ))
+        search_index_table.grant_read_data(search_film_function)
+
+        for function in (create_film_function, batch_create_film_function):
+            idempotency_table.grant_read_write_data(function)
 
         # KREIRANJE API GATEWAY-A
         api = apigateway.RestApi(self, "FilmContentApi",
         rest_api_name="Film Content Service",
         description="This service serves film content.",
-            endpoint_types=[apigateway.EndpointType.REGIONAL])
+            endpoint_types=[apigateway.EndpointType.REGIONAL],
+            # API Gateway gzips whatever the handlers send uncompressed; binary
+            # media types let handler-compressed (base64) bodies through as bytes
+            minimum_compression_size=1024,
+            binary_media_types=["*/*"])
         
         #  default_cors_preflight_options={
         #         "allow_origins": apigateway.Cors.ALL_ORIGINS,
@@ -151,16 +568,55 @@ class FilmContentManagementStack(Stack):
 
         # DEFINISANJE API RESURSA
         create_integration = apigateway.LambdaIntegration(create_film_function)
+        batch_create_integration = apigateway.LambdaIntegration(batch_create_film_function)
         update_integration = apigateway.LambdaIntegration(update_film_function)
         get_film_integration = apigateway.LambdaIntegration(get_film_function)
+        get_export_integration = apigateway.LambdaIntegration(get_export_function)
+        search_integration = apigateway.LambdaIntegration(search_film_function)
+        content_upload_integration = apigateway.LambdaIntegration(content_upload_function)
+        content_download_integration = apigateway.LambdaIntegration(content_download_function)
 
 
         films = api.root.add_resource("films")
         films.add_method("POST", create_integration)  # POST /films
+        films.add_method("GET", get_film_integration)  # GET /films?limit=&next_token=[&director=|&year_from=&year_to=]|?ids=a,b,c [&fields=title,year]
+
+        # These names shadow /films/{film_id}; film_model.RESERVED_FILM_IDS keeps
+        # films from taking them
+        films_export = films.add_resource("export")
+        films_export.add_method("GET", get_export_integration)  # GET /films/export?format=jsonl|parquet
+
+        films_search = films.add_resource("search")
+        films_search.add_method("GET", search_integration)  # GET /films/search?q=
+
+        films_changes = films.add_resource("changes")
+        films_changes.add_method("GET", get_film_integration)  # GET /films/changes?since=
+
+        films_views = films.add_resource("views").add_resource("{view}")
+        films_views.add_method("GET", get_film_integration)  # GET /films/views/{latest|director|year|decade}?key=
+
+        films_content = films.add_resource("content")
+        films_content.add_method("GET", content_download_integration)  # GET /films/content?ids=a,b,c
+
+        films_batch = api.root.add_resource("films:batch")
+        films_batch.add_method("POST", batch_create_integration)  # POST /films:batch
+
+        films_batch_get = api.root.add_resource("films:batchGet")
+        films_batch_get.add_method("POST", get_film_integration)  # POST /films:batchGet {"ids": [...], "fields": [...]}
 
         metadata = films.add_resource("{film_id}")
         metadata.add_method("PATCH", update_integration)  # PATCH /films/{film_id}
-        metadata.add_method("GET", get_film_integration)  # GET /films/{film_id}
+        metadata.add_method("GET", get_film_integration)  # GET /films/{film_id}[?fields=title,year]
+        metadata.add_method("HEAD", get_film_integration)  # HEAD /films/{film_id}
+
+        content = metadata.add_resource("content")
+        content.add_method("GET", content_download_integration)  # GET /films/{film_id}/content[?redirect=1]
+        content_uploads = content.add_resource("uploads")
+        content_uploads.add_method("POST", content_upload_integration)  # POST /films/{film_id}/content/uploads
+        content_upload = content_uploads.add_resource("{upload_id}")
+        content_upload.add_method("DELETE", content_upload_integration)  # DELETE /films/{film_id}/content/uploads/{upload_id}
+        content_upload.add_resource("parts").add_method("GET", content_upload_integration)  # GET .../{upload_id}/parts?from=&to=
+        content_upload.add_resource("complete").add_method("POST", content_upload_integration)  # POST .../{upload_id}/complete
 
 
 
@@ -0,0 +1,102 @@
+import json
+import os
+from decimal import Decimal
+
+from batch_writer import put_new_items
+from film_model import build_item, validate_film
+from http_encoding import request_body
+from idempotency import idempotent
+from serialization import dumps
+
+table_name = os.environ['METADATA_TABLE']
+max_batch_films = int(os.environ.get('MAX_BATCH_FILMS', '5000'))
+max_workers = int(os.environ.get('BATCH_WRITE_WORKERS', '8'))
+
+
+def _validate_all(films):
+    """Validate every film in one pass; returns (items to write, per-index results)."""
+    results = []
+    items = []
+    seen = set()
+    for index, film in enumerate(films):
+        errors = validate_film(film)
+        film_id = film.get('film_id') if isinstance(film, dict) else None
+        # Only the first of two films with the same id could be created
+        if not errors and film_id in seen:
+            errors = ['Duplicate film_id in request']
+        if errors:
+            results.append({'index': index, 'film_id': film_id, 'status': 'invalid', 'error': errors[0]})
+            continue
+        seen.add(film_id)
+        items.append(build_item(film))
+        results.append({'index': index, 'film_id': film_id, 'status': 'created'})
+    return items, results
+
+
+def _create_batch(event):
+    try:
+        body = json.loads(request_body(event), parse_float=Decimal)
+    except (TypeError, ValueError):
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': 'Request body must be JSON'})
+        }
+
+    films = body.get('films') if isinstance(body, dict) else body
+    if not isinstance(films, list) or not films:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': 'Provide a non-empty "films" list'})
+        }
+    if len(films) > max_batch_films:
+        return {
+            'statusCode': 413,
+            'body': json.dumps({'error': f'At most {max_batch_films} films per request'})
+        }
+
+    items, results = _validate_all(films)
+
+    try:
+        # Existing films are reported, not overwritten (that would reset
+        # their version and drop their content)
+        existing, errors = put_new_items(table_name, items, 'film_id', max_workers=max_workers)
+    except Exception as e:
+        return {
+            'statusCode': 500,
+            'body': json.dumps({'error': str(e)})
+        }
+
+    existing_ids = {item['film_id'] for item in existing}
+    failures = {item['film_id']: str(e) for item, e in errors}
+    for result in results:
+        if result['status'] != 'created':
+            continue
+        if result['film_id'] in existing_ids:
+            result['status'] = 'exists'
+            result['error'] = 'Film already exists'
+        elif result['film_id'] in failures:
+            result['status'] = 'failed'
+            result['error'] = failures[result['film_id']]
+
+    summary = {
+        status: sum(1 for result in results if result['status'] == status)
+        for status in ('created', 'invalid', 'exists', 'failed')
+    }
+    return {
+        # 207 when only part of the batch was stored
+        'statusCode': 200 if summary['created'] == len(results) else 207,
+        # Echoed film_ids may be any JSON value the client sent, Decimals included
+        'body': dumps({'summary': summary, 'results': results})
+    }
+
+
+def handler(event, context):
+    # A retried batch with the same Idempotency-Key replays the first result
+    # instead of writing every film again
+    try:
+        return idempotent('batch-create', event, context, lambda: _create_batch(event))
+    except Exception as e:
+        return {
+            'statusCode': 500,
+            'body': json.dumps({'error': str(e)})
+        }
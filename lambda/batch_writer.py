@@ -0,0 +1,130 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
+
+# BatchWriteItem accepts at most 25 put/delete requests per call
+BATCH_SIZE = 25
+MAX_ATTEMPTS = 8
+BASE_DELAY_SECONDS = 0.05
+MAX_DELAY_SECONDS = 5.0
+# Raised by single-item writes when the table or partition is over capacity
+THROTTLING_CODES = ('ProvisionedThroughputExceededException', 'ThrottlingException')
+
+dynamodb = boto3.resource('dynamodb')
+
+
+def backoff_delay(attempt):
+    # Full jitter: a random delay up to the exponential cap, so retrying
+    # workers spread out instead of hitting the table in lockstep
+    return random.uniform(0, min(MAX_DELAY_SECONDS, BASE_DELAY_SECONDS * 2 ** attempt))
+
+
+def retry_throttled(call, *args, **kwargs):
+    """Call `call`, retrying throttling errors with backoff_delay up to MAX_ATTEMPTS times."""
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            return call(*args, **kwargs)
+        except ClientError as e:
+            if e.response['Error']['Code'] not in THROTTLING_CODES or attempt == MAX_ATTEMPTS - 1:
+                raise
+        time.sleep(backoff_delay(attempt))
+
+
+def chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _write_chunk(table_name, requests):
+    """Write one chunk, retrying UnprocessedItems; returns the requests that never succeeded."""
+    client = dynamodb.meta.client
+    pending = requests
+    for attempt in range(MAX_ATTEMPTS):
+        response = client.batch_write_item(RequestItems={table_name: pending})
+        pending = response.get('UnprocessedItems', {}).get(table_name, [])
+        if not pending:
+            return []
+        time.sleep(backoff_delay(attempt))
+    return pending
+
+
+def write_requests(table_name, requests, max_workers=8):
+    """Run put/delete write requests in 25-item chunks on parallel workers.
+
+    Returns (failed_requests, errors) where errors pairs each chunk that
+    raised with its exception.
+    """
+    failed = []
+    errors = []
+    batches = list(chunks(requests, BATCH_SIZE))
+    if not batches:
+        return failed, errors
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(batches))) as executor:
+        futures = [(batch, executor.submit(_write_chunk, table_name, batch)) for batch in batches]
+        for batch, future in futures:
+            try:
+                failed.extend(future.result())
+            except Exception as e:
+                errors.append((batch, e))
+    return failed, errors
+
+
+def _put_new(table, item, key):
+    try:
+        retry_throttled(table.put_item, Item=item, ConditionExpression=Attr(key).not_exists())
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return False
+        raise
+
+
+def put_new_items(table_name, items, key, max_workers=8):
+    """Put the `items` whose `key` is not in the table yet.
+
+    BatchWriteItem cannot carry conditions, so each item is a conditional
+    PutItem on parallel workers, throttled ones retried with backoff. Returns (existing_items, errors) where
+    errors pairs each item that raised with its exception.
+    """
+    existing = []
+    errors = []
+    if not items:
+        return existing, errors
+
+    table = dynamodb.Table(table_name)
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        futures = [(item, executor.submit(_put_new, table, item, key)) for item in items]
+        for item, future in futures:
+            try:
+                if not future.result():
+                    existing.append(item)
+            except Exception as e:
+                errors.append((item, e))
+    return existing, errors
+
+
+def update_items(table_name, updates, max_workers=8):
+    """Run UpdateItem calls (each a dict of update_item kwargs) on parallel workers.
+
+    Unlike a put, an update keeps the attributes it does not name. Throttled
+    updates are retried with backoff. Returns the errors, pairing each update
+    that raised with its exception.
+    """
+    errors = []
+    if not updates:
+        return errors
+
+    table = dynamodb.Table(table_name)
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(updates))) as executor:
+        futures = [(update, executor.submit(retry_throttled, table.update_item, **update)) for update in updates]
+        for update, future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                errors.append((update, e))
+    return errors
@@ -0,0 +1,186 @@
+"""Read films through the low-level DynamoDB client.
+
+The boto3 resource layer walks every attribute of every item through
+TypeDeserializer into Decimals and sets, which the handlers then walk again
+to build JSON. ClientTable takes the same arguments as a resource Table for
+reads (conditions, Key and ExclusiveStartKey as plain values) but turns the
+wire format ({"S": ..}, {"N": ..}) straight into JSON-ready values in one
+pass:
+
+- whole numbers become ints (Decimals beyond 64 bits); other numbers become floats when the float
+  prints back as the stored digits, and Decimals otherwise (never lossy)
+- string and number sets become sorted lists, binary values base64 text
+
+`read_table` picks the path from DYNAMODB_READ_PATH ('client' or 'resource'),
+so the resource layer stays available as a fallback.
+"""
+import base64
+import os
+from decimal import Decimal
+
+import boto3
+from boto3.dynamodb.conditions import ConditionBase, ConditionExpressionBuilder
+
+dynamodb = boto3.client('dynamodb')
+read_path = os.environ.get('DYNAMODB_READ_PATH', 'client')
+_resource = None
+
+
+def _number(raw):
+    # Integers are the common case (year, version, counters); ones beyond
+    # 64 bits stay Decimal, which every JSON encoder can write
+    try:
+        value = int(raw)
+    except ValueError:
+        pass
+    else:
+        return value if len(raw) < 19 or -2 ** 63 <= value < 2 ** 63 else Decimal(raw)
+    value = float(raw)
+    return value if repr(value) == raw else Decimal(raw)
+
+
+def decode_value(value):
+    """Turn one wire-format attribute value into a JSON-ready value."""
+    for tag, raw in value.items():
+        if tag == 'S':
+            return raw
+        if tag == 'N':
+            return _number(raw)
+        if tag == 'M':
+            return {key: decode_value(member) for key, member in raw.items()}
+        if tag == 'L':
+            return [decode_value(member) for member in raw]
+        if tag == 'BOOL':
+            return raw
+        if tag == 'NULL':
+            return None
+        if tag == 'SS':
+            return sorted(raw)
+        if tag == 'NS':
+            return sorted(_number(member) for member in raw)
+        if tag == 'B':
+            return base64.b64encode(raw).decode('ascii')
+        if tag == 'BS':
+            return sorted(base64.b64encode(member).decode('ascii') for member in raw)
+        raise TypeError(f'Unknown DynamoDB type {tag}')
+
+
+def decode_item(item):
+    return {key: decode_value(value) for key, value in item.items()}
+
+
+def encode_value(value):
+    """Wire format for a key or expression value (the inverse of decode_value)."""
+    if isinstance(value, str):
+        return {'S': value}
+    if isinstance(value, bool):
+        return {'BOOL': value}
+    if isinstance(value, (int, Decimal)):
+        return {'N': str(value)}
+    if isinstance(value, float):
+        return {'N': repr(value)}
+    if value is None:
+        return {'NULL': True}
+    if isinstance(value, (bytes, bytearray)):
+        return {'B': bytes(value)}
+    if isinstance(value, dict):
+        return {'M': encode_item(value)}
+    if isinstance(value, (list, tuple)):
+        return {'L': [encode_value(member) for member in value]}
+    if isinstance(value, (set, frozenset)):
+        if all(isinstance(member, str) for member in value):
+            return {'SS': sorted(value)}
+        return {'NS': [encode_value(member)['N'] for member in value]}
+    raise TypeError(f'Unsupported DynamoDB value of type {type(value).__name__}')
+
+
+def encode_item(item):
+    return {key: encode_value(value) for key, value in item.items()}
+
+
+def projection(fields):
+    """ProjectionExpression kwargs for `fields`; names are always placeholders."""
+    names = {f'#p{index}': field for index, field in enumerate(fields)}
+    return {
+        'ProjectionExpression': ', '.join(names),
+        'ExpressionAttributeNames': names
+    }
+
+
+class ClientTable:
+    """The read half of a resource Table, backed by the low-level client."""
+
+    def __init__(self, name, client=None):
+        self.name = name
+        self.client = client or dynamodb
+
+    def _request(self, kwargs):
+        request = dict(kwargs)
+        names = dict(request.pop('ExpressionAttributeNames', None) or {})
+        values = {placeholder: encode_value(value) for placeholder, value
+                  in (request.pop('ExpressionAttributeValues', None) or {}).items()}
+        builder = ConditionExpressionBuilder()
+        for name, is_key in (('KeyConditionExpression', True), ('FilterExpression', False)):
+            condition = request.get(name)
+            if isinstance(condition, ConditionBase):
+                built = builder.build_expression(condition, is_key_condition=is_key)
+                request[name] = built.condition_expression
+                names.update(built.attribute_name_placeholders)
+                values.update({placeholder: encode_value(value) for placeholder, value
+                               in built.attribute_value_placeholders.items()})
+        if names:
+            request['ExpressionAttributeNames'] = names
+        if values:
+            request['ExpressionAttributeValues'] = values
+        for name in ('Key', 'ExclusiveStartKey'):
+            if request.get(name):
+                request[name] = encode_item(request[name])
+        return request
+
+    def _page(self, response):
+        response['Items'] = [decode_item(item) for item in response.get('Items', [])]
+        if 'LastEvaluatedKey' in response:
+            response['LastEvaluatedKey'] = decode_item(response['LastEvaluatedKey'])
+        return response
+
+    def get_item(self, **kwargs):
+        response = self.client.get_item(TableName=self.name, **self._request(kwargs))
+        if 'Item' in response:
+            response['Item'] = decode_item(response['Item'])
+        return response
+
+    def query(self, **kwargs):
+        return self._page(self.client.query(TableName=self.name, **self._request(kwargs)))
+
+    def scan(self, **kwargs):
+        return self._page(self.client.scan(TableName=self.name, **self._request(kwargs)))
+
+    def batch_get(self, keys, **kwargs):
+        request = self._request(kwargs)
+        request['Keys'] = [encode_item(key) for key in keys]
+        response = self.client.batch_get_item(RequestItems={self.name: request})
+        items = [decode_item(item) for item in response.get('Responses', {}).get(self.name, [])]
+        unprocessed = response.get('UnprocessedKeys', {}).get(self.name, {}).get('Keys', [])
+        return items, [decode_item(key) for key in unprocessed]
+
+
+def batch_get(table, keys, **kwargs):
+    """One BatchGetItem call for up to 100 `keys`; returns (items, unprocessed keys).
+
+    Takes a ClientTable or a resource Table, whose client accepts plain values.
+    """
+    if isinstance(table, ClientTable):
+        return table.batch_get(keys, **kwargs)
+    response = table.meta.client.batch_get_item(RequestItems={table.name: dict(kwargs, Keys=keys)})
+    items = response.get('Responses', {}).get(table.name, [])
+    return items, response.get('UnprocessedKeys', {}).get(table.name, {}).get('Keys', [])
+
+
+def read_table(name):
+    """Table to read `name` through: a ClientTable, or a resource Table as fallback."""
+    global _resource
+    if read_path == 'resource':
+        if _resource is None:
+            _resource = boto3.resource('dynamodb')
+        return _resource.Table(name)
+    return ClientTable(name)
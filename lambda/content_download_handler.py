@@ -0,0 +1,145 @@
+import json
+import os
+import time
+
+import boto3
+
+import metrics
+from batch_writer import MAX_ATTEMPTS, backoff_delay
+from cache import TTLCache
+
+s3 = boto3.client('s3')
+dynamodb = boto3.resource('dynamodb')
+bucket_name = os.environ['CONTENT_BUCKET']
+table_name = os.environ['METADATA_TABLE']
+url_ttl_seconds = int(os.environ.get('CONTENT_URL_TTL_SECONDS', '900'))
+
+# A cached URL is handed out only while it still has most of its lifetime
+# left, so players get time to start (and seek within) the download
+url_cache = TTLCache(
+    ttl_seconds=min(float(os.environ.get('CONTENT_URL_CACHE_SECONDS', '300')), url_ttl_seconds / 2),
+    negative_ttl_seconds=float(os.environ.get('CONTENT_URL_NEGATIVE_CACHE_SECONDS', '10')),
+    max_entries=int(os.environ.get('CONTENT_URL_CACHE_MAX_ENTRIES', '5000'))
+)
+
+# BatchGetItem accepts at most 100 keys
+MAX_BATCH_IDS = 100
+CONTENT_PROJECTION = ('film_id, content_key, content_size, content_type, content_parts_sha256, '
+                      'content_part_size')
+
+
+def _response(status_code, body, headers=None):
+    return {
+        'statusCode': status_code,
+        'body': json.dumps(body),
+        'headers': dict({
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*',
+            'Cache-Control': 'no-store'
+        }, **(headers or {}))
+    }
+
+
+def _sign(item):
+    """Presigned GET for a film's content; S3 serves Range requests on it."""
+    if not item or not item.get('content_key'):
+        return None
+    return {
+        'url': s3.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': bucket_name, 'Key': item['content_key']},
+            ExpiresIn=url_ttl_seconds
+        ),
+        'expires_at': int(time.time()) + url_ttl_seconds,
+        'size': int(item['content_size']),
+        'content_type': item.get('content_type'),
+        'parts_sha256': item.get('content_parts_sha256'),
+        'part_size': int(item['content_part_size']) if 'content_part_size' in item else None
+    }
+
+
+def _public(film_id, signed):
+    if signed is None:
+        return {'film_id': film_id, 'error': 'No content for this film'}
+    return {
+        'film_id': film_id,
+        'url': signed['url'],
+        'expires_in': max(signed['expires_at'] - int(time.time()), 0),
+        'size': signed['size'],
+        'content_type': signed['content_type'],
+        'parts_sha256': signed['parts_sha256'],
+        'part_size': signed['part_size']
+    }
+
+
+def _read_content(table, film_ids):
+    """Fetch content attributes for up to MAX_BATCH_IDS films; returns {film_id: item}."""
+    items = {}
+    request = {table_name: {
+        'Keys': [{'film_id': film_id} for film_id in film_ids],
+        'ProjectionExpression': CONTENT_PROJECTION
+    }}
+    for attempt in range(MAX_ATTEMPTS):
+        response = dynamodb.batch_get_item(RequestItems=request)
+        for item in response.get('Responses', {}).get(table_name, []):
+            items[item['film_id']] = item
+        request = response.get('UnprocessedKeys')
+        if not request:
+            return items
+        time.sleep(backoff_delay(attempt))
+    raise RuntimeError(f'{len(request[table_name]["Keys"])} keys stayed unprocessed')
+
+
+def signed_urls(table, film_ids):
+    """Signed content URLs for `film_ids`, from the cache where possible."""
+    results = {}
+    misses = []
+    for film_id in film_ids:
+        found, signed = url_cache.get(film_id)
+        if found:
+            results[film_id] = signed
+        else:
+            misses.append(film_id)
+
+    if len(misses) == 1:
+        item = table.get_item(Key={'film_id': misses[0]}, ProjectionExpression=CONTENT_PROJECTION).get('Item')
+        fetched = {misses[0]: item} if item else {}
+    else:
+        fetched = _read_content(table, misses) if misses else {}
+    for film_id in misses:
+        signed = _sign(fetched.get(film_id))
+        url_cache.put(film_id, signed)
+        results[film_id] = signed
+
+    metrics.emit({'ContentUrlCacheHit': len(film_ids) - len(misses), 'ContentUrlCacheMiss': len(misses)},
+                 dimensions={'Cache': 'content_url'})
+    return results
+
+
+def handler(event, context):
+    table = dynamodb.Table(table_name)
+    params = event.get('queryStringParameters') or {}
+    film_id = (event.get('pathParameters') or {}).get('film_id')
+    try:
+        if film_id:
+            signed = signed_urls(table, [film_id])[film_id]
+            if signed is None:
+                return _response(404, {'error': 'No content for this film'})
+            # ?redirect=1 lets <video src> point at the API directly
+            if params.get('redirect') in ('1', 'true'):
+                return {
+                    'statusCode': 302,
+                    'body': '',
+                    'headers': {'Location': signed['url'], 'Cache-Control': 'no-store',
+                                'Access-Control-Allow-Origin': '*'}
+                }
+            return _response(200, _public(film_id, signed))
+
+        # Batch form: GET /films/content?ids=a,b,c
+        film_ids = list(dict.fromkeys(film_id for film_id in (params.get('ids') or '').split(',') if film_id))
+        if not film_ids or len(film_ids) > MAX_BATCH_IDS:
+            return _response(400, {'error': f'ids must list 1 to {MAX_BATCH_IDS} film ids'})
+        signed = signed_urls(table, film_ids)
+        return _response(200, {'items': [_public(film_id, signed[film_id]) for film_id in film_ids]})
+    except Exception as e:
+        return _response(500, {'error': str(e)})
@@ -0,0 +1,130 @@
+import math
+import os
+from urllib.parse import unquote_plus
+
+import boto3
+from botocore.exceptions import ClientError
+
+import content_store
+
+s3 = boto3.client('s3')
+dynamodb = boto3.resource('dynamodb')
+table_name = os.environ['METADATA_TABLE']
+
+# CopyObject handles up to 5 GB; larger blobs are copied part by part
+MAX_SINGLE_COPY = 5 * 1024 ** 3
+COPY_PART_SIZE = 512 * 1024 * 1024
+MAX_COPY_PARTS = 10000
+# GetObjectAttributes lists at most 1000 parts per call
+PARTS_PER_PAGE = 1000
+
+
+def _content_hash(bucket, key):
+    """Hash of the staged object from the part checksums S3 verified on upload.
+
+    Nothing is read back, so the cost does not grow with the file: a 5 TiB
+    upload takes at most ten calls.
+    """
+    checksums = []
+    kwargs = {'Bucket': bucket, 'Key': key, 'ObjectAttributes': ['ObjectParts'], 'MaxParts': PARTS_PER_PAGE}
+    while True:
+        parts = s3.get_object_attributes(**kwargs).get('ObjectParts') or {}
+        for part in parts.get('Parts', []):
+            if not part.get('ChecksumSHA256'):
+                raise ValueError(f'Part {part["PartNumber"]} of {key} has no SHA-256 checksum')
+            checksums.append(part['ChecksumSHA256'])
+        if not parts.get('IsTruncated'):
+            break
+        kwargs['PartNumberMarker'] = parts['NextPartNumberMarker']
+    if not checksums:
+        raise ValueError(f'{key} carries no part checksums')
+    return content_store.parts_sha256(checksums)
+
+
+def _exists(bucket, key):
+    try:
+        s3.head_object(Bucket=bucket, Key=key)
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+            return False
+        raise
+
+
+def _copy(bucket, source, target, size, content_type):
+    if size <= MAX_SINGLE_COPY:
+        s3.copy_object(Bucket=bucket, Key=target, CopySource={'Bucket': bucket, 'Key': source},
+                       ContentType=content_type, MetadataDirective='REPLACE')
+        return
+    upload_id = s3.create_multipart_upload(Bucket=bucket, Key=target, ContentType=content_type)['UploadId']
+    try:
+        parts = []
+        part_size = max(COPY_PART_SIZE, math.ceil(size / MAX_COPY_PARTS))
+        for number, start in enumerate(range(0, size, part_size), start=1):
+            end = min(start + part_size, size) - 1
+            response = s3.upload_part_copy(
+                Bucket=bucket, Key=target, UploadId=upload_id, PartNumber=number,
+                CopySource={'Bucket': bucket, 'Key': source}, CopySourceRange=f'bytes={start}-{end}'
+            )
+            parts.append({'PartNumber': number, 'ETag': response['CopyPartResult']['ETag']})
+        s3.complete_multipart_upload(Bucket=bucket, Key=target, UploadId=upload_id,
+                                     MultipartUpload={'Parts': parts})
+    except Exception:
+        s3.abort_multipart_upload(Bucket=bucket, Key=target, UploadId=upload_id)
+        raise
+
+
+def _finalize(table, bucket, key, size):
+    film_id = key[len(content_store.STAGING_PREFIX):key.rindex('/')]
+    item = table.get_item(Key={'film_id': film_id}, ProjectionExpression='content_upload',
+                          ConsistentRead=True).get('Item')
+    upload = (item or {}).get('content_upload')
+    if not upload or upload['key'] != key:
+        print(f'{key} is no longer a pending upload; discarding it')
+        s3.delete_object(Bucket=bucket, Key=key)
+        return
+
+    content_hash = _content_hash(bucket, key)
+    blob_key = content_store.blob_key(content_hash)
+    # The reference is taken before the blob is checked, so the collector
+    # cannot remove the object between the check and the film update
+    blob = content_store.retain(content_hash, size=size, content_type=upload['content_type'], create=True)
+    content = {
+        'content_key': blob_key,
+        'content_size': size,
+        'content_type': upload['content_type'],
+        'content_parts_sha256': content_hash,
+        'content_part_size': upload['part_size']
+    }
+    if blob.get('media'):
+        content['media'] = blob['media']
+    try:
+        if not _exists(bucket, blob_key):
+            _copy(bucket, key, blob_key, size, upload['content_type'])
+        previous = content_store.set_film_content(table, film_id, content, upload_key=key)
+    except ClientError as e:
+        content_store.release(blob_key)
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        print(f'{key} was superseded while it was being stored')
+    except Exception:
+        content_store.release(blob_key)
+        raise
+    else:
+        content_store.release_content(previous.get('content_key'))
+        # The extractor may have probed a new blob before this film pointed at it
+        if 'media' not in content:
+            media = content_store.blob_media(content_hash)
+            if media:
+                content_store.set_film_media(table, film_id, blob_key, media)
+    s3.delete_object(Bucket=bucket, Key=key)
+
+
+def handler(event, context):
+    # S3 ObjectCreated under uploads/: completed multipart uploads
+    table = dynamodb.Table(table_name)
+    for record in event['Records']:
+        bucket = record['s3']['bucket']['name']
+        key = unquote_plus(record['s3']['object']['key'])
+        _finalize(table, bucket, key, record['s3']['object']['size'])
+    return {'finalized': len(event['Records'])}
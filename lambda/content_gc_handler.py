@@ -0,0 +1,65 @@
+import os
+import time
+
+import boto3
+from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
+
+import content_store
+
+s3 = boto3.client('s3')
+dynamodb = boto3.resource('dynamodb')
+bucket_name = os.environ['CONTENT_BUCKET']
+# Unreferenced blobs are kept this long in case a film is pointed back at them
+grace_seconds = int(os.environ.get('CONTENT_GC_GRACE_SECONDS', '86400'))
+# A claim older than this belongs to a collector run that died
+CLAIM_TIMEOUT_SECONDS = 3600
+
+
+def _claim(table, content_hash, cutoff, now):
+    # retain() refuses blobs marked `deleting`, so no new reference can appear
+    # once the claim is in place
+    try:
+        table.update_item(
+            Key={'content_hash': content_hash},
+            UpdateExpression='SET deleting = :now',
+            ConditionExpression='refcount <= :zero AND released_at < :cutoff '
+                                'AND (attribute_not_exists(deleting) OR deleting < :stale)',
+            ExpressionAttributeValues={':now': now, ':zero': 0, ':cutoff': cutoff,
+                                       ':stale': now - CLAIM_TIMEOUT_SECONDS}
+        )
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        return False
+
+
+def handler(event, context):
+    # Scheduled: delete blobs nothing has referred to for the grace period
+    table = dynamodb.Table(content_store.blob_table_name)
+    now = int(time.time())
+    cutoff = now - grace_seconds
+    scan_kwargs = {
+        'FilterExpression': Attr('refcount').lte(0) & Attr('released_at').lt(cutoff),
+        'ProjectionExpression': 'content_hash'
+    }
+    deleted = 0
+    while True:
+        response = table.scan(**scan_kwargs)
+        for blob in response.get('Items', []):
+            content_hash = blob['content_hash']
+            if not _claim(table, content_hash, cutoff, now):
+                continue
+            s3.delete_object(Bucket=bucket_name, Key=content_store.blob_key(content_hash))
+            table.delete_item(
+                Key={'content_hash': content_hash},
+                ConditionExpression='deleting = :now',
+                ExpressionAttributeValues={':now': now}
+            )
+            deleted += 1
+        if 'LastEvaluatedKey' not in response:
+            break
+        scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    print(f'Deleted {deleted} unreferenced content blobs')
+    return {'deleted': deleted}
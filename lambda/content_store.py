@@ -0,0 +1,170 @@
+import base64
+import hashlib
+import os
+import time
+
+import boto3
+from botocore.exceptions import ClientError
+
+from film_model import change_attributes, now_iso
+from update_expression import UpdateBuilder
+
+s3 = boto3.client('s3')
+dynamodb = boto3.resource('dynamodb')
+bucket_name = os.environ.get('CONTENT_BUCKET')
+blob_table_name = os.environ.get('CONTENT_BLOBS_TABLE', 'FilmContentBlobs')
+
+# Content is stored once per distinct file, keyed by its parts' SHA-256 (parts_sha256)
+BLOB_PREFIX = 'content/sha256/'
+# How a client computes parts_sha256 before uploading; sent with every upload
+PARTS_SHA256_FORMAT = ('hex SHA-256 of the concatenated raw SHA-256 digests of the file cut into '
+                       'part_size-byte parts, in part order; not the SHA-256 of the file')
+# Finished multipart uploads wait here until they are hashed
+STAGING_PREFIX = 'uploads/'
+
+
+class BlobBusy(Exception):
+    """The blob is being garbage-collected; retry once it is gone."""
+
+
+def blob_key(content_hash):
+    return BLOB_PREFIX + content_hash
+
+
+def blob_hash(key):
+    if key and key.startswith(BLOB_PREFIX):
+        return key[len(BLOB_PREFIX):]
+    return None
+
+
+def is_sha256(value):
+    return isinstance(value, str) and len(value) == 64 and all(c in '0123456789abcdef' for c in value)
+
+
+def parts_sha256(part_checksums):
+    """Content hash from the base64 SHA-256 checksums of an upload's parts, in order.
+
+    It is the SHA-256 of the concatenated part digests (S3's composite
+    checksum), so content is addressed without reading it back. The same
+    bytes uploaded in parts of another size hash differently and are
+    stored again.
+    """
+    digest = hashlib.sha256()
+    for checksum in part_checksums:
+        digest.update(base64.b64decode(checksum))
+    return digest.hexdigest()
+
+
+def retain(content_hash, size=None, content_type=None, create=False):
+    """Add a reference to a blob; returns its record.
+
+    With create=False only an existing blob is referenced and None means
+    there is none. With create=True the record is created when missing and
+    BlobBusy is raised if the garbage collector has claimed it.
+    """
+    update = UpdateBuilder()
+    update.add('refcount', 1)
+    update.remove('released_at')
+    if create:
+        update.set_default('size', size)
+        update.set_default('content_type', content_type)
+        update.set_default('created_at', now_iso())
+    kwargs = update.kwargs()
+    condition = f'attribute_not_exists({update.name("deleting")})'
+    if not create:
+        condition = f'attribute_exists({update.name("content_hash")}) AND {condition}'
+    try:
+        return dynamodb.Table(blob_table_name).update_item(
+            Key={'content_hash': content_hash},
+            ConditionExpression=condition,
+            ReturnValues='ALL_NEW',
+            **kwargs
+        )['Attributes']
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+    if create:
+        raise BlobBusy(content_hash)
+    return None
+
+
+def release(key):
+    """Drop one reference to the blob at `key` (no-op for keys outside BLOB_PREFIX)."""
+    content_hash = blob_hash(key)
+    if content_hash is None:
+        return
+    # released_at starts the collector's grace period once nothing refers to the blob
+    dynamodb.Table(blob_table_name).update_item(
+        Key={'content_hash': content_hash},
+        UpdateExpression='ADD refcount :minus_one SET released_at = :now',
+        ExpressionAttributeValues={':minus_one': -1, ':now': int(time.time())}
+    )
+
+
+def blob_media(content_hash):
+    item = dynamodb.Table(blob_table_name).get_item(
+        Key={'content_hash': content_hash},
+        ProjectionExpression='media',
+        ConsistentRead=True
+    ).get('Item')
+    return (item or {}).get('media')
+
+
+def release_content(previous_key):
+    """Let go of content a film no longer points at."""
+    if not previous_key:
+        return
+    if blob_hash(previous_key):
+        release(previous_key)
+    else:
+        # Stored before content was deduplicated
+        s3.delete_object(Bucket=bucket_name, Key=previous_key)
+
+
+def set_film_content(table, film_id, content, upload_key=None):
+    """Point a film at new content (with its media metadata, if already probed).
+
+    With `upload_key` the write only applies while that staged upload is
+    still the film's pending one. Returns the film's previous attributes
+    (content_key, content_upload); raises ClientError if the film is gone
+    or the upload was superseded.
+    """
+    update = UpdateBuilder()
+    for attribute, value in dict(content, **change_attributes(film_id, now_iso())).items():
+        update.set(attribute, value)
+    update.add('version', 1)
+    update.remove('content_upload')
+    # Held the parts hash under a misleading name on films stored earlier
+    update.remove('content_checksum')
+    if 'media' not in content:
+        # Describes the previous content; the extractor fills it in again
+        update.remove('media')
+    kwargs = update.kwargs()
+    if upload_key is None:
+        kwargs['ConditionExpression'] = f'attribute_exists({update.name("film_id")})'
+    else:
+        kwargs['ConditionExpression'] = (
+            f'{update.name("content_upload")}.{update.name("key")} = {update.value(upload_key)}')
+    previous = table.update_item(Key={'film_id': film_id}, ReturnValues='UPDATED_OLD', **kwargs)
+    return previous.get('Attributes', {})
+
+
+def set_film_media(table, film_id, content_key, media):
+    """Record probed media metadata on a film that still points at `content_key`.
+
+    Returns False when the film has moved on to other content (or is gone).
+    """
+    update = UpdateBuilder()
+    update.set('media', media)
+    for attribute, value in change_attributes(film_id, now_iso()).items():
+        update.set(attribute, value)
+    update.add('version', 1)
+    kwargs = update.kwargs()
+    kwargs['ConditionExpression'] = f'{update.name("content_key")} = {update.value(content_key)}'
+    try:
+        table.update_item(Key={'film_id': film_id}, **kwargs)
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        return False
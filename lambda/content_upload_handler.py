@@ -0,0 +1,309 @@
+import json
+import math
+import os
+import uuid
+
+import boto3
+from botocore.exceptions import ClientError
+
+import content_store
+from film_model import now_iso
+from http_encoding import request_body
+from serialization import dumps
+
+s3 = boto3.client('s3')
+dynamodb = boto3.resource('dynamodb')
+bucket_name = os.environ['CONTENT_BUCKET']
+table_name = os.environ['METADATA_TABLE']
+url_ttl_seconds = int(os.environ.get('UPLOAD_URL_TTL_SECONDS', '3600'))
+
+MiB = 1024 * 1024
+# S3 multipart limits
+MIN_PART_SIZE = 5 * MiB
+MAX_PART_SIZE = 5 * 1024 * MiB
+MAX_PARTS = 10000
+MAX_OBJECT_SIZE = 5 * 1024 * 1024 * MiB
+DEFAULT_PART_SIZE = 64 * MiB
+# Presigned part URLs returned per response; larger uploads page through them
+PART_URLS_PER_RESPONSE = 500
+
+
+def _response(status_code, body):
+    return {
+        'statusCode': status_code,
+        'body': dumps(body),
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*',
+            'Cache-Control': 'no-store'
+        }
+    }
+
+
+def _staging_key(film_id):
+    # Moved to its content-addressed key once hashed (content_finalize_handler)
+    return f'{content_store.STAGING_PREFIX}{film_id}/{uuid.uuid4().hex}'
+
+
+def _part_size(size, requested=None):
+    """Part size in whole MiB, within S3's limits and at most MAX_PARTS parts."""
+    part_size = max(requested or DEFAULT_PART_SIZE, MIN_PART_SIZE, math.ceil(size / MAX_PARTS))
+    # MAX_OBJECT_SIZE / MAX_PARTS is well below MAX_PART_SIZE, so clamping
+    # a large request never needs more parts than allowed
+    return min(math.ceil(part_size / MiB) * MiB, MAX_PART_SIZE)
+
+
+def _part_urls(key, upload_id, first, last):
+    return [{
+        'part_number': part_number,
+        'url': s3.generate_presigned_url(
+            'upload_part',
+            Params={'Bucket': bucket_name, 'Key': key, 'UploadId': upload_id, 'PartNumber': part_number},
+            ExpiresIn=url_ttl_seconds
+        )
+    } for part_number in range(first, last + 1)]
+
+
+def _pending_upload(table, film_id, upload_id):
+    item = table.get_item(
+        Key={'film_id': film_id},
+        ProjectionExpression='film_id, content_upload',
+        ConsistentRead=True
+    ).get('Item')
+    if item is None:
+        return None, _response(404, {'error': 'Film not found'})
+    upload = item.get('content_upload')
+    if not upload or upload['upload_id'] != upload_id:
+        return None, _response(404, {'error': 'Upload not found'})
+    return upload, None
+
+
+def _abort_quietly(key, upload_id):
+    try:
+        s3.abort_multipart_upload(Bucket=bucket_name, Key=key, UploadId=upload_id)
+    except ClientError as e:
+        print(f'Could not abort upload {upload_id} of {key}: {e}')
+
+
+def _link_existing(table, film_id, content_hash, part_size, size, content_type):
+    blob = content_store.retain(content_hash)
+    if blob is None:
+        return None
+    if blob.get('size') != size:
+        content_store.release(content_store.blob_key(content_hash))
+        return _response(409, {'error': 'parts_sha256 matches stored content of a different size'})
+    content = {
+        'content_key': content_store.blob_key(content_hash),
+        'content_size': size,
+        'content_type': content_type or blob.get('content_type'),
+        'content_parts_sha256': content_hash,
+        'content_part_size': part_size
+    }
+    if blob.get('media'):
+        content['media'] = blob['media']
+    try:
+        previous = content_store.set_film_content(table, film_id, content)
+    except ClientError as e:
+        content_store.release(content['content_key'])
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return _response(404, {'error': 'Film not found'})
+        raise
+    if previous.get('content_upload'):
+        _abort_quietly(previous['content_upload']['key'], previous['content_upload']['upload_id'])
+    # Also drops the extra reference when the film already had this content
+    content_store.release_content(previous.get('content_key'))
+    return _response(200, dict(content, film_id=film_id, deduplicated=True))
+
+
+def _start(table, film_id, body):
+    size = body.get('size')
+    if not isinstance(size, int) or isinstance(size, bool) or not 0 < size <= MAX_OBJECT_SIZE:
+        return _response(400, {'error': 'size must be a positive number of bytes up to 5 TiB'})
+    requested = body.get('part_size')
+    if requested is not None and (not isinstance(requested, int) or isinstance(requested, bool) or requested <= 0):
+        return _response(400, {'error': 'part_size must be a positive number of bytes'})
+    content_type = body.get('content_type') or 'application/octet-stream'
+    if 'sha256' in body:
+        return _response(400, {'error': 'sha256 is not accepted; send parts_sha256 with its part_size',
+                               'parts_sha256_format': content_store.PARTS_SHA256_FORMAT})
+    content_hash = body.get('parts_sha256')
+    if content_hash is not None and not content_store.is_sha256(content_hash):
+        return _response(400, {'error': 'parts_sha256 must be 64 lowercase hex characters'})
+
+    # Content we already store needs no upload at all. Content is addressed
+    # by its parts' SHA-256 (content_store.parts_sha256), which depends on
+    # the part size, so the hash only means something with the part size it
+    # was computed for, and that must be a size the upload would use
+    part_size = _part_size(size, requested)
+    if content_hash:
+        if requested != part_size:
+            return _response(400, {'error': 'parts_sha256 needs the part_size it was computed with, a whole '
+                                            f'number of MiB from {_part_size(size, 1)} to {MAX_PART_SIZE} bytes',
+                                   'parts_sha256_format': content_store.PARTS_SHA256_FORMAT})
+        linked = _link_existing(table, film_id, content_hash, part_size, size, body.get('content_type'))
+        if linked:
+            return linked
+
+    part_count = math.ceil(size / part_size)
+    key = _staging_key(film_id)
+    # Every part carries its SHA-256 (x-amz-checksum-sha256), which S3
+    # verifies on upload; the finalizer derives the content hash from them
+    upload_id = s3.create_multipart_upload(Bucket=bucket_name, Key=key, ContentType=content_type,
+                                           ChecksumAlgorithm='SHA256')['UploadId']
+    upload = {
+        'upload_id': upload_id,
+        'key': key,
+        'size': size,
+        'part_size': part_size,
+        'part_count': part_count,
+        'content_type': content_type,
+        'started_at': now_iso()
+    }
+
+    # One pending upload per film; starting again replaces (and aborts) the old one
+    try:
+        previous = table.update_item(
+            Key={'film_id': film_id},
+            UpdateExpression='SET content_upload = :upload',
+            ConditionExpression='attribute_exists(film_id)',
+            ExpressionAttributeValues={':upload': upload},
+            ReturnValues='UPDATED_OLD'
+        ).get('Attributes', {}).get('content_upload')
+    except ClientError as e:
+        _abort_quietly(key, upload_id)
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return _response(404, {'error': 'Film not found'})
+        raise
+    if previous:
+        _abort_quietly(previous['key'], previous['upload_id'])
+
+    return _response(201, {
+        'upload_id': upload_id,
+        'part_size': part_size,
+        'part_count': part_count,
+        'checksum_algorithm': 'SHA256',
+        'parts_sha256_format': content_store.PARTS_SHA256_FORMAT,
+        'expires_in': url_ttl_seconds,
+        'parts': _part_urls(key, upload_id, 1, min(part_count, PART_URLS_PER_RESPONSE))
+    })
+
+
+def _parts(table, film_id, upload_id, params):
+    upload, error = _pending_upload(table, film_id, upload_id)
+    if error:
+        return error
+    part_count = int(upload['part_count'])
+    try:
+        first = int(params.get('from', 1))
+        last = min(int(params.get('to', first + PART_URLS_PER_RESPONSE - 1)), part_count)
+    except ValueError:
+        return _response(400, {'error': 'from and to must be part numbers'})
+    if not 1 <= first <= last or last - first >= PART_URLS_PER_RESPONSE:
+        return _response(400, {'error': f'Request 1 to {PART_URLS_PER_RESPONSE} parts between 1 and {part_count}'})
+    return _response(200, {
+        'upload_id': upload_id,
+        'part_count': part_count,
+        'expires_in': url_ttl_seconds,
+        'parts': _part_urls(upload['key'], upload_id, first, last)
+    })
+
+
+def _uploaded_parts(key, upload_id):
+    parts = []
+    kwargs = {'Bucket': bucket_name, 'Key': key, 'UploadId': upload_id}
+    while True:
+        response = s3.list_parts(**kwargs)
+        parts.extend(response.get('Parts', []))
+        if not response.get('IsTruncated'):
+            return parts
+        kwargs['PartNumberMarker'] = response['NextPartNumberMarker']
+
+
+def _complete(table, film_id, upload_id):
+    upload, error = _pending_upload(table, film_id, upload_id)
+    if error:
+        return error
+    key = upload['key']
+    if upload.get('status') == 'processing':
+        return _response(202, {'film_id': film_id, 'upload_id': upload_id, 'status': 'processing',
+                               'size': int(upload['size'])})
+
+    # The parts S3 actually holds decide completeness, not what the client claims
+    parts = _uploaded_parts(key, upload_id)
+    numbers = [part['PartNumber'] for part in parts]
+    if numbers != list(range(1, int(upload['part_count']) + 1)):
+        missing = sorted(set(range(1, int(upload['part_count']) + 1)) - set(numbers))
+        return _response(409, {'error': 'Upload is incomplete', 'missing_parts': missing[:100]})
+    size = sum(part['Size'] for part in parts)
+    if size != upload['size']:
+        return _response(409, {'error': f'Uploaded {size} bytes, expected {int(upload["size"])}'})
+
+    unchecked = [part['PartNumber'] for part in parts if not part.get('ChecksumSHA256')]
+    if unchecked:
+        return _response(409, {'error': 'Parts must be uploaded with an x-amz-checksum-sha256 header',
+                                'unchecked_parts': unchecked[:100]})
+
+    s3.complete_multipart_upload(
+        Bucket=bucket_name,
+        Key=key,
+        UploadId=upload_id,
+        MultipartUpload={'Parts': [
+            {'PartNumber': part['PartNumber'], 'ETag': part['ETag'], 'ChecksumSHA256': part['ChecksumSHA256']}
+            for part in parts
+        ]}
+    )
+    # Deduplication runs on the finished object in the background
+    try:
+        table.update_item(
+            Key={'film_id': film_id},
+            UpdateExpression='SET content_upload.#status = :processing',
+            ConditionExpression='content_upload.upload_id = :upload_id',
+            ExpressionAttributeNames={'#status': 'status'},
+            ExpressionAttributeValues={':processing': 'processing', ':upload_id': upload_id}
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+    return _response(202, {'film_id': film_id, 'upload_id': upload_id, 'status': 'processing', 'size': size})
+
+
+def _abort(table, film_id, upload_id):
+    upload, error = _pending_upload(table, film_id, upload_id)
+    if error:
+        return error
+    _abort_quietly(upload['key'], upload_id)
+    try:
+        table.update_item(
+            Key={'film_id': film_id},
+            UpdateExpression='REMOVE content_upload',
+            ConditionExpression='content_upload.upload_id = :upload_id',
+            ExpressionAttributeValues={':upload_id': upload_id}
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+    return {'statusCode': 204, 'body': '', 'headers': {'Access-Control-Allow-Origin': '*'}}
+
+
+def handler(event, context):
+    # Clients upload parts straight to S3 through presigned URLs; only the
+    # bookkeeping goes through the API
+    table = dynamodb.Table(table_name)
+    path = event.get('pathParameters') or {}
+    film_id = path.get('film_id')
+    upload_id = path.get('upload_id')
+    method = event.get('httpMethod')
+    try:
+        if upload_id is None:
+            try:
+                body = json.loads(request_body(event) or '{}')
+            except ValueError:
+                return _response(400, {'error': 'Request body must be JSON'})
+            return _start(table, film_id, body if isinstance(body, dict) else {})
+        if method == 'DELETE':
+            return _abort(table, film_id, upload_id)
+        if event.get('resource', '').endswith('/complete'):
+            return _complete(table, film_id, upload_id)
+        return _parts(table, film_id, upload_id, event.get('queryStringParameters') or {})
+    except Exception as e:
+        return _response(500, {'error': str(e)})
@@ -1,37 +1,56 @@
 import json
 import os
-from datetime import datetime
 import boto3
+from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
+
+from film_model import build_item, validate_film
+from http_encoding import request_body
+from idempotency import idempotent
+from write_queue import accepted, enqueue, wants_async
 
 s3 = boto3.client('s3')
 table_name=os.environ['METADATA_TABLE']
 dynamodb = boto3.resource('dynamodb')
 
-def handler(event, context):
+def _create(event):
+    """POST /films: store a new film.
+
+    An id that already exists is answered with 409 and the stored film is
+    left as it is. Earlier versions replaced the film (and restarted its
+    version at 1); callers that relied on that upsert change films with
+    PATCH /films/{film_id} instead.
+    """
     try:
         # Parse request body
-        body = json.loads(event['body'])
-        film_id = body.get('film_id')
-        title = body.get('title')
-        director = body.get('director')
-        year = body.get('year')
+        body = json.loads(request_body(event))
 
         # Validate required fields
-        if not (film_id and title and director and year):
+        errors = validate_film(body)
+        if errors:
             return {
                 'statusCode': 400,
-                'body': json.dumps({'error': 'Missing required fields'})
+                'body': json.dumps({'error': errors[0]})
             }
 
-        # Save film data to DynamoDB
-        
+        item = build_item(body)
+
+        # Async mode: the write consumer stores it in batches
+        if wants_async(event):
+            return accepted(enqueue('create', item['film_id'], item))
+
+        # Save film data to DynamoDB. An existing film is left alone: a put
+        # would restart its version at 1 and drop its content
         table = dynamodb.Table(table_name)
-        table.put_item(Item={
-            'film_id': film_id,
-            'title': title,
-            'director': director,
-            'year': year
-        })
+        try:
+            table.put_item(Item=item, ConditionExpression=Attr('film_id').not_exists())
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            return {
+                'statusCode': 409,
+                'body': json.dumps({'error': 'Film already exists; use PATCH /films/{film_id} to change it'})
+            }
 
         return {
             'statusCode': 200,
@@ -42,3 +61,14 @@ def handler(event, context):
             'statusCode': 500,
             'body': json.dumps({'error': str(e)})
         }
+
+
+def handler(event, context):
+    # Retried requests carrying the same Idempotency-Key replay the first response
+    try:
+        return idempotent('create', event, context, lambda: _create(event))
+    except Exception as e:
+        return {
+            'statusCode': 500,
+            'body': json.dumps({'error': str(e)})
+        }
@@ -0,0 +1,118 @@
+import gzip
+import json
+import os
+from datetime import datetime
+import boto3
+
+from client_table import read_table
+from parallel_scan import ReadBudget, parallel_scan
+from s3_multipart import MultipartWriter
+from serialization import dumps, dumps_bytes
+
+try:
+    import pyarrow
+    import pyarrow.parquet as parquet
+except ImportError:  # Parquet snapshots are optional; JSON Lines always works
+    pyarrow = None
+
+s3 = boto3.client('s3')
+table_name = os.environ['METADATA_TABLE']
+bucket_name = os.environ['CONTENT_BUCKET']
+
+EXPORT_PREFIX = 'exports/'
+LATEST_MANIFEST_KEY = EXPORT_PREFIX + 'latest.json'
+PARQUET_ROW_GROUP = 10000
+# Columns every film has; anything else goes into a JSON `attributes` column
+PARQUET_COLUMNS = ('film_id', 'title', 'director', 'year', 'updated_at')
+
+
+class ParquetSnapshot:
+    def __init__(self, output):
+        self._schema = pyarrow.schema([
+            ('film_id', pyarrow.string()),
+            ('title', pyarrow.string()),
+            ('director', pyarrow.string()),
+            ('year', pyarrow.int64()),
+            ('updated_at', pyarrow.string()),
+            ('attributes', pyarrow.string())
+        ])
+        self._writer = parquet.ParquetWriter(output, self._schema, compression='snappy')
+        self._rows = []
+
+    def add(self, item):
+        row = {column: item.get(column) for column in PARQUET_COLUMNS}
+        row['year'] = int(row['year']) if row['year'] is not None else None
+        extra = {key: value for key, value in item.items() if key not in PARQUET_COLUMNS}
+        row['attributes'] = dumps(extra) if extra else None
+        self._rows.append(row)
+        if len(self._rows) >= PARQUET_ROW_GROUP:
+            self._flush()
+
+    def _flush(self):
+        if self._rows:
+            self._writer.write_table(pyarrow.Table.from_pylist(self._rows, schema=self._schema))
+            self._rows = []
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+
+
+def _export(table, prefix, formats, segments, budget):
+    jsonl_key = prefix + 'films.jsonl.gz'
+    parquet_key = prefix + 'films.parquet' if 'parquet' in formats else None
+    count = 0
+
+    with MultipartWriter(bucket_name, jsonl_key, ContentType='application/gzip') as jsonl_output:
+        parquet_output = MultipartWriter(bucket_name, parquet_key) if parquet_key else None
+        try:
+            snapshot = ParquetSnapshot(parquet_output) if parquet_output else None
+            # One pass over the table feeds every requested format
+            with gzip.GzipFile(fileobj=jsonl_output, mode='wb') as compressed:
+                for item in parallel_scan(table, segments, budget=budget):
+                    compressed.write(dumps_bytes(item))
+                    compressed.write(b'\n')
+                    if snapshot:
+                        snapshot.add(item)
+                    count += 1
+            if snapshot:
+                snapshot.close()
+                parquet_output.complete()
+        except Exception:
+            if parquet_output:
+                parquet_output.abort()
+            raise
+
+    files = {'jsonl': jsonl_key}
+    if parquet_key:
+        files['parquet'] = parquet_key
+    return files, count
+
+
+def handler(event, context):
+    # Runs on a schedule, or is invoked directly by an admin, e.g.
+    # {"segments": 8, "read_capacity": 500, "formats": ["jsonl", "parquet"]}
+    event = event or {}
+    table = read_table(table_name)
+    segments = int(event.get('segments') or os.environ.get('SCAN_SEGMENTS', '8'))
+    read_capacity = float(event.get('read_capacity') or os.environ.get('SCAN_READ_CAPACITY', '0'))
+    budget = ReadBudget(read_capacity) if read_capacity > 0 else None
+    formats = event.get('formats') or os.environ.get('EXPORT_FORMATS', 'jsonl').split(',')
+    if 'parquet' in formats and pyarrow is None:
+        print('pyarrow is not available; skipping the Parquet snapshot')
+        formats = [f for f in formats if f != 'parquet']
+
+    created_at = datetime.utcnow()
+    prefix = EXPORT_PREFIX + created_at.strftime('%Y%m%dT%H%M%SZ') + '/'
+    files, count = _export(table, prefix, formats, segments, budget)
+
+    # Readers resolve the latest snapshot through this manifest, written only
+    # once every file of the snapshot is complete
+    manifest = {
+        'created_at': created_at.isoformat() + 'Z',
+        'count': count,
+        'files': files
+    }
+    s3.put_object(Bucket=bucket_name, Key=LATEST_MANIFEST_KEY,
+                  Body=json.dumps(manifest).encode('utf-8'), ContentType='application/json')
+    return dict(manifest, bucket=bucket_name)
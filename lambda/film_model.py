@@ -0,0 +1,131 @@
+import zlib
+from datetime import datetime, timezone
+from decimal import Decimal
+
+REQUIRED_FIELDS = ('film_id', 'title', 'director', 'year')
+# Key attributes of the table's secondary indexes; DynamoDB rejects writes
+# whose index key has the wrong type
+STRING_FIELDS = ('film_id', 'title', 'director')
+# Attributes a reader may pick with ?fields=: the descriptive metadata films
+# carry and the attributes the service maintains; change-feed and upload
+# bookkeeping stay internal
+READABLE_FIELDS = REQUIRED_FIELDS + (
+    'genres', 'cast', 'synopsis', 'runtime', 'rating', 'language', 'country',
+    'version', 'updated_at',
+    'content_key', 'content_size', 'content_type', 'content_parts_sha256', 'content_part_size', 'media'
+)
+# Collection routes under /films/ (export, search, ...) take precedence over
+# /films/{film_id}, so a film with one of these ids could not be read back
+RESERVED_FILM_IDS = frozenset(('export', 'search', 'changes', 'views', 'content'))
+# Change-feed keys: written with every change, never part of a response
+FEED_FIELDS = ('change_day', 'change_seq')
+# Partitions of the changes-index per day. Readers query every shard, so
+# changing this strands the changes already written under the old count
+CHANGE_SHARDS = 8
+
+
+def now_iso():
+    # Fixed width (always with microseconds) so timestamps sort as strings
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f+00:00')
+
+
+def change_attributes(film_id, updated_at):
+    """Attributes that place a write in the change feed (sparse changes-index GSI).
+
+    change_seq orders changes by time, with the film id as tie-breaker, and
+    change_day ("<day>#<shard>") spreads each day's writes over
+    CHANGE_SHARDS partitions by film id.
+    """
+    return {
+        'updated_at': updated_at,
+        'change_day': change_partition(updated_at[:10], change_shard(film_id)),
+        'change_seq': f'{updated_at}#{film_id}'
+    }
+
+
+def change_shard(film_id):
+    # crc32 rather than hash(): the shard must not change between processes
+    return zlib.crc32(film_id.encode('utf-8')) % CHANGE_SHARDS
+
+
+def change_partition(day, shard):
+    return f'{day}#{shard}'
+
+
+def public_item(item):
+    """`item` without the change-feed keys."""
+    if item is None or not any(field in item for field in FEED_FIELDS):
+        return item
+    return {key: value for key, value in item.items() if key not in FEED_FIELDS}
+
+
+def coerce_year(value):
+    """Return `value` as an int year, or None when it is not a whole number."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, Decimal) and value == value.to_integral_value():
+        return int(value)
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value)
+    return None
+
+
+def version_etag(version):
+    """ETag for the full representation of a film at `version`."""
+    return f'"v{version}"'
+
+
+def parse_version(value):
+    """Read a version from an If-Match ETag ("v3", W/"v3", "3") or a plain number.
+
+    Returns None when `value` does not carry a version.
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, Decimal)):
+        return coerce_year(value)
+    if not isinstance(value, str):
+        return None
+    tag = value.strip()
+    if tag.startswith('W/'):
+        tag = tag[2:]
+    tag = tag.strip('"')
+    if tag.startswith('v'):
+        tag = tag[1:]
+    return int(tag) if tag.isdigit() else None
+
+
+def validate_fields(film):
+    """Type-check whichever indexed fields are present in `film`."""
+    errors = [f'{field} must be a string' for field in STRING_FIELDS
+              if field in film and not isinstance(film[field], str)]
+    if 'year' in film and coerce_year(film['year']) is None:
+        errors.append('year must be an integer')
+    return errors
+
+
+def validate_film(film):
+    """Return a list of validation errors for a film payload (empty if valid)."""
+    if not isinstance(film, dict):
+        return ['Film must be a JSON object']
+    missing = [field for field in REQUIRED_FIELDS if not film.get(field)]
+    if missing:
+        return ['Missing required fields: ' + ', '.join(missing)]
+    errors = validate_fields(film)
+    if not errors and film['film_id'] in RESERVED_FILM_IDS:
+        errors.append(f'film_id {film["film_id"]} is reserved')
+    return errors
+
+
+def build_item(film):
+    item = {
+        'film_id': film['film_id'],
+        'title': film['title'],
+        'director': film['director'],
+        'year': coerce_year(film['year']),
+        'version': 1
+    }
+    item.update(change_attributes(film['film_id'], now_iso()))
+    return item
@@ -0,0 +1,69 @@
+from film_model import REQUIRED_FIELDS, change_attributes, coerce_year, now_iso, validate_fields
+from update_expression import OPERATORS, InvalidUpdate, UpdateBuilder
+
+# Maintained by the server only (content_* by the upload endpoints)
+SERVER_FIELDS = ('updated_at', 'change_day', 'change_seq', 'version',
+                 'content_key', 'content_size', 'content_type', 'content_parts_sha256', 'content_part_size',
+                 'content_checksum', 'content_upload')
+# Fields mirrored into the search index and the browse GSIs
+INDEXED_FIELDS = ('title', 'director', 'year')
+
+
+def _builder(operations):
+    update = UpdateBuilder(protected=('film_id',) + SERVER_FIELDS, set_only=REQUIRED_FIELDS)
+    update.apply(operations)
+    return update
+
+
+def parse_operations(body):
+    """Normalize a PATCH body into {operator: operands}; returns (operations, error).
+
+    `metadata` is the original form of `$set` and is merged into it.
+    """
+    metadata = dict(body.get('metadata') or {}, **(body.get('$set') or {}))
+    for key in SERVER_FIELDS:
+        metadata.pop(key, None)
+    operations = {operator: body[operator] for operator in OPERATORS
+                  if operator != '$set' and operator in body}
+    if metadata:
+        operations['$set'] = metadata
+    if not operations:
+        return None, 'No metadata provided for update'
+
+    errors = validate_fields(metadata)
+    if errors:
+        return None, errors[0]
+    if 'year' in metadata:
+        metadata['year'] = coerce_year(metadata['year'])
+    try:
+        _builder(operations)
+    except InvalidUpdate as e:
+        return None, str(e)
+    return operations, None
+
+
+def compile_update(film_id, operations, expected_version=None):
+    """Build the single update_item call for validated `operations`.
+
+    The write is stamped for the change feed, bumps the version and only
+    applies to an existing film (at `expected_version`, when given).
+    """
+    update = _builder(operations)
+
+    # updated_at becomes Last-Modified for readers and the change_* attributes
+    # put the film in the change feed
+    for key, value in change_attributes(film_id, now_iso()).items():
+        update.set(key, value, check=False)
+
+    # Every write bumps the version atomically (items written before versions
+    # existed start at 1)
+    update.add('version', 1, check=False)
+
+    kwargs = update.kwargs()
+    condition = 'attribute_exists(film_id)'
+    if expected_version:
+        condition += f' AND {update.name("version")} = {update.value(expected_version)}'
+    elif expected_version == 0:
+        condition += f' AND attribute_not_exists({update.name("version")})'
+    kwargs['ConditionExpression'] = condition
+    return update, kwargs
@@ -0,0 +1,52 @@
+import json
+import os
+import boto3
+from botocore.exceptions import ClientError
+
+s3 = boto3.client('s3')
+bucket_name = os.environ['CONTENT_BUCKET']
+url_ttl_seconds = int(os.environ.get('EXPORT_URL_TTL_SECONDS', '900'))
+
+LATEST_MANIFEST_KEY = 'exports/latest.json'
+
+
+def _response(status_code, body):
+    return {
+        'statusCode': status_code,
+        'body': json.dumps(body),
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*',
+            'Cache-Control': 'no-store'
+        }
+    }
+
+
+def handler(event, context):
+    params = event.get('queryStringParameters') or {}
+    file_format = params.get('format', 'jsonl')
+
+    try:
+        manifest = json.loads(s3.get_object(Bucket=bucket_name, Key=LATEST_MANIFEST_KEY)['Body'].read())
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+            return _response(404, {'error': 'No catalog export is available yet'})
+        return _response(500, {'error': str(e)})
+
+    key = manifest['files'].get(file_format)
+    if not key:
+        return _response(404, {'error': f'The latest export has no {file_format} snapshot'})
+
+    # Clients download straight from S3; the snapshot never passes through the API
+    url = s3.generate_presigned_url(
+        'get_object',
+        Params={'Bucket': bucket_name, 'Key': key},
+        ExpiresIn=url_ttl_seconds
+    )
+    return _response(200, {
+        'url': url,
+        'format': file_format,
+        'expires_in': url_ttl_seconds,
+        'created_at': manifest['created_at'],
+        'count': manifest['count']
+    })
@@ -1,42 +1,553 @@
+import hashlib
 import json
-import boto3
 import os
+import time
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+from datetime import datetime, timedelta, timezone
 from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import format_datetime
+
+import metrics
+from batch_writer import MAX_ATTEMPTS, backoff_delay, chunks
+from cache import TTLCache
+from client_table import batch_get, projection, read_table
+from film_model import (CHANGE_SHARDS, READABLE_FIELDS, change_partition, coerce_year, public_item,
+                        version_etag)
+from http_encoding import encode_response, header, request_body
+from pagination import InvalidPageRequest, decode_token, encode_token, parse_limit
+from parallel_scan import ReadBudget, initial_state, scan_parallel_page
+from serialization import dumps
 
-dynamodb = boto3.resource('dynamodb')
 table_name = os.environ['METADATA_TABLE']
+max_segments = int(os.environ.get('SCAN_MAX_SEGMENTS', '8'))
+read_capacity = float(os.environ.get('SCAN_READ_CAPACITY', '0'))
+item_cache_control = os.environ.get('ITEM_CACHE_CONTROL', 'public, max-age=60')
+list_cache_control = os.environ.get('LIST_CACHE_CONTROL', 'public, max-age=10')
+director_index = os.environ.get('DIRECTOR_INDEX', 'director-title-index')
+year_index = os.environ.get('YEAR_INDEX', 'year-title-index')
+views_table_name = os.environ.get('VIEWS_TABLE', 'FilmViews')
+changes_index = os.environ.get('CHANGES_INDEX', 'changes-index')
+# Writers' clocks may be slightly apart, so the feed only serves changes older
+# than this; a write landing "in the past" is still picked up on the next poll
+CHANGES_SETTLE_SECONDS = 5
+# A `since` cursor may be at most this old; an older one gets 410 and the
+# client starts over from a listing. One request reaches today from any
+# accepted cursor, so a page is never empty while more changes are pending
+CHANGES_RETENTION_DAYS = 30
+MAX_YEAR_SPAN = 200
+# BatchGetItem accepts at most 100 keys; larger batches are read concurrently
+BATCH_GET_SIZE = 100
+MAX_BATCH_IDS = 500
+# FILM_FIELDS replaces the ?fields= whitelist, e.g. for deployments with
+# their own metadata attributes
+readable_fields = frozenset(os.environ['FILM_FIELDS'].split(',') if os.environ.get('FILM_FIELDS')
+                            else READABLE_FIELDS)
 
-def handler(event, context):
-    table = dynamodb.Table(table_name)
+# Shared by every request served by this container
+read_budget = ReadBudget(read_capacity) if read_capacity > 0 else None
+film_cache = TTLCache(
+    ttl_seconds=float(os.environ.get('FILM_CACHE_TTL_SECONDS', '30')),
+    negative_ttl_seconds=float(os.environ.get('FILM_CACHE_NEGATIVE_TTL_SECONDS', '5')),
+    max_entries=int(os.environ.get('FILM_CACHE_MAX_ENTRIES', '2000')),
+    max_bytes=int(os.environ.get('FILM_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+)
 
-    # Get the film_id from query string parameters if available
-    film_id = event['queryStringParameters'].get('film_id') if event.get('queryStringParameters') else None
 
-    def decimal_default(obj):
-        if isinstance(obj, Decimal):
-            return float(obj)
-        raise TypeError
+def _etag(payload):
+    return '"%s"' % hashlib.sha256(payload.encode('utf-8')).hexdigest()
 
-    if film_id:
-        # Get specific film metadata
-        response = table.get_item(Key={'film_id': film_id})
-        item = response.get('Item', {})
-        return {
-            'statusCode': 200,
-            'body': json.dumps(item, default=decimal_default),
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            }
+
+def _etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(',')]
+    return '*' in candidates or etag in candidates or 'W/' + etag in candidates
+
+
+def _http_date(timestamp):
+    # updated_at is stored as an ISO-8601 UTC string by the write handlers
+    try:
+        moment = datetime.fromisoformat(timestamp)
+    except (TypeError, ValueError):
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return format_datetime(moment.astimezone(timezone.utc), usegmt=True)
+
+
+def _response(status_code, body, head=False):
+    return {
+        'statusCode': status_code,
+        'body': '' if head else dumps(body),
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*'
         }
+    }
+
+
+def _cacheable_response(event, body, cache_control, last_modified=None, head=False, etag=None):
+    # Keys are sorted so equal content always hashes to the same strong ETag
+    payload = dumps(body, sort_keys=True)
+    headers = {
+        'Content-Type': 'application/json',
+        'Access-Control-Allow-Origin': '*',
+        'ETag': etag or _etag(payload),
+        'Cache-Control': cache_control
+    }
+    last_modified = _http_date(last_modified) if last_modified else None
+    if last_modified:
+        headers['Last-Modified'] = last_modified
+
+    if _etag_matches(header(event, 'If-None-Match'), headers['ETag']):
+        return {'statusCode': 304, 'body': '', 'headers': headers}
+    return {
+        'statusCode': 200,
+        'body': '' if head else payload,
+        'headers': headers
+    }
+
+
+def _parse_fields(params):
+    """?fields=title,year as a sorted tuple, or None for whole items."""
+    raw = params.get('fields')
+    if raw in (None, ''):
+        return None
+    fields = {field.strip() for field in raw.split(',') if field.strip()}
+    unknown = sorted(fields - readable_fields)
+    if unknown:
+        raise InvalidPageRequest('Unknown fields: ' + ', '.join(unknown))
+    # The id always comes back so items stay addressable
+    return tuple(sorted(fields | {'film_id'}))
+
+
+def _read_kwargs(fields):
+    # Only the requested attributes leave DynamoDB; read units are still
+    # charged on the whole item
+    return projection(fields) if fields else {}
+
+
+def _cached_film(film_id, fields):
+    """Look a film up in the cache: (found, item, key to cache a fresh read under)."""
+    found, item = film_cache.get(film_id)
+    if found and item is not None and fields:
+        item = {field: item[field] for field in fields if field in item}
+    cache_key = film_id
+    if not found and fields:
+        # A whole item serves every fieldset; partial reads are cached apart
+        cache_key = film_id + '?fields=' + ','.join(fields)
+        found, item = film_cache.get(cache_key)
+    return found, item, cache_key
+
+
+def _remember_film(cache_key, item):
+    if film_cache.enabled:
+        size = len(dumps(item)) if item is not None else 0
+        film_cache.put(cache_key, item, size)
+
+
+def _read_film(table, film_id, fields=None, fresh=False):
+    # Read-through: misses are cached too, so a hot missing id does not keep
+    # costing a read unit either. A fresh read skips the cache and, being
+    # strongly consistent, refreshes it
+    if fresh:
+        found, item = False, None
+        cache_key = film_id + '?fields=' + ','.join(fields) if fields else film_id
+    else:
+        found, item, cache_key = _cached_film(film_id, fields)
+    if not found:
+        # Single-item read keyed on the partition key: one read unit, never a scan
+        response = table.get_item(Key={'film_id': film_id}, ConsistentRead=fresh, **_read_kwargs(fields))
+        item = response.get('Item')
+        _remember_film(cache_key, item)
+    metrics.emit({'FilmCacheHit': int(found), 'FilmCacheMiss': int(not found)},
+                 dimensions={'Cache': 'film'})
+    return item
+
+
+def _batch_get_chunk(table, film_ids, fields):
+    """Read up to BATCH_GET_SIZE films, retrying UnprocessedKeys with backoff."""
+    items = []
+    keys = [{'film_id': film_id} for film_id in film_ids]
+    for attempt in range(MAX_ATTEMPTS):
+        found, keys = batch_get(table, keys, **_read_kwargs(fields))
+        items.extend(found)
+        if not keys:
+            return items
+        time.sleep(backoff_delay(attempt))
+    raise RuntimeError(f'{len(keys)} keys stayed unprocessed')
+
+
+def _read_films(table, film_ids, fields=None):
+    """Films for `film_ids` as {film_id: item or None}, through the film cache."""
+    results = {}
+    misses = {}
+    for film_id in film_ids:
+        found, item, cache_key = _cached_film(film_id, fields)
+        if found:
+            results[film_id] = item
+        else:
+            misses[film_id] = cache_key
+
+    if misses:
+        batches = list(chunks(list(misses), BATCH_GET_SIZE))
+        with ThreadPoolExecutor(max_workers=len(batches)) as executor:
+            pages = list(executor.map(lambda batch: _batch_get_chunk(table, batch, fields), batches))
+        fetched = {item['film_id']: item for page in pages for item in page}
+        for film_id, cache_key in misses.items():
+            results[film_id] = fetched.get(film_id)
+            _remember_film(cache_key, results[film_id])
+
+    metrics.emit({'FilmCacheHit': len(film_ids) - len(misses), 'FilmCacheMiss': len(misses)},
+                 dimensions={'Cache': 'film'})
+    return results
+
+
+def _batch_get_films(event, table, film_ids, fields):
+    film_ids = list(dict.fromkeys(film_id for film_id in film_ids if film_id))
+    if not film_ids or len(film_ids) > MAX_BATCH_IDS:
+        return _response(400, {'error': f'ids must list 1 to {MAX_BATCH_IDS} film ids'})
+    films = _read_films(table, film_ids, fields)
+    # Request order; a missing film keeps its slot with an error
+    body = {'items': [
+        public_item(films[film_id]) if films[film_id] is not None else {'film_id': film_id, 'error': 'Film not found'}
+        for film_id in film_ids
+    ]}
+    if event.get('httpMethod') == 'GET':
+        return _cacheable_response(event, body, list_cache_control)
+    return _response(200, body)
+
+
+def _parse_batch_body(event):
+    """(film ids, fields) from a POST /films:batchGet body."""
+    try:
+        body = json.loads(request_body(event) or '{}')
+    except ValueError:
+        raise InvalidPageRequest('Body must be JSON')
+    ids = body.get('ids') if isinstance(body, dict) else None
+    if not isinstance(ids, list) or not all(isinstance(film_id, str) for film_id in ids):
+        raise InvalidPageRequest('ids must be a list of film ids')
+    fields = body.get('fields')
+    if isinstance(fields, list):
+        fields = ','.join(str(field) for field in fields)
+    return ids, _parse_fields({'fields': fields})
+
+
+def _wants_fresh(event):
+    """Whether a film read must bypass the container cache."""
+    cache_control = (header(event, 'Cache-Control') or '').lower()
+    return header(event, 'If-None-Match') is not None or 'no-cache' in cache_control
+
+
+def _get_film(event, table, film_id, fields=None, head=False):
+    """One film, with its version as ETag.
+
+    A plain GET may come from the container cache and so be up to
+    FILM_CACHE_TTL_SECONDS old, ETag included. Conditional requests and
+    requests with `Cache-Control: no-cache` (e.g. a read ahead of a PATCH
+    with If-Match) always read the current item.
+    """
+    item = public_item(_read_film(table, film_id, fields, fresh=_wants_fresh(event)))
+    if item is None:
+        return _response(404, {'error': 'Film not found'}, head=head)
+    # Versioned films use the version as ETag so it can be sent back in
+    # If-Match; a partial representation gets a content ETag instead
+    etag = version_etag(item['version']) if 'version' in item and not fields else None
+    return _cacheable_response(event, item, item_cache_control,
+                               last_modified=item.get('updated_at'), head=head, etag=etag)
+
+
+def _list_response(event, items, next_state):
+    items = [public_item(item) for item in items]
+    last_modified = max((item['updated_at'] for item in items if 'updated_at' in item), default=None)
+    return _cacheable_response(event, {
+        'items': items,
+        'next_token': encode_token(next_state)
+    }, list_cache_control, last_modified=last_modified)
+
+
+def _parse_segments(params):
+    raw = params.get('segments')
+    if raw in (None, ''):
+        return 1
+    try:
+        segments = int(raw)
+    except ValueError:
+        raise InvalidPageRequest('segments must be an integer')
+    if segments < 1 or segments > max_segments:
+        raise InvalidPageRequest(f'segments must be between 1 and {max_segments}')
+    return segments
+
+
+def _list_films_parallel(event, table, limit, state, fields):
+    total_segments = state['total_segments']
+    segments = state.get('segments')
+    valid = (
+        isinstance(segments, dict) and segments
+        and isinstance(total_segments, (int, Decimal)) and 1 <= total_segments <= max_segments
+        and all(s.isdigit() and int(s) < total_segments for s in segments)
+    )
+    if not valid:
+        raise InvalidPageRequest('next_token is invalid')
+    items, next_state = scan_parallel_page(table, limit, state, budget=read_budget,
+                                           **_read_kwargs(fields))
+    return _list_response(event, items, next_state)
+
+
+def _get_view(event, view, params):
+    # Precomputed by views_handler from the table's stream: one item per view
+    key = params.get('key')
+    if view == 'latest':
+        view_id = 'latest'
+    elif view in ('director', 'year', 'decade') and key:
+        view_id = f'{view}#{key}'
+    else:
+        return _response(400, {'error': 'view must be latest, or director/year/decade with ?key='})
+
+    item = read_table(views_table_name).get_item(Key={'view_id': view_id}).get('Item', {})
+    if view == 'latest':
+        body = {'films': item.get('films', [])}
+    elif view == 'director':
+        film_ids = sorted(item.get('film_ids', []))
+        body = {'director': key, 'film_ids': film_ids, 'count': len(film_ids)}
+    else:
+        body = {view: key, 'count': item.get('film_count', 0)}
+    return _cacheable_response(event, body, list_cache_control)
+
+
+def _settled_seq():
+    settled = datetime.now(timezone.utc) - timedelta(seconds=CHANGES_SETTLE_SECONDS)
+    return settled.strftime('%Y-%m-%dT%H:%M:%S.%f+00:00')
+
+
+def _shard_changes(table, partition, after, settled, limit):
+    """Up to `limit` changes of one changes-index partition, after `after`."""
+    # change_seq is "<updated_at>#<film_id>": strictly after the cursor and
+    # no later than the settled point (appending NUL makes the lower bound
+    # exclusive)
+    query_kwargs = {
+        'IndexName': changes_index,
+        'KeyConditionExpression': Key('change_day').eq(partition)
+                                  & Key('change_seq').between(after + '\0', settled)
+    }
+    items = []
+    while len(items) < limit:
+        query_kwargs['Limit'] = limit - len(items)
+        response = table.query(**query_kwargs)
+        items.extend(response.get('Items', []))
+        if 'LastEvaluatedKey' not in response:
+            break
+        query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    return items
+
+
+def _day_changes(table, day, after, settled, limit):
+    """The first `limit` changes of `day` after `after`, merged across its shards.
+
+    Each shard is read up to `limit` in parallel, so fewer than `limit`
+    changes means the day has no more.
+    """
+    partitions = [change_partition(day.isoformat(), shard) for shard in range(CHANGE_SHARDS)]
+    with ThreadPoolExecutor(max_workers=CHANGE_SHARDS) as executor:
+        pages = list(executor.map(lambda partition: _shard_changes(table, partition, after, settled, limit),
+                                  partitions))
+    return sorted((item for page in pages for item in page), key=lambda item: item['change_seq'])[:limit]
+
+
+def _get_changes(event, table, params):
+    """Films changed after the `since` cursor, oldest change first."""
+    limit = parse_limit(params)
+    settled = _settled_seq()
+    if not params.get('since'):
+        # No cursor yet: hand out one for "now"; earlier state comes from a listing
+        return _response(200, {'items': [], 'next_cursor': encode_token({'seq': settled}), 'has_more': False})
+
+    state = decode_token(params['since'])
+    since = state.get('seq')
+    if not isinstance(since, str) or len(since) < 10:
+        raise InvalidPageRequest('since is invalid')
+    try:
+        day = datetime.strptime(since[:10], '%Y-%m-%d').date()
+    except ValueError:
+        raise InvalidPageRequest('since is invalid')
+
+    if since >= settled:
+        return _response(200, {'items': [], 'next_cursor': params['since'], 'has_more': False})
+
+    last_day = datetime.strptime(settled[:10], '%Y-%m-%d').date()
+    if (last_day - day).days > CHANGES_RETENTION_DAYS:
+        return _response(410, {'error': f'since is more than {CHANGES_RETENTION_DAYS} days old; '
+                                        'start again from a listing'})
+
+    items = []
+    cursor = since
+    while True:
+        items.extend(_day_changes(table, day, cursor, settled, limit - len(items)))
+        if len(items) >= limit:
+            cursor = items[-1]['change_seq']
+            caught_up = False
+            break
+        if day >= last_day:
+            cursor = settled
+            caught_up = True
+            break
+        # Day boundary: sorts before every change of the next day
+        day += timedelta(days=1)
+        cursor = day.isoformat()
+
+    return _response(200, {
+        'items': [public_item(item) for item in items],
+        'next_cursor': encode_token({'seq': cursor}),
+        'has_more': not caught_up
+    })
+
+
+def _parse_year(params, name):
+    raw = params.get(name)
+    if raw in (None, ''):
+        return None
+    try:
+        return int(raw)
+    except ValueError:
+        raise InvalidPageRequest(f'{name} must be an integer')
+
+
+def _query_director(event, table, params, limit, start_key, fields):
+    # Titles are the index sort key, so a director's films come back A-Z
+    query_kwargs = {
+        'IndexName': director_index,
+        'KeyConditionExpression': Key('director').eq(params['director']),
+        'Limit': limit,
+        **_read_kwargs(fields)
+    }
+    if start_key:
+        query_kwargs['ExclusiveStartKey'] = start_key
+    response = table.query(**query_kwargs)
+    return _list_response(event, response.get('Items', []), response.get('LastEvaluatedKey'))
+
+
+def _query_years(event, table, params, limit, state, fields):
+    # year is the partition key of its index, so a range is one Query per
+    # year, walked in order; the cursor remembers the year and its position
+    year = _parse_year(params, 'year')
+    if year is not None:
+        year_from = year_to = year
     else:
-        # Scan and get all film metadata
-        response = table.scan()
-        return {
-            'statusCode': 200,
-            'body': json.dumps(response['Items'], default=decimal_default),
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            }
+        year_from = _parse_year(params, 'year_from')
+        year_to = _parse_year(params, 'year_to')
+        if year_from is None or year_to is None:
+            raise InvalidPageRequest('year_from and year_to must be given together')
+    if year_to < year_from or year_to - year_from > MAX_YEAR_SPAN:
+        raise InvalidPageRequest(f'year range must be ordered and span at most {MAX_YEAR_SPAN} years')
+
+    year = year_from
+    start_key = None
+    if state:
+        # The token may come from another listing, or be made up
+        year = coerce_year(state.get('year'))
+        start_key = state.get('key')
+        if year is None or not (start_key is None or isinstance(start_key, dict)):
+            raise InvalidPageRequest('next_token is invalid')
+    if not year_from <= year <= year_to:
+        raise InvalidPageRequest('next_token is invalid')
+
+    items = []
+    while year <= year_to and len(items) < limit:
+        query_kwargs = {
+            'IndexName': year_index,
+            'KeyConditionExpression': Key('year').eq(year),
+            'Limit': limit - len(items),
+            **_read_kwargs(fields)
         }
+        if start_key:
+            query_kwargs['ExclusiveStartKey'] = start_key
+        response = table.query(**query_kwargs)
+        items.extend(response.get('Items', []))
+        start_key = response.get('LastEvaluatedKey')
+        if not start_key:
+            year += 1
+
+    next_state = {'year': year, 'key': start_key} if year <= year_to else None
+    return _list_response(event, items, next_state)
+
+
+def _list_films(event, table, params):
+    limit = parse_limit(params)
+    start_key = decode_token(params.get('next_token'))
+    fields = _parse_fields(params)
+
+    # Indexed lookups: ?director=  and  ?year= / ?year_from=&year_to=
+    if params.get('director'):
+        return _query_director(event, table, params, limit, start_key, fields)
+    if any(params.get(name) for name in ('year', 'year_from', 'year_to')):
+        return _query_years(event, table, params, limit, start_key, fields)
+
+    # ?segments=N reads each page from N scan segments in parallel; the cursor
+    # then carries one position per segment
+    if start_key and 'total_segments' in start_key:
+        return _list_films_parallel(event, table, limit, start_key, fields)
+    segments = _parse_segments(params)
+    if segments > 1 and not start_key:
+        return _list_films_parallel(event, table, limit, initial_state(segments), fields)
+
+    scan_kwargs = {'Limit': limit, **_read_kwargs(fields)}
+    if start_key:
+        scan_kwargs['ExclusiveStartKey'] = start_key
+
+    # A single bounded page per request; the client follows next_token until
+    # it comes back empty.
+    response = table.scan(**scan_kwargs)
+    return _list_response(event, response.get('Items', []), response.get('LastEvaluatedKey'))
+
+
+def _route(event):
+    # Items arrive as JSON-ready values rather than Decimals and sets
+    table = read_table(table_name)
+
+    path_params = event.get('pathParameters') or {}
+    params = event.get('queryStringParameters') or {}
+
+    if event.get('resource') == '/films/views/{view}':
+        return _get_view(event, path_params.get('view'), params)
+    if event.get('resource') == '/films:batchGet':
+        try:
+            film_ids, fields = _parse_batch_body(event)
+        except InvalidPageRequest as e:
+            return _response(400, {'error': str(e)})
+        return _batch_get_films(event, table, film_ids, fields)
+    if event.get('resource') == '/films/changes':
+        try:
+            return _get_changes(event, table, params)
+        except InvalidPageRequest as e:
+            return _response(400, {'error': str(e)})
+
+    # GET /films/{film_id} carries the id in the path; GET /films?film_id=
+    # is still accepted
+    film_id = path_params.get('film_id') or params.get('film_id')
+
+    if film_id:
+        try:
+            fields = _parse_fields(params)
+        except InvalidPageRequest as e:
+            return _response(400, {'error': str(e)})
+        return _get_film(event, table, film_id, fields, head=event.get('httpMethod') == 'HEAD')
+
+    # List film metadata one page at a time, or GET /films?ids=a,b,c
+    try:
+        if params.get('ids'):
+            return _batch_get_films(event, table, params['ids'].split(','), _parse_fields(params))
+        return _list_films(event, table, params)
+    except InvalidPageRequest as e:
+        return _response(400, {'error': str(e)})
+    except ClientError as e:
+        # A cursor from a different listing mode is rejected by DynamoDB
+        if e.response['Error']['Code'] == 'ValidationException' and params.get('next_token'):
+            return _response(400, {'error': 'next_token is invalid'})
+        raise
+
+
+def handler(event, context):
+    # Large listings shrink several times over with gzip or brotli
+    return encode_response(event, _route(event))
@@ -0,0 +1,105 @@
+"""Content-Encoding for Lambda proxy responses, and base64 request bodies.
+
+API Gateway returns a compressed body only when it is base64-encoded and the
+API lists binary media types; with those listed, request bodies reach the
+handlers base64-encoded as well, so every handler reads them through
+`request_body`.
+"""
+import base64
+import gzip
+import os
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+# Bodies smaller than this are sent as they are: the saving would not pay
+# for the base64 overhead and the CPU time
+minimum_size = int(os.environ.get('COMPRESSION_MIN_BYTES', '1024'))
+GZIP_LEVEL = 6
+# Brotli's default quality 11 is too slow to run on every response
+BROTLI_QUALITY = 5
+
+
+def request_body(event):
+    """The request body as text, decoding a base64 body from API Gateway."""
+    body = event.get('body')
+    if body and event.get('isBase64Encoded'):
+        return base64.b64decode(body).decode('utf-8')
+    return body
+
+
+def header(event, name):
+    """A request header's value, whatever casing the client sent it with."""
+    name = name.lower()
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+def _accepted(accept_encoding):
+    """{coding: q} from an Accept-Encoding header."""
+    codings = {}
+    for part in (accept_encoding or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        codings[coding] = q
+    return codings
+
+
+def negotiate(accept_encoding):
+    """Pick 'br', 'gzip' or None (identity) for an Accept-Encoding header."""
+    codings = _accepted(accept_encoding)
+    available = ['br', 'gzip'] if brotli is not None else ['gzip']
+    best, best_q = None, 0.0
+    for coding in available:
+        q = codings.get(coding, codings.get('*', 0.0))
+        # Ties go to the earlier (smaller) coding
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def _compress(body, coding):
+    if coding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+def encode_response(event, response):
+    """Compress a proxy response's body for the client when it is large enough.
+
+    The response gets `Vary: Accept-Encoding` either way. A compressed body
+    is base64-encoded with its strong ETag made weak, since the bytes differ
+    from the uncompressed representation.
+    """
+    headers = dict(response.get('headers') or {})
+    headers['Vary'] = 'Accept-Encoding'
+    response = dict(response, headers=headers)
+
+    body = response.get('body')
+    if not body or response.get('isBase64Encoded') or 'Content-Encoding' in headers:
+        return response
+    raw = body.encode('utf-8')
+    coding = negotiate(header(event, 'Accept-Encoding')) if len(raw) >= minimum_size else None
+    if coding is None:
+        return response
+
+    headers['Content-Encoding'] = coding
+    etag = headers.get('ETag')
+    if etag and not etag.startswith('W/'):
+        headers['ETag'] = 'W/' + etag
+    response['body'] = base64.b64encode(_compress(raw, coding)).decode('ascii')
+    response['isBase64Encoded'] = True
+    return response
@@ -0,0 +1,154 @@
+import gzip
+import hashlib
+import json
+import os
+import time
+import uuid
+
+import boto3
+from botocore.exceptions import ClientError
+
+from http_encoding import header, request_body
+
+dynamodb = boto3.resource('dynamodb')
+idempotency_table_name = os.environ.get('IDEMPOTENCY_TABLE', 'FilmIdempotency')
+# How long a stored response is replayed for duplicates of the same key
+ttl_seconds = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', '86400'))
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+# Stored responses larger than this are not kept (items are capped at 400 KB)
+MAX_STORED_RESPONSE_BYTES = 350 * 1024
+# Lock lifetime when the Lambda context does not say how long we have left
+DEFAULT_LOCK_SECONDS = 60
+
+IN_PROGRESS = 'IN_PROGRESS'
+COMPLETED = 'COMPLETED'
+
+
+def _error(status_code, message, headers=None):
+    return {
+        'statusCode': status_code,
+        'body': json.dumps({'error': message}),
+        'headers': headers or {}
+    }
+
+
+def _lock_seconds(context):
+    # A crashed or timed-out invocation must not hold the key past its own deadline
+    remaining = getattr(context, 'get_remaining_time_in_millis', None)
+    if remaining is None:
+        return DEFAULT_LOCK_SECONDS
+    return remaining() // 1000 + 5
+
+
+def _encode_response(response):
+    return gzip.compress(json.dumps(response).encode('utf-8'))
+
+
+def _decode_response(stored):
+    response = json.loads(gzip.decompress(bytes(stored)).decode('utf-8'))
+    response.setdefault('headers', {})['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _acquire(table, record_key, request_hash, context):
+    """Write the lock record; returns its lock id, or the existing record if taken."""
+    now = int(time.time())
+    lock_id = uuid.uuid4().hex
+    try:
+        table.put_item(
+            Item={
+                'idempotency_key': record_key,
+                'status': IN_PROGRESS,
+                'request_hash': request_hash,
+                'lock_id': lock_id,
+                'lock_expires_at': now + _lock_seconds(context),
+                'expires_at': now + ttl_seconds
+            },
+            # TTL deletes lag behind expiry, so expired records count as absent;
+            # so do locks left behind by an invocation that died
+            ConditionExpression='attribute_not_exists(idempotency_key) OR expires_at < :now '
+                                'OR (#status = :in_progress AND lock_expires_at < :now)',
+            ExpressionAttributeNames={'#status': 'status'},
+            ExpressionAttributeValues={':now': now, ':in_progress': IN_PROGRESS}
+        )
+        return lock_id, None
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+    existing = table.get_item(Key={'idempotency_key': record_key}, ConsistentRead=True).get('Item')
+    return None, existing
+
+
+def _release(table, record_key, lock_id):
+    try:
+        table.delete_item(
+            Key={'idempotency_key': record_key},
+            ConditionExpression='lock_id = :lock_id',
+            ExpressionAttributeValues={':lock_id': lock_id}
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+
+
+def _complete(table, record_key, lock_id, response):
+    stored = _encode_response(response)
+    if len(stored) > MAX_STORED_RESPONSE_BYTES:
+        print(f'Response for idempotency key {record_key} is too large to store')
+        _release(table, record_key, lock_id)
+        return
+    try:
+        table.update_item(
+            Key={'idempotency_key': record_key},
+            UpdateExpression='SET #status = :completed, #response = :response REMOVE lock_expires_at',
+            ConditionExpression='lock_id = :lock_id',
+            ExpressionAttributeNames={'#status': 'status', '#response': 'response'},
+            ExpressionAttributeValues={':completed': COMPLETED, ':response': stored, ':lock_id': lock_id}
+        )
+    except ClientError as e:
+        # Our lock expired and another request took the key over
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+
+
+def idempotent(scope, event, context, operation):
+    """Run `operation()` at most once per Idempotency-Key header within the TTL.
+
+    The first response is stored and replayed for duplicates; a duplicate that
+    arrives while the first request is still running gets 409. Responses with
+    a 5xx status are not stored, so the client can retry them. Requests without
+    the header run as before.
+    """
+    key = header(event, HEADER)
+    if key is None:
+        return operation()
+    if not key or len(key) > MAX_KEY_LENGTH:
+        return _error(400, f'{HEADER} must be 1 to {MAX_KEY_LENGTH} characters')
+
+    table = dynamodb.Table(idempotency_table_name)
+    record_key = f'{scope}#{key}'
+    request_hash = hashlib.sha256((request_body(event) or '').encode('utf-8')).hexdigest()
+
+    lock_id, existing = _acquire(table, record_key, request_hash, context)
+    if lock_id is None:
+        if existing is None:
+            # Expired and deleted between our write and read
+            return _error(409, 'Request with this idempotency key is in progress', {'Retry-After': '1'})
+        if existing.get('request_hash') != request_hash:
+            return _error(422, f'{HEADER} was already used with a different request body')
+        if existing.get('status') == COMPLETED:
+            return _decode_response(existing['response'])
+        return _error(409, 'Request with this idempotency key is in progress', {'Retry-After': '1'})
+
+    try:
+        response = operation()
+    except Exception:
+        _release(table, record_key, lock_id)
+        raise
+    if response.get('statusCode', 500) >= 500:
+        _release(table, record_key, lock_id)
+    else:
+        _complete(table, record_key, lock_id, response)
+    return response
@@ -0,0 +1,233 @@
+import csv
+import json
+import os
+from decimal import Decimal
+from urllib.parse import unquote_plus
+import boto3
+from botocore.exceptions import ClientError
+
+from batch_writer import update_items
+from film_model import build_item, now_iso, validate_film
+from update_expression import UpdateBuilder
+
+s3 = boto3.client('s3')
+lambda_client = boto3.client('lambda')
+table_name = os.environ['METADATA_TABLE']
+batch_lines = int(os.environ.get('IMPORT_BATCH_LINES', '1000'))
+max_workers = int(os.environ.get('BATCH_WRITE_WORKERS', '8'))
+
+READ_CHUNK_BYTES = 1024 * 1024
+# Stop and hand over to a fresh invocation when less than this is left
+SAFETY_MARGIN_MS = 60 * 1000
+MAX_REPORTED_ERRORS = 100
+
+CHECKPOINT_PREFIX = 'import-checkpoints/'
+REPORT_PREFIX = 'import-reports/'
+
+
+def _iter_lines(bucket, key, offset):
+    """Yield (line, end_offset) from `offset` onwards, reading the object as a stream.
+
+    end_offset is the byte position just past the line's newline, i.e. where a
+    resumed import has to start reading.
+    """
+    try:
+        response = s3.get_object(Bucket=bucket, Key=key, Range=f'bytes={offset}-')
+    except ClientError as e:
+        # S3 answers 416 for a range starting at the end of the object: an
+        # empty file, or a resumed import with nothing left to read
+        if e.response['Error']['Code'] == 'InvalidRange':
+            return
+        raise
+    pending = b''
+    position = offset
+    for chunk in response['Body'].iter_chunks(chunk_size=READ_CHUNK_BYTES):
+        pending += chunk
+        lines = pending.split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            position += len(line) + 1
+            yield line.rstrip(b'\r'), position
+    if pending:
+        position += len(pending)
+        yield pending.rstrip(b'\r'), position
+
+
+def _parse_line(line, file_format, header):
+    text = line.decode('utf-8')
+    if file_format == 'csv':
+        # Records are expected one per line; quoted fields must not span lines
+        values = next(csv.reader([text]))
+        return dict(zip(header, values))
+    return json.loads(text, parse_float=Decimal)
+
+
+def _file_format(key):
+    return 'csv' if key.lower().endswith('.csv') else 'jsonl'
+
+
+def _checkpoint_key(key):
+    return CHECKPOINT_PREFIX + key + '.json'
+
+
+def _load_checkpoint(bucket, key, etag):
+    try:
+        response = s3.get_object(Bucket=bucket, Key=_checkpoint_key(key))
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+            return None
+        raise
+    state = json.loads(response['Body'].read())
+    # A checkpoint only applies to the exact object version it was taken from
+    return state if state.get('etag') == etag else None
+
+
+def _save_checkpoint(state):
+    s3.put_object(Bucket=state['bucket'], Key=_checkpoint_key(state['key']),
+                  Body=json.dumps(state).encode('utf-8'), ContentType='application/json')
+
+
+def _new_state(bucket, key, etag):
+    return {
+        'bucket': bucket,
+        'key': key,
+        'etag': etag,
+        'format': _file_format(key),
+        'header': None,
+        'offset': 0,
+        'invocations': 0,
+        'started_at': now_iso(),
+        'stats': {'lines': 0, 'created': 0, 'invalid': 0, 'failed': 0},
+        'errors': []
+    }
+
+
+def _record_error(state, line_number, message):
+    if len(state['errors']) < MAX_REPORTED_ERRORS:
+        state['errors'].append({'line': line_number, 'error': message})
+
+
+def _upsert(item):
+    """update_item kwargs that write an imported film over any existing one.
+
+    A put would drop the uploaded content (content_key, content_size, media)
+    without releasing its blob and restart the version at 1, so the imported
+    fields are SET, everything else is kept and the version counts on. That
+    rules out BatchWriteItem, which only carries whole-item puts; the updates
+    run concurrently instead (update_items).
+    """
+    builder = UpdateBuilder()
+    for attribute, value in item.items():
+        if attribute not in ('film_id', 'version'):
+            builder.set(attribute, value)
+    builder.add('version', 1)
+    return dict(builder.kwargs(), Key={'film_id': item['film_id']})
+
+
+def _flush(state, batch):
+    if not batch:
+        return
+    errors = update_items(table_name, [_upsert(item) for item in batch.values()],
+                          max_workers=max_workers)
+    failed = {update['Key']['film_id']: str(e) for update, e in errors}
+    for film_id, message in failed.items():
+        _record_error(state, None, f'{film_id}: {message}')
+    state['stats']['failed'] += len(failed)
+    state['stats']['created'] += len(batch) - len(failed)
+    batch.clear()
+
+
+def _process(state, context):
+    """Import from the checkpointed offset; returns True when the file is finished."""
+    batch = {}
+    for line, end_offset in _iter_lines(state['bucket'], state['key'], state['offset']):
+        line_number = state['stats']['lines'] + 1
+        state['stats']['lines'] = line_number
+        if not line.strip():
+            state['offset'] = end_offset
+            continue
+
+        if state['format'] == 'csv' and state['header'] is None:
+            state['header'] = next(csv.reader([line.decode('utf-8')]))
+            state['offset'] = end_offset
+            continue
+
+        try:
+            record = _parse_line(line, state['format'], state['header'])
+            errors = validate_film(record)
+        except ValueError as e:
+            errors = [f'Unparseable record: {e}']
+        if errors:
+            state['stats']['invalid'] += 1
+            _record_error(state, line_number, errors[0])
+        else:
+            # A later line for the same film replaces the earlier one
+            item = build_item(record)
+            batch[item['film_id']] = item
+
+        if len(batch) >= batch_lines:
+            _flush(state, batch)
+            state['offset'] = end_offset
+            _save_checkpoint(state)
+            if context.get_remaining_time_in_millis() < SAFETY_MARGIN_MS:
+                return False
+        elif not batch:
+            state['offset'] = end_offset
+
+    _flush(state, batch)
+    return True
+
+
+def _write_report(state):
+    report = {
+        'bucket': state['bucket'],
+        'key': state['key'],
+        'started_at': state['started_at'],
+        'finished_at': now_iso(),
+        'invocations': state['invocations'],
+        'bytes': state['offset'],
+        'stats': state['stats'],
+        'errors': state['errors']
+    }
+    report_key = REPORT_PREFIX + state['key'] + '.json'
+    s3.put_object(Bucket=state['bucket'], Key=report_key,
+                  Body=json.dumps(report, indent=2).encode('utf-8'), ContentType='application/json')
+    s3.delete_object(Bucket=state['bucket'], Key=_checkpoint_key(state['key']))
+    return report_key
+
+
+def _start_states(event):
+    # S3 notification: one record per uploaded catalog file
+    for record in event['Records']:
+        bucket = record['s3']['bucket']['name']
+        key = unquote_plus(record['s3']['object']['key'])
+        etag = s3.head_object(Bucket=bucket, Key=key)['ETag']
+        yield _load_checkpoint(bucket, key, etag) or _new_state(bucket, key, etag)
+
+
+def handler(event, context):
+    # Either an S3 ObjectCreated notification for imports/, or the state of an
+    # import this function handed over to itself before running out of time
+    if 'checkpoint' in event:
+        state = event['checkpoint']
+        # A retried hand-over may be behind a checkpoint saved since
+        saved = _load_checkpoint(state['bucket'], state['key'], state['etag'])
+        states = [saved if saved and saved['offset'] > state['offset'] else state]
+    else:
+        states = list(_start_states(event))
+
+    results = []
+    for state in states:
+        state['invocations'] += 1
+        if _process(state, context):
+            results.append({'key': state['key'], 'report': _write_report(state)})
+            continue
+
+        _save_checkpoint(state)
+        lambda_client.invoke(
+            FunctionName=context.invoked_function_arn,
+            InvocationType='Event',
+            Payload=json.dumps({'checkpoint': state}).encode('utf-8')
+        )
+        results.append({'key': state['key'], 'resumed_at': state['offset']})
+    return results
@@ -0,0 +1,86 @@
+import os
+from decimal import Decimal
+from urllib.parse import unquote_plus
+
+import boto3
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+
+import content_store
+from media_probe import BufferedReader, ProbeError, probe
+
+s3 = boto3.client('s3')
+dynamodb = boto3.resource('dynamodb')
+table_name = os.environ['METADATA_TABLE']
+content_index = os.environ.get('CONTENT_INDEX', 'content-index')
+
+# Each ranged GET fetches at least this much, covering many small header reads
+PROBE_BLOCK_SIZE = 256 * 1024
+
+
+def _ranged_reader(bucket, key, size):
+    def read(offset, length):
+        return s3.get_object(Bucket=bucket, Key=key, Range=f'bytes={offset}-{offset + length - 1}')['Body'].read()
+    return BufferedReader(read, size, PROBE_BLOCK_SIZE)
+
+
+def _to_item(media):
+    # DynamoDB takes Decimal, not float, and has no use for empty values
+    item = {}
+    for name, value in media.items():
+        if isinstance(value, float):
+            value = Decimal(str(value))
+        if value is not None and value != []:
+            item[name] = value
+    return item
+
+
+def _films_using(table, key):
+    query_kwargs = {
+        'IndexName': content_index,
+        'KeyConditionExpression': Key('content_key').eq(key),
+        'ProjectionExpression': 'film_id'
+    }
+    while True:
+        response = table.query(**query_kwargs)
+        for item in response.get('Items', []):
+            yield item['film_id']
+        if 'LastEvaluatedKey' not in response:
+            return
+        query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def _extract(table, bucket, key, size):
+    content_hash = content_store.blob_hash(key)
+    if content_hash is None:
+        return
+    reader = _ranged_reader(bucket, key, size)
+    try:
+        media = _to_item(probe(reader))
+    except (ProbeError, IndexError, ValueError) as e:
+        print(f'Could not read a media header from {key}: {e}')
+        return
+    print(f'Probed {key} with {reader.reads} ranged reads')
+
+    # Kept on the blob so films linked to it later get the metadata right away
+    try:
+        dynamodb.Table(content_store.blob_table_name).update_item(
+            Key={'content_hash': content_hash},
+            UpdateExpression='SET media = :media',
+            ConditionExpression='attribute_exists(content_hash)',
+            ExpressionAttributeValues={':media': media}
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+    for film_id in _films_using(table, key):
+        content_store.set_film_media(table, film_id, key, media)
+
+
+def handler(event, context):
+    # S3 ObjectCreated under content/sha256/: a new content blob
+    table = dynamodb.Table(table_name)
+    for record in event['Records']:
+        _extract(table, record['s3']['bucket']['name'], unquote_plus(record['s3']['object']['key']),
+                 record['s3']['object']['size'])
+    return {'probed': len(event['Records'])}
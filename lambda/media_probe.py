@@ -0,0 +1,371 @@
+"""Container header parsing for MP4/MOV (ISO BMFF) and Matroska/WebM.
+
+Everything works through `read(offset, length)`, so only the header boxes
+or elements are fetched and media data is skipped by its declared size.
+Pure Python, no third-party dependencies.
+"""
+import struct
+
+# Upper bound on a single header structure we are willing to read (moov, Tracks, ...)
+MAX_HEADER_BYTES = 64 * 1024 * 1024
+# Top-level structures visited before giving up on finding the header
+MAX_TOP_LEVEL = 64
+
+MP4_CODECS = {
+    'avc1': 'h264', 'avc3': 'h264', 'hvc1': 'hevc', 'hev1': 'hevc', 'av01': 'av1',
+    'vp08': 'vp8', 'vp09': 'vp9', 'mp4v': 'mpeg4', 'mp4a': 'aac', 'ac-3': 'ac3',
+    'ec-3': 'eac3', 'Opus': 'opus', 'fLaC': 'flac', '.mp3': 'mp3'
+}
+MKV_CODECS = {
+    'V_MPEG4/ISO/AVC': 'h264', 'V_MPEGH/ISO/HEVC': 'hevc', 'V_AV1': 'av1', 'V_VP8': 'vp8',
+    'V_VP9': 'vp9', 'V_MPEG4/ISO/ASP': 'mpeg4', 'A_AAC': 'aac', 'A_AC3': 'ac3',
+    'A_EAC3': 'eac3', 'A_OPUS': 'opus', 'A_VORBIS': 'vorbis', 'A_FLAC': 'flac',
+    'A_MPEG/L3': 'mp3', 'A_DTS': 'dts'
+}
+
+
+class ProbeError(ValueError):
+    pass
+
+
+class BufferedReader:
+    """Wrap a `read(offset, length)` source, fetching at least `block_size` at a time.
+
+    Header parsing issues many small reads close together; each S3 ranged
+    GET then covers a block of them.
+    """
+
+    def __init__(self, read, size, block_size=64 * 1024):
+        self._read = read
+        self.size = size
+        self.block_size = block_size
+        self.reads = 0
+        self._offset = 0
+        self._buffer = b''
+
+    def read(self, offset, length):
+        if offset < 0 or offset >= self.size or length <= 0:
+            return b''
+        length = min(length, self.size - offset)
+        end = offset + length
+        if not (self._offset <= offset and end <= self._offset + len(self._buffer)):
+            fetch = min(max(length, self.block_size), self.size - offset)
+            self._buffer = self._read(offset, fetch)
+            self._offset = offset
+            self.reads += 1
+        start = offset - self._offset
+        return self._buffer[start:start + length]
+
+
+def _result(container, duration, size):
+    return {
+        'container': container,
+        'duration_seconds': round(duration, 3) if duration else None,
+        'width': None,
+        'height': None,
+        'video_codec': None,
+        'audio_codecs': [],
+        'bitrate': int(size * 8 / duration) if duration else None,
+        'size': size
+    }
+
+
+# --- ISO BMFF (MP4/MOV) ---------------------------------------------------
+
+def _boxes(data, start=0, end=None):
+    """Yield (type, payload start, payload end) for the boxes in data[start:end]."""
+    end = len(data) if end is None else end
+    offset = start
+    while offset + 8 <= end:
+        size, kind = struct.unpack_from('>I4s', data, offset)
+        header = 8
+        if size == 1:
+            if offset + 16 > end:
+                return
+            size = struct.unpack_from('>Q', data, offset + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header or offset + size > end:
+            return
+        yield kind.decode('latin-1'), offset + header, offset + size
+        offset += size
+
+
+def _child(data, start, end, kind):
+    for child, child_start, child_end in _boxes(data, start, end):
+        if child == kind:
+            return child_start, child_end
+    return None
+
+
+def _find_moov(reader):
+    offset = 0
+    for _ in range(MAX_TOP_LEVEL):
+        header = reader.read(offset, 16)
+        if len(header) < 8:
+            break
+        size, kind = struct.unpack_from('>I4s', header)
+        header_size = 8
+        if size == 1:
+            size = struct.unpack_from('>Q', header, 8)[0]
+            header_size = 16
+        elif size == 0:
+            size = reader.size - offset
+        if size < header_size:
+            break
+        if kind == b'moov':
+            if size > MAX_HEADER_BYTES:
+                raise ProbeError('moov box is too large')
+            return reader.read(offset + header_size, size - header_size)
+        offset += size
+    raise ProbeError('No moov box found')
+
+
+def _track(data, start, end):
+    """Return (handler, timescale, duration, codec, width, height) for a trak box."""
+    width = height = None
+    tkhd = _child(data, start, end, 'tkhd')
+    if tkhd and tkhd[1] - tkhd[0] >= 84:
+        # Last two fields of tkhd are width and height as 16.16 fixed point
+        width, height = (value >> 16 for value in struct.unpack_from('>II', data, tkhd[1] - 8))
+
+    mdia = _child(data, start, end, 'mdia')
+    if not mdia:
+        return None
+    handler = timescale = duration = codec = None
+    hdlr = _child(data, *mdia, 'hdlr')
+    if hdlr:
+        handler = data[hdlr[0] + 8:hdlr[0] + 12].decode('latin-1')
+    mdhd = _child(data, *mdia, 'mdhd')
+    if mdhd:
+        if data[mdhd[0]] == 1:
+            timescale, duration = struct.unpack_from('>IQ', data, mdhd[0] + 20)
+        else:
+            timescale, duration = struct.unpack_from('>II', data, mdhd[0] + 12)
+    minf = _child(data, *mdia, 'minf')
+    stbl = minf and _child(data, *minf, 'stbl')
+    stsd = stbl and _child(data, *stbl, 'stsd')
+    if stsd:
+        # Full box header (4) + entry count (4), then the first sample entry
+        for kind, entry_start, entry_end in _boxes(data, stsd[0] + 8, stsd[1]):
+            codec = MP4_CODECS.get(kind, kind.strip())
+            if handler == 'vide' and not width and entry_end - entry_start >= 28:
+                width, height = struct.unpack_from('>HH', data, entry_start + 24)
+            break
+    return handler, timescale, duration, codec, width, height
+
+
+def probe_mp4(reader):
+    moov = _find_moov(reader)
+    duration = None
+    mvhd = _child(moov, 0, len(moov), 'mvhd')
+    if mvhd:
+        if moov[mvhd[0]] == 1:
+            timescale, ticks = struct.unpack_from('>IQ', moov, mvhd[0] + 20)
+        else:
+            timescale, ticks = struct.unpack_from('>II', moov, mvhd[0] + 12)
+        duration = ticks / timescale if timescale else None
+
+    tracks = [_track(moov, start, end) for kind, start, end in _boxes(moov) if kind == 'trak']
+    tracks = [track for track in tracks if track]
+    if not duration:
+        durations = [ticks / scale for _, scale, ticks, _, _, _ in tracks if scale and ticks]
+        duration = max(durations) if durations else None
+
+    result = _result('mp4', duration, reader.size)
+    for handler, _, _, codec, width, height in tracks:
+        if handler == 'vide' and result['video_codec'] is None:
+            result.update(video_codec=codec, width=width or None, height=height or None)
+        elif handler == 'soun' and codec:
+            result['audio_codecs'].append(codec)
+    return result
+
+
+# --- EBML (Matroska/WebM) -------------------------------------------------
+
+EBML_HEADER = 0x1A45DFA3
+DOC_TYPE = 0x4282
+SEGMENT = 0x18538067
+SEEK_HEAD = 0x114D9B74
+SEEK = 0x4DBB
+SEEK_ID = 0x53AB
+SEEK_POSITION = 0x53AC
+INFO = 0x1549A966
+TIMESTAMP_SCALE = 0x2AD7B1
+DURATION = 0x4489
+TRACKS = 0x1654AE6B
+TRACK_ENTRY = 0xAE
+TRACK_TYPE = 0x83
+CODEC_ID = 0x86
+VIDEO = 0xE0
+PIXEL_WIDTH = 0xB0
+PIXEL_HEIGHT = 0xBA
+CLUSTER = 0x1F43B675
+
+
+def _vint(data, offset, keep_marker):
+    """Decode an EBML variable-length integer; returns (value, length, unknown)."""
+    if offset >= len(data):
+        raise ProbeError('Truncated EBML header')
+    first = data[offset]
+    length = 1
+    mask = 0x80
+    while length <= 8 and not first & mask:
+        mask >>= 1
+        length += 1
+    if length > 8 or offset + length > len(data):
+        raise ProbeError('Invalid EBML variable-length integer')
+    value = first if keep_marker else first & (mask - 1)
+    for byte in data[offset + 1:offset + length]:
+        value = (value << 8) | byte
+    unknown = not keep_marker and value == (1 << (7 * length)) - 1
+    return value, length, unknown
+
+
+def _element_header(data, offset):
+    element_id, id_length, _ = _vint(data, offset, keep_marker=True)
+    size, size_length, unknown = _vint(data, offset + id_length, keep_marker=False)
+    return element_id, id_length + size_length, None if unknown else size
+
+
+def _elements(data, start=0, end=None):
+    """Yield (id, payload start, payload end) for the elements in data[start:end]."""
+    end = len(data) if end is None else end
+    offset = start
+    while offset < end:
+        element_id, header, size = _element_header(data, offset)
+        payload = offset + header
+        payload_end = end if size is None else min(payload + size, end)
+        yield element_id, payload, payload_end
+        offset = payload_end
+
+
+def _uint(data, start, end):
+    return int.from_bytes(data[start:end], 'big') if end > start else 0
+
+
+def _float(data, start, end):
+    if end - start == 4:
+        return struct.unpack_from('>f', data, start)[0]
+    if end - start == 8:
+        return struct.unpack_from('>d', data, start)[0]
+    return None
+
+
+def _read_element(reader, offset):
+    header = reader.read(offset, 12)
+    element_id, header_size, size = _element_header(header, 0)
+    return element_id, offset + header_size, size
+
+
+def _parse_info(data):
+    scale, duration = 1000000, None
+    for element_id, start, end in _elements(data):
+        if element_id == TIMESTAMP_SCALE:
+            scale = _uint(data, start, end)
+        elif element_id == DURATION:
+            duration = _float(data, start, end)
+    return duration * scale / 1e9 if duration else None
+
+
+def _parse_tracks(data, result):
+    for element_id, start, end in _elements(data):
+        if element_id != TRACK_ENTRY:
+            continue
+        track_type = codec = width = height = None
+        for child, child_start, child_end in _elements(data, start, end):
+            if child == TRACK_TYPE:
+                track_type = _uint(data, child_start, child_end)
+            elif child == CODEC_ID:
+                codec_id = data[child_start:child_end].rstrip(b'\0').decode('ascii', 'replace')
+                codec = MKV_CODECS.get(codec_id, codec_id)
+            elif child == VIDEO:
+                for video_child, video_start, video_end in _elements(data, child_start, child_end):
+                    if video_child == PIXEL_WIDTH:
+                        width = _uint(data, video_start, video_end)
+                    elif video_child == PIXEL_HEIGHT:
+                        height = _uint(data, video_start, video_end)
+        if track_type == 1 and result['video_codec'] is None:
+            result.update(video_codec=codec, width=width, height=height)
+        elif track_type == 2 and codec:
+            result['audio_codecs'].append(codec)
+
+
+def probe_mkv(reader):
+    element_id, offset, size = _read_element(reader, 0)
+    if element_id != EBML_HEADER or size is None:
+        raise ProbeError('Not an EBML file')
+    header = reader.read(offset, size)
+    doc_type = 'matroska'
+    for child, start, end in _elements(header):
+        if child == DOC_TYPE:
+            doc_type = header[start:end].rstrip(b'\0').decode('ascii', 'replace')
+    offset += size
+
+    element_id, segment_start, segment_size = _read_element(reader, offset)
+    if element_id != SEGMENT:
+        raise ProbeError('No Matroska segment found')
+    segment_end = reader.size if segment_size is None else min(segment_start + segment_size, reader.size)
+
+    # Walk the segment's children by their headers only; Info and Tracks sit
+    # before the clusters, or are pointed at by the SeekHead
+    wanted = {INFO: None, TRACKS: None}
+    seek_positions = {}
+    position = segment_start
+    for _ in range(MAX_TOP_LEVEL):
+        if position >= segment_end or all(value is not None for value in wanted.values()):
+            break
+        element_id, payload, size = _read_element(reader, position)
+        if element_id in wanted or element_id == SEEK_HEAD:
+            if size is None or size > MAX_HEADER_BYTES:
+                raise ProbeError('Header element is too large')
+            data = reader.read(payload, size)
+            if element_id == SEEK_HEAD:
+                for seek, start, end in _elements(data):
+                    if seek != SEEK:
+                        continue
+                    target = target_position = None
+                    for child, child_start, child_end in _elements(data, start, end):
+                        if child == SEEK_ID:
+                            target = _uint(data, child_start, child_end)
+                        elif child == SEEK_POSITION:
+                            target_position = _uint(data, child_start, child_end)
+                    if target in wanted and target_position is not None:
+                        seek_positions[target] = segment_start + target_position
+            else:
+                wanted[element_id] = data
+        if element_id == CLUSTER or size is None:
+            break
+        position = payload + size
+
+    for element_id, element_position in seek_positions.items():
+        if wanted[element_id] is None:
+            found_id, payload, size = _read_element(reader, element_position)
+            if found_id == element_id and size is not None and size <= MAX_HEADER_BYTES:
+                wanted[element_id] = reader.read(payload, size)
+
+    if wanted[INFO] is None and wanted[TRACKS] is None:
+        raise ProbeError('No Matroska Info or Tracks found')
+    result = _result('webm' if doc_type == 'webm' else 'matroska',
+                     _parse_info(wanted[INFO]) if wanted[INFO] else None, reader.size)
+    if wanted[TRACKS]:
+        _parse_tracks(wanted[TRACKS], result)
+    return result
+
+
+def probe(reader):
+    """Detect the container from its first bytes and parse its header.
+
+    Raises ProbeError for an unrecognized container or a header that ends
+    before its structures do.
+    """
+    head = reader.read(0, 12)
+    try:
+        if head[:4] == b'\x1a\x45\xdf\xa3':
+            return probe_mkv(reader)
+        if head[4:8] in (b'ftyp', b'moov', b'free', b'skip', b'wide', b'mdat'):
+            return probe_mp4(reader)
+    except (struct.error, IndexError) as e:
+        raise ProbeError(f'Truncated header: {e}') from e
+    raise ProbeError('Unrecognized container')
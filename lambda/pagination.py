@@ -0,0 +1,49 @@
+import base64
+import binascii
+import json
+from decimal import Decimal
+
+from serialization import dumps
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 1000
+
+
+class InvalidPageRequest(ValueError):
+    pass
+
+
+def parse_limit(params, default=DEFAULT_LIMIT, maximum=MAX_LIMIT):
+    raw = params.get('limit')
+    if raw in (None, ''):
+        return default
+    try:
+        limit = int(raw)
+    except (TypeError, ValueError):
+        raise InvalidPageRequest('limit must be an integer')
+    if limit < 1 or limit > maximum:
+        raise InvalidPageRequest(f'limit must be between 1 and {maximum}')
+    return limit
+
+
+def encode_token(state):
+    # The cursor is opaque to clients: url-safe base64 of the JSON cursor state
+    # (usually DynamoDB's LastEvaluatedKey).
+    if state is None:
+        return None
+    raw = dumps(state)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_token(token):
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode('ascii'))
+        state = json.loads(raw, parse_float=Decimal, parse_int=Decimal)
+    except (binascii.Error, UnicodeError, ValueError):
+        raise InvalidPageRequest('next_token is invalid')
+    if not isinstance(state, dict):
+        raise InvalidPageRequest('next_token is invalid')
+    return state
@@ -0,0 +1,155 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# How many pages may sit between the scan workers and the consumer before the
+# workers block; keeps memory bounded when the consumer is slower than DynamoDB.
+MAX_BUFFERED_PAGES = 8
+
+_SEGMENT_DONE = object()
+
+
+class ReadBudget:
+    """Token bucket of read capacity units per second shared by all workers."""
+
+    def __init__(self, units_per_second):
+        self.units_per_second = float(units_per_second)
+        self._tokens = self.units_per_second
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.units_per_second,
+                           self._tokens + (now - self._updated) * self.units_per_second)
+        self._updated = now
+
+    def acquire(self):
+        # Wait until the bucket is out of debt; the real cost of a page is only
+        # known after the call returns, so it is charged afterwards in consume().
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens > 0:
+                    return
+                wait = -self._tokens / self.units_per_second
+            time.sleep(wait)
+
+    def consume(self, units):
+        with self._lock:
+            self._refill()
+            self._tokens -= units
+
+
+def _consumed_units(response):
+    return response.get('ConsumedCapacity', {}).get('CapacityUnits', 0)
+
+
+def scan_segment_page(table, segment, total_segments, start_key=None, budget=None, **scan_kwargs):
+    scan_kwargs = dict(scan_kwargs, Segment=segment, TotalSegments=total_segments)
+    if start_key:
+        scan_kwargs['ExclusiveStartKey'] = start_key
+    if budget is not None:
+        scan_kwargs['ReturnConsumedCapacity'] = 'TOTAL'
+        budget.acquire()
+    response = table.scan(**scan_kwargs)
+    if budget is not None:
+        budget.consume(_consumed_units(response))
+    return response
+
+
+def parallel_scan(table, total_segments, max_workers=None, budget=None, **scan_kwargs):
+    """Yield every item in the table, scanning `total_segments` segments concurrently.
+
+    Pages are merged into one stream in arrival order, so item order is not
+    stable across runs.
+    """
+    pages = queue.Queue(maxsize=MAX_BUFFERED_PAGES)
+    stop = threading.Event()
+
+    def put(entry):
+        while not stop.is_set():
+            try:
+                pages.put(entry, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def worker(segment):
+        try:
+            start_key = None
+            while not stop.is_set():
+                response = scan_segment_page(table, segment, total_segments, start_key,
+                                             budget, **scan_kwargs)
+                put(response.get('Items', []))
+                start_key = response.get('LastEvaluatedKey')
+                if not start_key:
+                    break
+            put(_SEGMENT_DONE)
+        except Exception as e:
+            put(e)
+
+    executor = ThreadPoolExecutor(max_workers=max_workers or total_segments)
+    try:
+        for segment in range(total_segments):
+            executor.submit(worker, segment)
+
+        remaining = total_segments
+        while remaining:
+            entry = pages.get()
+            if entry is _SEGMENT_DONE:
+                remaining -= 1
+            elif isinstance(entry, Exception):
+                raise entry
+            else:
+                yield from entry
+    finally:
+        stop.set()
+        executor.shutdown(wait=True)
+
+
+def scan_parallel_page(table, limit, state, max_workers=None, budget=None, **scan_kwargs):
+    """Read one listing page from several segments at once.
+
+    `state` maps each unfinished segment to its ExclusiveStartKey (None before
+    the first page). Returns the items and the state for the next page, or
+    None once every segment is exhausted.
+    """
+    total_segments = int(state['total_segments'])
+    positions = {int(segment): key for segment, key in state['segments'].items()}
+
+    # Spread the limit over the open segments; with more segments than the
+    # limit only the first `limit` of them are read this round.
+    active = sorted(positions)[:limit]
+    per_segment = max(1, limit // len(active))
+
+    def read(segment):
+        return scan_segment_page(table, segment, total_segments, positions[segment], budget,
+                                 Limit=per_segment, **scan_kwargs)
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(active)) as executor:
+        responses = list(executor.map(read, active))
+
+    items = []
+    for segment, response in zip(active, responses):
+        items.extend(response.get('Items', []))
+        next_key = response.get('LastEvaluatedKey')
+        if next_key:
+            positions[segment] = next_key
+        else:
+            del positions[segment]
+
+    if not positions:
+        return items, None
+    return items, {
+        'total_segments': total_segments,
+        'segments': {str(segment): key for segment, key in positions.items()}
+    }
+
+
+def initial_state(total_segments):
+    return {
+        'total_segments': total_segments,
+        'segments': {str(segment): None for segment in range(total_segments)}
+    }
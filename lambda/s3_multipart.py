@@ -0,0 +1,74 @@
+import io
+
+import boto3
+
+# S3 requires every part but the last to be at least 5 MiB
+MIN_PART_BYTES = 5 * 1024 * 1024
+DEFAULT_PART_BYTES = 16 * 1024 * 1024
+
+s3 = boto3.client('s3')
+
+
+class MultipartWriter(io.RawIOBase):
+    """Write-only file object that streams into an S3 multipart upload.
+
+    Only one part is buffered at a time, so arbitrarily large objects can be
+    produced with flat memory. Use as a context manager: a clean exit
+    completes the upload, an exception aborts it.
+    """
+
+    def __init__(self, bucket, key, part_bytes=DEFAULT_PART_BYTES, **create_kwargs):
+        super().__init__()
+        self.bucket = bucket
+        self.key = key
+        self.part_bytes = max(part_bytes, MIN_PART_BYTES)
+        self.bytes_written = 0
+        self._buffer = bytearray()
+        self._parts = []
+        self._upload_id = s3.create_multipart_upload(Bucket=bucket, Key=key, **create_kwargs)['UploadId']
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._buffer.extend(data)
+        self.bytes_written += len(data)
+        while len(self._buffer) >= self.part_bytes:
+            self._upload_part(bytes(self._buffer[:self.part_bytes]))
+            del self._buffer[:self.part_bytes]
+        return len(data)
+
+    def tell(self):
+        return self.bytes_written
+
+    def _upload_part(self, data):
+        part_number = len(self._parts) + 1
+        response = s3.upload_part(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id,
+                                  PartNumber=part_number, Body=data)
+        self._parts.append({'PartNumber': part_number, 'ETag': response['ETag']})
+
+    def complete(self):
+        # The final part may be smaller than the minimum (or empty for an
+        # empty object, which still needs one part)
+        if self._buffer or not self._parts:
+            self._upload_part(bytes(self._buffer))
+            self._buffer.clear()
+        s3.complete_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id,
+                                     MultipartUpload={'Parts': self._parts})
+        super().close()
+
+    def abort(self):
+        s3.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id)
+        super().close()
+
+    def close(self):
+        # Closing is driven by complete()/abort(); wrappers such as GzipFile
+        # call close() on their file object only when they own it
+        pass
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.complete()
+        else:
+            self.abort()
+        return False
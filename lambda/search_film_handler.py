@@ -0,0 +1,41 @@
+from http_encoding import encode_response
+from pagination import InvalidPageRequest, decode_token, encode_token, parse_limit
+from search_index import search
+from serialization import dumps
+
+MAX_QUERY_LENGTH = 200
+
+
+def _response(status_code, body):
+    return {
+        'statusCode': status_code,
+        'body': dumps(body),
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*'
+        }
+    }
+
+
+def _search(event):
+    params = event.get('queryStringParameters') or {}
+    query = (params.get('q') or '').strip()
+    if not query or len(query) > MAX_QUERY_LENGTH:
+        return _response(400, {'error': f'q must be 1 to {MAX_QUERY_LENGTH} characters'})
+
+    try:
+        limit = parse_limit(params, default=20, maximum=100)
+        # The cursor is the key of the last index entry read, so each page
+        # starts where the previous one stopped in the ranked index
+        items, next_state = search(query, limit, decode_token(params.get('next_token')))
+    except InvalidPageRequest as e:
+        return _response(400, {'error': str(e)})
+
+    return _response(200, {
+        'items': items,
+        'next_token': encode_token(next_state)
+    })
+
+
+def handler(event, context):
+    return encode_response(event, _search(event))
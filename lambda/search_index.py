@@ -0,0 +1,235 @@
+import os
+import re
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from boto3.dynamodb.conditions import Key
+
+from batch_writer import write_requests
+from pagination import InvalidPageRequest
+
+dynamodb = boto3.resource('dynamodb')
+index_table_name = os.environ.get('SEARCH_INDEX_TABLE', 'FilmSearchRanks')
+film_id_index = os.environ.get('SEARCH_FILM_ID_INDEX', 'film_id-index')
+
+# Prefixes are indexed from MIN_PREFIX up to MAX_PREFIX characters; query
+# words are cut to MAX_PREFIX so longer words still match.
+MIN_PREFIX = 2
+MAX_PREFIX = 15
+# Per multi-word query: entries read per word to find the one with the
+# fewest films, and entries of that word read for one page of results
+PROBE_LIMIT = 100
+MAX_CANDIDATES = 1000
+
+# Match weights: whole words beat prefixes, title beats director
+SCORES = {
+    ('title', True): 8,
+    ('title', False): 4,
+    ('director', True): 2,
+    ('director', False): 1
+}
+MAX_SCORE = max(SCORES.values())
+# Characters of the normalized title kept in the sort key
+RANK_TITLE_CHARS = 100
+
+_WORD = re.compile(r'[0-9a-z]+')
+
+
+def normalize(text):
+    """Split text into lowercase, accent-free alphanumeric words."""
+    decomposed = unicodedata.normalize('NFKD', str(text))
+    stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return _WORD.findall(stripped.casefold())
+
+
+def _prefixes(word):
+    top = min(len(word), MAX_PREFIX)
+    for length in range(MIN_PREFIX, top + 1):
+        # A prefix that is the whole word (or all of it that gets indexed)
+        # counts as a whole-word match
+        yield word[:length], length == top
+
+
+def rank_key(score, title, film_id):
+    """Sort key of an index entry: best score first, then title A-Z, then film_id.
+
+    The score is inverted so a Query in key order returns a token's films
+    already ranked, and a page can start where the previous one stopped.
+    """
+    title_key = ' '.join(normalize(title or ''))[:RANK_TITLE_CHARS]
+    return f'{MAX_SCORE - score:02d}#{title_key}#{film_id}'
+
+
+def index_entries(item):
+    """Return {token: index item} for a film."""
+    entries = {}
+    for field in ('title', 'director'):
+        for word in normalize(item.get(field) or ''):
+            for token, whole_word in _prefixes(word):
+                score = SCORES[(field, whole_word)]
+                entry = entries.get(token)
+                if entry is None or entry['score'] < score:
+                    entries[token] = {
+                        'token': token,
+                        'film_id': item['film_id'],
+                        'title': item.get('title'),
+                        'director': item.get('director'),
+                        'year': item.get('year'),
+                        'score': score,
+                        'rank': rank_key(score, item.get('title'), item['film_id'])
+                    }
+    return entries
+
+
+def _indexed_keys(film_id):
+    table = dynamodb.Table(index_table_name)
+    query_kwargs = {
+        'IndexName': film_id_index,
+        'KeyConditionExpression': Key('film_id').eq(film_id)
+    }
+    keys = set()
+    while True:
+        response = table.query(**query_kwargs)
+        keys.update((entry['token'], entry['rank']) for entry in response.get('Items', []))
+        if 'LastEvaluatedKey' not in response:
+            return keys
+        query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def reindex_film(item):
+    """Bring the index entries of one film in line with its current title and director."""
+    entries = index_entries(item)
+    # A new title moves an entry to another rank, which is another key
+    stale = _indexed_keys(item['film_id']) - {(entry['token'], entry['rank']) for entry in entries.values()}
+    requests = [{'PutRequest': {'Item': entry}} for entry in entries.values()]
+    requests += [{'DeleteRequest': {'Key': {'token': token, 'rank': rank}}} for token, rank in stale]
+    failed, errors = write_requests(index_table_name, requests)
+    if errors:
+        raise errors[0][1]
+    if failed:
+        raise RuntimeError(f'{len(failed)} search index writes for {item["film_id"]} were throttled')
+
+
+def reindex_films(items, max_workers=8):
+    """Reindex many films concurrently; returns the film_ids that failed."""
+    def reindex(item):
+        try:
+            reindex_film(item)
+            return None
+        except Exception as e:
+            print(f'Search indexing failed for {item["film_id"]}: {e}')
+            return item['film_id']
+
+    if not items:
+        return []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        return [film_id for film_id in executor.map(reindex, items) if film_id]
+
+
+def _query_page(token, start_key=None, limit=None):
+    table = dynamodb.Table(index_table_name)
+    query_kwargs = {'KeyConditionExpression': Key('token').eq(token)}
+    if start_key:
+        query_kwargs['ExclusiveStartKey'] = start_key
+    if limit:
+        query_kwargs['Limit'] = limit
+    response = table.query(**query_kwargs)
+    return response.get('Items', []), response.get('LastEvaluatedKey')
+
+
+def _rarest(tokens):
+    """The query word with the fewest films, as (token, first page, key after it).
+
+    Every word's partition is probed with one short page; a word whose films
+    all fit in it wins outright. Otherwise the longest word, usually the
+    rarest, is taken.
+    """
+    def probe(token):
+        return _query_page(token, limit=PROBE_LIMIT)
+
+    with ThreadPoolExecutor(max_workers=len(tokens)) as executor:
+        probes = dict(zip(tokens, executor.map(probe, tokens)))
+    complete = [token for token, (_, start_key) in probes.items() if not start_key]
+    if complete:
+        token = min(complete, key=lambda token: len(probes[token][0]))
+    else:
+        token = max(tokens, key=len)
+    return (token,) + probes[token]
+
+
+def _result(entry, score):
+    return {
+        'film_id': entry['film_id'],
+        'title': entry.get('title'),
+        'director': entry.get('director'),
+        'year': entry.get('year'),
+        'score': score
+    }
+
+
+def _query_tokens(query):
+    return sorted({word[:MAX_PREFIX] for word in normalize(query) if len(word) >= MIN_PREFIX})
+
+
+def _start(tokens, state):
+    """(token, start key) a page continues from; raises InvalidPageRequest for a foreign state."""
+    token = state.get('token')
+    start_key = state.get('key')
+    valid = (
+        token in tokens
+        and isinstance(start_key, dict) and start_key.get('token') == token
+        and isinstance(start_key.get('rank'), str)
+    )
+    if not valid:
+        raise InvalidPageRequest('next_token is invalid')
+    return token, {'token': token, 'rank': start_key['rank']}
+
+
+def search(query, limit, state=None):
+    """One page of films matching every word of `query`, best match first.
+
+    Returns (results, next state or None). A page is one Query over one
+    word's entries, which are sorted by rank, so its cost does not grow with
+    the catalog. With several words the rarest word's entries are read in
+    rank order, at most MAX_CANDIDATES per page, and kept when the film also
+    matches the other words; the score then adds up every word's weight.
+    """
+    tokens = _query_tokens(query)
+    if not tokens:
+        return [], None
+
+    if state:
+        token, start_key = _start(tokens, state)
+        page, next_key = [], start_key
+    elif len(tokens) == 1:
+        token, page, next_key = tokens[0], [], None
+    else:
+        token, page, next_key = _rarest(tokens)
+        if not page:
+            return [], None
+
+    others = [other for other in tokens if other != token]
+    if not others:
+        entries, next_key = _query_page(token, next_key, limit)
+        results = [_result(entry, entry['score']) for entry in entries]
+        return results, ({'token': token, 'key': next_key} if next_key else None)
+
+    # The entries carry title and director, so the other words are matched
+    # against those the way the index would have matched them
+    results = []
+    read = 0
+    while True:
+        for entry in page:
+            read += 1
+            film_tokens = index_entries(entry)
+            if all(other in film_tokens for other in others):
+                results.append(_result(entry, entry['score']
+                                       + sum(film_tokens[other]['score'] for other in others)))
+            if len(results) == limit or read == MAX_CANDIDATES:
+                if entry is page[-1] and not next_key:
+                    return results, None
+                return results, {'token': token, 'key': {'token': token, 'rank': entry['rank']}}
+        if not next_key:
+            return results, None
+        page, next_key = _query_page(token, next_key, min(MAX_CANDIDATES - read, PROBE_LIMIT * 5))
@@ -0,0 +1,93 @@
+import json
+import os
+
+import boto3
+from boto3.dynamodb.types import TypeDeserializer
+
+from film_writes import INDEXED_FIELDS
+from search_index import reindex_films
+
+dynamodb = boto3.resource('dynamodb')
+lambda_client = boto3.client('lambda')
+deserializer = TypeDeserializer()
+table_name = os.environ['METADATA_TABLE']
+
+REBUILD_PAGE_SIZE = 500
+# Stop and hand over to a fresh invocation when less than this is left
+SAFETY_MARGIN_MS = 60 * 1000
+
+
+def _image(record, name):
+    image = record['dynamodb'].get(name)
+    if not image:
+        return None
+    return {key: deserializer.deserialize(value) for key, value in image.items()
+            if key == 'film_id' or key in INDEXED_FIELDS}
+
+
+def films_to_reindex(records):
+    """The latest indexed state of every film whose indexed fields changed.
+
+    A removed film maps to just its film_id, which drops all its entries.
+    """
+    films = {}
+    for record in records:
+        old = _image(record, 'OldImage') or {}
+        new = _image(record, 'NewImage')
+        film_id = (new or old)['film_id']
+        if new is None:
+            films[film_id] = {'film_id': film_id}
+        elif film_id in films or any(old.get(name) != new.get(name) for name in INDEXED_FIELDS):
+            films[film_id] = new
+    return list(films.values())
+
+
+def _rebuild(state, context):
+    """Reindex every film, a page of the metadata table at a time.
+
+    Returns the state to continue from, or None once the scan is done.
+    """
+    table = dynamodb.Table(table_name)
+    scan_kwargs = {
+        'Limit': REBUILD_PAGE_SIZE,
+        'ProjectionExpression': 'film_id, title, director, #year',
+        'ExpressionAttributeNames': {'#year': 'year'}
+    }
+    while True:
+        if state.get('start_key'):
+            scan_kwargs['ExclusiveStartKey'] = state['start_key']
+        response = table.scan(**scan_kwargs)
+        films = response.get('Items', [])
+        failed = reindex_films(films)
+        state['reindexed'] = state.get('reindexed', 0) + len(films) - len(failed)
+        state['failed'] = state.get('failed', 0) + len(failed)
+        state['start_key'] = response.get('LastEvaluatedKey')
+        if not state['start_key']:
+            return None
+        if context.get_remaining_time_in_millis() < SAFETY_MARGIN_MS:
+            return state
+
+
+def handler(event, context):
+    # {"rebuild": {}} backfills the whole index, e.g. after the index table
+    # is replaced; it hands over to itself before running out of time
+    if 'rebuild' in event:
+        state = event['rebuild']
+        pending = _rebuild(state, context)
+        if pending:
+            lambda_client.invoke(
+                FunctionName=context.invoked_function_arn,
+                InvocationType='Event',
+                Payload=json.dumps({'rebuild': pending}, default=str).encode('utf-8')
+            )
+        return {'rebuild': 'resumed' if pending else 'done',
+                'reindexed': state.get('reindexed', 0), 'failed': state.get('failed', 0)}
+
+    # DynamoDB stream of MetaDataFilms (NEW_AND_OLD_IMAGES). Indexing here
+    # keeps it off the request paths; reindexing a film is idempotent, so a
+    # retried batch is harmless
+    films = films_to_reindex(event['Records'])
+    failed = reindex_films(films)
+    if failed:
+        raise RuntimeError(f'Search indexing failed for {len(failed)} films')
+    return {'records': len(event['Records']), 'reindexed': len(films)}
@@ -0,0 +1,135 @@
+import base64
+import json
+import math
+import os
+from decimal import Decimal
+
+from boto3.dynamodb.types import Binary
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; the stdlib encoder produces the same output
+    orjson = None
+
+# 'auto' uses orjson when it can be imported, 'json' forces the stdlib encoder.
+# The lambda asset does not bundle orjson, so deployed functions use the
+# stdlib encoder; the orjson path serves local runs and benchmarks
+default_encoder = os.environ.get('JSON_ENCODER', 'auto')
+
+# Raw JSON fragments need orjson >= 3.9; an older orjson is not used
+_fragments = orjson is not None and hasattr(orjson, 'Fragment')
+
+
+def _other(obj):
+    if isinstance(obj, (set, frozenset)):
+        try:
+            return sorted(obj)
+        except TypeError:
+            return list(obj)
+    if isinstance(obj, Binary):
+        obj = obj.value
+    if isinstance(obj, (bytes, bytearray)):
+        return base64.b64encode(obj).decode('ascii')
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+class _Number(float):
+    """A non-integral Decimal on its way through json, written as its exact text."""
+
+    def __new__(cls, value):
+        number = super().__new__(cls, value)
+        number.text = str(value)
+        return number
+
+
+# The hooks run once per Decimal in the payload, so the common case is inlined
+
+def default(obj):
+    """Encode the DynamoDB types json cannot: Decimal, sets and binary values.
+
+    Integral Decimals become ints of any size, so `year` stays 2024 rather
+    than 2024.0; other Decimals keep their exact digits. Sets become sorted
+    lists.
+    """
+    if type(obj) is Decimal:
+        return int(obj) if obj == obj.to_integral_value() else _Number(obj)
+    return _other(obj)
+
+
+class _Inexact(Exception):
+    """A Decimal whose float would be written with different digits."""
+
+
+def _float_default(obj):
+    # For json's C encoder: Decimals that a float writes digit for digit
+    # (7.5, not 2.50 or 0.1000000000000000055) are passed as floats
+    if type(obj) is Decimal:
+        if obj == obj.to_integral_value():
+            return int(obj)
+        number = float(obj)
+        if repr(number) != str(obj):
+            raise _Inexact
+        return number
+    return _other(obj)
+
+
+def _floatstr(number):
+    if type(number) is _Number:
+        return number.text
+    if not math.isfinite(number):
+        raise ValueError(f'{number!r} is not valid JSON')
+    return float.__repr__(number)
+
+
+def _json_dumps(obj, sort_keys):
+    try:
+        return json.dumps(obj, default=_float_default, sort_keys=sort_keys, separators=(',', ':'),
+                          ensure_ascii=False)
+    except _Inexact:
+        pass
+    # json's C encoder writes every float with float.__repr__, so payloads
+    # with other Decimals go through the pure Python encoder, which is about
+    # three times slower, with a float writer that knows _Number
+    iterencode = json.encoder._make_iterencode(
+        {}, default, json.encoder.encode_basestring, None, _floatstr,
+        ':', ',', sort_keys, False, True
+    )
+    return ''.join(iterencode(obj, 0))
+
+
+def _orjson_default(obj):
+    # Raw fragments keep every digit of a non-integer Decimal, and of
+    # integers beyond the 64 bits orjson encodes natively
+    if type(obj) is Decimal:
+        if obj == obj.to_integral_value():
+            if -2 ** 63 <= obj < 2 ** 64:
+                return int(obj)
+            return orjson.Fragment(str(int(obj)))
+        return orjson.Fragment(str(obj))
+    return _other(obj)
+
+
+def _use_orjson(encoder):
+    encoder = encoder or default_encoder
+    if encoder == 'orjson' and not _fragments:
+        raise RuntimeError('orjson >= 3.9 is not installed')
+    return _fragments and encoder in ('auto', 'orjson')
+
+
+def dumps_bytes(obj, sort_keys=False, encoder=None):
+    """Serialize to compact UTF-8 JSON bytes.
+
+    Both encoders use the same layout (no spaces, non-ASCII left as is), so
+    payloads look alike whichever one a container uses. `encoder` picks one
+    per call ('orjson', 'json' or 'auto').
+    """
+    if _use_orjson(encoder):
+        return orjson.dumps(obj, default=_orjson_default, option=orjson.OPT_SORT_KEYS if sort_keys else 0)
+    return _json_dumps(obj, sort_keys).encode('utf-8')
+
+
+def dumps(obj, sort_keys=False, encoder=None):
+    """Serialize to a compact JSON string (see dumps_bytes)."""
+    if _use_orjson(encoder):
+        return dumps_bytes(obj, sort_keys, encoder).decode('utf-8')
+    return _json_dumps(obj, sort_keys)
@@ -0,0 +1,138 @@
+from decimal import Decimal
+
+# PATCH operators, applied in this order
+OPERATORS = ('$set', '$inc', '$append', '$remove', '$addToSet', '$deleteFromSet')
+
+
+class InvalidUpdate(ValueError):
+    pass
+
+
+def _is_number(value):
+    return isinstance(value, (int, Decimal)) and not isinstance(value, bool)
+
+
+def _as_set(name, values):
+    # DynamoDB sets are homogeneous and never empty
+    if not isinstance(values, list) or not values:
+        raise InvalidUpdate(f'{name} needs a non-empty list of values')
+    if all(isinstance(value, str) for value in values):
+        return set(values)
+    if all(_is_number(value) for value in values):
+        return set(values)
+    raise InvalidUpdate(f'{name} values must be all strings or all numbers')
+
+
+class UpdateBuilder:
+    """Collect SET/ADD/REMOVE/DELETE actions into one UpdateExpression.
+
+    Attribute names and values go through indexed placeholders (#a0, :v0), so
+    any attribute name is safe, reserved words included.
+    """
+
+    def __init__(self, protected=(), set_only=()):
+        self.protected = set(protected)
+        # Attributes that may be replaced but not incremented, appended or removed
+        self.set_only = set(set_only)
+        self.names = {}
+        self.values = {}
+        self.actions = {'SET': [], 'ADD': [], 'REMOVE': [], 'DELETE': []}
+        self.touched = set()
+
+    def _name(self, attribute, check=True, action='SET'):
+        if not isinstance(attribute, str) or not attribute:
+            raise InvalidUpdate('Attribute names must be non-empty strings')
+        if check:
+            if attribute in self.protected:
+                raise InvalidUpdate(f'{attribute} cannot be modified')
+            if action != 'SET' and attribute in self.set_only:
+                raise InvalidUpdate(f'{attribute} can only be replaced')
+            # DynamoDB rejects expressions where two actions hit the same path
+            if attribute in self.touched:
+                raise InvalidUpdate(f'{attribute} appears in more than one operation')
+            self.touched.add(attribute)
+        placeholder = f'#a{len(self.names)}'
+        self.names[placeholder] = attribute
+        return placeholder
+
+    def name(self, attribute):
+        """Placeholder for an attribute referenced only in a condition."""
+        return self._name(attribute, check=False)
+
+    def value(self, value):
+        placeholder = f':v{len(self.values)}'
+        self.values[placeholder] = value
+        return placeholder
+
+    def set(self, attribute, value, check=True):
+        self.actions['SET'].append(f'{self._name(attribute, check)} = {self.value(value)}')
+
+    def set_default(self, attribute, value):
+        """SET the attribute only if the item does not have it yet."""
+        name = self._name(attribute)
+        self.actions['SET'].append(f'{name} = if_not_exists({name}, {self.value(value)})')
+
+    def add(self, attribute, amount, check=True):
+        if not _is_number(amount):
+            raise InvalidUpdate(f'$inc.{attribute} must be a number')
+        self.actions['ADD'].append(f'{self._name(attribute, check, "ADD")} {self.value(amount)}')
+
+    def append(self, attribute, items):
+        if not isinstance(items, list) or not items:
+            raise InvalidUpdate(f'$append.{attribute} needs a non-empty list')
+        name = self._name(attribute, action='APPEND')
+        self.actions['SET'].append(
+            f'{name} = list_append(if_not_exists({name}, {self.value([])}), {self.value(items)})')
+
+    def remove(self, attribute):
+        self.actions['REMOVE'].append(self._name(attribute, action='REMOVE'))
+
+    def add_to_set(self, attribute, values):
+        members = _as_set(f'$addToSet.{attribute}', values)
+        self.actions['ADD'].append(f'{self._name(attribute, action="ADD")} {self.value(members)}')
+
+    def delete_from_set(self, attribute, values):
+        members = _as_set(f'$deleteFromSet.{attribute}', values)
+        self.actions['DELETE'].append(f'{self._name(attribute, action="DELETE")} {self.value(members)}')
+
+    def apply(self, operations):
+        """Add the actions of a PATCH body ({'$inc': {...}, '$remove': [...], ...})."""
+        for operator in OPERATORS:
+            operands = operations.get(operator)
+            if operands is None:
+                continue
+            if operator == '$remove':
+                if not isinstance(operands, list):
+                    raise InvalidUpdate('$remove must be a list of attribute names')
+                for attribute in operands:
+                    self.remove(attribute)
+                continue
+            if not isinstance(operands, dict):
+                raise InvalidUpdate(f'{operator} must be an object')
+            handler = {
+                '$set': self.set,
+                '$inc': self.add,
+                '$append': self.append,
+                '$addToSet': self.add_to_set,
+                '$deleteFromSet': self.delete_from_set
+            }[operator]
+            for attribute, operand in operands.items():
+                handler(attribute, operand)
+
+    @property
+    def empty(self):
+        return not self.touched
+
+    def expression(self):
+        return ' '.join(f'{action} {", ".join(clauses)}'
+                        for action, clauses in self.actions.items() if clauses)
+
+    def kwargs(self):
+        """Keyword arguments for Table.update_item."""
+        kwargs = {
+            'UpdateExpression': self.expression(),
+            'ExpressionAttributeNames': self.names
+        }
+        if self.values:
+            kwargs['ExpressionAttributeValues'] = self.values
+        return kwargs
@@ -2,62 +2,115 @@ import json
 import boto3
 import os
 from decimal import Decimal
+from botocore.exceptions import ClientError
+
+from film_model import parse_version, version_etag
+from film_writes import compile_update, parse_operations
+from http_encoding import header, request_body
+from serialization import dumps
+from write_queue import accepted, enqueue, wants_async
 
 # Initialize the DynamoDB resource and table name
 dynamodb = boto3.resource('dynamodb')
 table_name = os.environ['METADATA_TABLE']
 
+
+def _expected_version(event, body):
+    """Version precondition from If-Match or `expected_version`; (version, error)."""
+    if_match = header(event, 'If-Match')
+    if if_match is not None and if_match.strip() != '*':
+        version = parse_version(if_match)
+        if version is None:
+            return None, 'If-Match must be a version ETag such as "v3"'
+        return version, None
+    if body.get('expected_version') is not None:
+        version = parse_version(body['expected_version'])
+        if version is None:
+            return None, 'expected_version must be an integer'
+        return version, None
+    return None, None
+
+
+def _version_conflict(table, film_id):
+    # Only paid on conflict: report what the caller should re-read
+    item = table.get_item(
+        Key={'film_id': film_id},
+        ProjectionExpression='version',
+        ConsistentRead=True
+    ).get('Item')
+    if item is None:
+        return {
+            'statusCode': 404,
+            'body': json.dumps({'error': 'Film not found'})
+        }
+    current_version = int(item.get('version', 0))
+    return {
+        'statusCode': 412,
+        'body': dumps({
+            'error': 'Film was modified by another request',
+            'current_version': current_version
+        }),
+        'headers': {'ETag': version_etag(current_version)}
+    }
+
+
 def handler(event, context):
     # Access the table
     table = dynamodb.Table(table_name)
     
-    # Parse the input from the event
-    body = json.loads(event['body'])
-    film_id = body['film_id']
-    metadata = body.get('metadata', {})
-    
-    if not metadata:
+    # Parse the input from the event; numbers stay Decimal for DynamoDB
+    body = json.loads(request_body(event), parse_float=Decimal)
+    film_id = (event.get('pathParameters') or {}).get('film_id') or body['film_id']
+
+    # Everything compiles into a single UpdateExpression, so counters and
+    # lists change atomically without reading the film first
+    operations, error = parse_operations(body)
+    expected_version, version_error = _expected_version(event, body)
+    error = error or version_error
+    if error:
         return {
             'statusCode': 400,
-            'body': json.dumps({'error': 'No metadata provided for update'})
+            'body': json.dumps({'error': error})
         }
-    
-    # Construct the update expression and attribute values
-    update_expression = "SET "
-    expression_attribute_values = {}
-    expression_attribute_names = {}
-    
-    for key, value in metadata.items():
-        # Use expression attribute names to handle reserved keywords
-        expression_attribute_names[f"#{key}"] = key
-        update_expression += f"#{key} = :{key}, "
-        expression_attribute_values[f":{key}"] = value
 
-    update_expression = update_expression.rstrip(", ")
+    # Conditional updates stay synchronous so a conflict can still be reported
+    if expected_version is None and wants_async(event):
+        try:
+            return accepted(enqueue('update', film_id, operations))
+        except Exception as e:
+            return {
+                'statusCode': 500,
+                'body': json.dumps({'error': str(e)})
+            }
+
+    update, update_kwargs = compile_update(film_id, operations, expected_version)
 
     # Update the item in DynamoDB
     try:
         response = table.update_item(
             Key={'film_id': film_id},
-            UpdateExpression=update_expression,
-            ExpressionAttributeValues=expression_attribute_values,
-            ExpressionAttributeNames=expression_attribute_names,
-            ReturnValues="UPDATED_NEW"
+            ReturnValues="ALL_NEW",
+            **update_kwargs
         )
-        updated_attributes = response.get('Attributes', {})
-
-        # Convert Decimal to float for JSON serialization
-        def decimal_default(obj):
-            if isinstance(obj, Decimal):
-                return float(obj)
-            raise TypeError
+        item = response.get('Attributes', {})
+        updated_attributes = {key: value for key, value in item.items()
+                              if key in update.touched or key == 'updated_at'}
+        updated_attributes['version'] = int(item['version'])
 
         return {
             'statusCode': 200,
-            'body': json.dumps({
+            'body': dumps({
                 'message': 'Metadata updated successfully',
                 'updated_attributes': updated_attributes
-            }, default=decimal_default)
+            }),
+            'headers': {'ETag': version_etag(item['version'])}
+        }
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return _version_conflict(table, film_id)
+        return {
+            'statusCode': 500,
+            'body': json.dumps({'error': str(e)})
         }
     except Exception as e:
         return {
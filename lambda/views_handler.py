@@ -0,0 +1,213 @@
+import os
+from collections import defaultdict
+from datetime import datetime, timezone
+import boto3
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.exceptions import ClientError
+
+from film_model import coerce_year
+
+dynamodb = boto3.resource('dynamodb')
+views_table_name = os.environ['VIEWS_TABLE']
+latest_limit = int(os.environ.get('LATEST_FILMS_LIMIT', '50'))
+
+LATEST_VIEW_ID = 'latest'
+MAX_LATEST_ATTEMPTS = 5
+# Year of a film-year marker whose film is not counted under any year
+UNCOUNTED = 'none'
+
+deserializer = TypeDeserializer()
+
+
+def director_view_id(director):
+    return f'director#{director}'
+
+
+def year_view_id(year):
+    return f'year#{year}'
+
+
+def decade_view_id(year):
+    return f'decade#{year // 10 * 10}'
+
+
+def counted_year_id(film_id):
+    # Which year a film is currently counted under
+    return f'film-year#{film_id}'
+
+
+def _image(record, name):
+    image = record['dynamodb'].get(name)
+    if not image:
+        return None
+    return {key: deserializer.deserialize(value) for key, value in image.items()}
+
+
+def _added_at(record):
+    created = record['dynamodb'].get('ApproximateCreationDateTime')
+    moment = datetime.fromtimestamp(float(created), timezone.utc) if created else datetime.now(timezone.utc)
+    return moment.isoformat()
+
+
+def _summary(item):
+    return {
+        'film_id': item['film_id'],
+        'title': item.get('title'),
+        'director': item.get('director'),
+        'year': item.get('year'),
+        'updated_at': item.get('updated_at')
+    }
+
+
+def _collect(records):
+    """Fold a batch of stream records into net changes per view item."""
+    # film_id -> [year before the batch, year after it]
+    years = {}
+    # (director, film_id) -> True to add, False to remove; the last change wins
+    memberships = {}
+    latest = {}
+
+    for record in records:
+        old = _image(record, 'OldImage')
+        new = _image(record, 'NewImage')
+        film_id = (new or old)['film_id']
+
+        old_director = old.get('director') if old else None
+        new_director = new.get('director') if new else None
+        if old_director != new_director:
+            if old_director:
+                memberships[(old_director, film_id)] = False
+            if new_director:
+                memberships[(new_director, film_id)] = True
+
+        old_year = coerce_year(old.get('year')) if old else None
+        new_year = coerce_year(new.get('year')) if new else None
+        years.setdefault(film_id, [old_year, None])[1] = new_year
+
+        if record['eventName'] == 'INSERT':
+            latest[film_id] = ('add', dict(_summary(new), added_at=_added_at(record)))
+        elif record['eventName'] == 'MODIFY':
+            previous = latest.get(film_id)
+            if previous and previous[0] == 'add':
+                latest[film_id] = ('add', dict(_summary(new), added_at=previous[1]['added_at']))
+            else:
+                latest[film_id] = ('refresh', _summary(new))
+        else:
+            latest[film_id] = ('remove', None)
+
+    moves = {film_id: tuple(change) for film_id, change in years.items() if change[0] != change[1]}
+    return moves, memberships, latest
+
+
+def _count_deltas(old_year, new_year):
+    deltas = defaultdict(int)
+    if old_year is not None:
+        deltas[year_view_id(old_year)] -= 1
+        deltas[decade_view_id(old_year)] -= 1
+    if new_year is not None:
+        deltas[year_view_id(new_year)] += 1
+        deltas[decade_view_id(new_year)] += 1
+    return {view_id: delta for view_id, delta in deltas.items() if delta}
+
+
+def _move_count(table, film_id, old_year, new_year):
+    """Move one film's count from old_year to new_year, at most once.
+
+    The counters change in the same transaction as the film's film-year
+    marker, and only while the marker still shows old_year. A replayed
+    batch (the stream retries and bisects failed batches) finds the marker
+    already moved and changes nothing, where a bare ADD would count the
+    film twice. New films, and films counted before markers existed, have
+    no marker yet.
+    """
+    # A film without a year is marked as such rather than unmarked, so a
+    # replayed delete cannot pass for a film that predates the markers
+    marker = {
+        'TableName': table.name,
+        'Key': {'view_id': counted_year_id(film_id)},
+        'UpdateExpression': 'SET #year = :new',
+        'ConditionExpression': 'attribute_not_exists(#year) OR #year = :old',
+        'ExpressionAttributeNames': {'#year': 'year'},
+        'ExpressionAttributeValues': {
+            ':old': UNCOUNTED if old_year is None else old_year,
+            ':new': UNCOUNTED if new_year is None else new_year
+        }
+    }
+
+    items = [{'Update': marker}] + [{
+        'Update': {
+            'TableName': table.name,
+            'Key': {'view_id': view_id},
+            'UpdateExpression': 'ADD film_count :delta',
+            'ExpressionAttributeValues': {':delta': delta}
+        }
+    } for view_id, delta in _count_deltas(old_year, new_year).items()]
+    try:
+        table.meta.client.transact_write_items(TransactItems=items)
+    except ClientError as e:
+        reasons = [reason.get('Code') for reason in e.response.get('CancellationReasons', [])]
+        if e.response['Error']['Code'] != 'TransactionCanceledException' or 'ConditionalCheckFailed' not in reasons:
+            raise
+
+
+def _apply_counts(table, moves):
+    for film_id, (old_year, new_year) in moves.items():
+        _move_count(table, film_id, old_year, new_year)
+
+
+def _apply_memberships(table, memberships):
+    # String-set ADD/DELETE are idempotent, so a retried batch cannot skew them
+    changes = defaultdict(lambda: {True: set(), False: set()})
+    for (director, film_id), member in memberships.items():
+        changes[director][member].add(film_id)
+    for director, change in changes.items():
+        for member, action in ((True, 'ADD'), (False, 'DELETE')):
+            if change[member]:
+                table.update_item(
+                    Key={'view_id': director_view_id(director)},
+                    UpdateExpression=f'{action} film_ids :ids',
+                    ExpressionAttributeValues={':ids': change[member]}
+                )
+
+
+def _apply_latest(table, latest):
+    # The latest-N list is a single item; concurrent shards update it with
+    # optimistic locking on its version
+    for _ in range(MAX_LATEST_ATTEMPTS):
+        current = table.get_item(Key={'view_id': LATEST_VIEW_ID}, ConsistentRead=True).get('Item', {})
+        version = current.get('version', 0)
+        films = {film['film_id']: film for film in current.get('films', [])}
+        if not any(change == 'add' or film_id in films for film_id, (change, _) in latest.items()):
+            return
+
+        for film_id, (change, summary) in latest.items():
+            if change == 'add':
+                films[film_id] = summary
+            elif change == 'refresh' and film_id in films:
+                films[film_id] = dict(summary, added_at=films[film_id].get('added_at'))
+            elif change == 'remove':
+                films.pop(film_id, None)
+        newest = sorted(films.values(), key=lambda film: film.get('added_at') or '', reverse=True)
+
+        try:
+            table.put_item(
+                Item={'view_id': LATEST_VIEW_ID, 'films': newest[:latest_limit], 'version': version + 1},
+                ConditionExpression='attribute_not_exists(version) OR version = :version',
+                ExpressionAttributeValues={':version': version}
+            )
+            return
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+    raise RuntimeError('Could not update the latest films view')
+
+
+def handler(event, context):
+    # DynamoDB stream of MetaDataFilms (NEW_AND_OLD_IMAGES)
+    table = dynamodb.Table(views_table_name)
+    moves, memberships, latest = _collect(event['Records'])
+    _apply_memberships(table, memberships)
+    _apply_counts(table, moves)
+    if latest:
+        _apply_latest(table, latest)
+    return {'records': len(event['Records'])}
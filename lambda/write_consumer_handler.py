@@ -0,0 +1,215 @@
+import os
+from collections import Counter
+from decimal import Decimal
+
+import boto3
+from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
+
+import metrics
+from batch_writer import put_new_items, retry_throttled
+from film_model import change_attributes, now_iso
+from film_writes import compile_update
+from write_queue import decode_message
+
+dynamodb = boto3.resource('dynamodb')
+table_name = os.environ['METADATA_TABLE']
+
+
+def _merge_operand(operator, operand, later_operator, later_operand):
+    """Combine two operations on one attribute into one, or None if they do not fold."""
+    if later_operator in ('$set', '$remove'):
+        return later_operator, later_operand
+    if later_operator == '$inc':
+        if operator == '$inc':
+            return '$inc', operand + later_operand
+        if operator == '$set' and isinstance(operand, (int, Decimal)) and not isinstance(operand, bool):
+            return '$set', operand + later_operand
+    if later_operator == '$append':
+        if operator == '$append':
+            return '$append', operand + later_operand
+        if operator == '$set' and isinstance(operand, list):
+            return '$set', operand + later_operand
+    if later_operator in ('$addToSet', '$deleteFromSet') and operator == later_operator:
+        merged = list(operand) + [value for value in later_operand if value not in operand]
+        if len({type(value) is str for value in merged}) == 1:
+            return operator, merged
+    return None
+
+
+def _by_attribute(operations):
+    actions = {}
+    for operator, operands in operations.items():
+        if operator == '$remove':
+            for attribute in operands:
+                actions[attribute] = ('$remove', None)
+        else:
+            for attribute, operand in operands.items():
+                actions[attribute] = (operator, operand)
+    return actions
+
+
+def _to_operations(actions):
+    operations = {}
+    for attribute, (operator, operand) in actions.items():
+        if operator == '$remove':
+            operations.setdefault('$remove', []).append(attribute)
+        else:
+            operations.setdefault(operator, {})[attribute] = operand
+    return operations
+
+
+def merge_operations(first, second):
+    """Fold two updates of one film into a single update, or None if they conflict."""
+    actions = _by_attribute(first)
+    for attribute, (operator, operand) in _by_attribute(second).items():
+        if attribute in actions:
+            merged = _merge_operand(*actions[attribute], operator, operand)
+            if merged is None:
+                return None
+            actions[attribute] = merged
+        else:
+            actions[attribute] = (operator, operand)
+    return _to_operations(actions)
+
+
+def apply_operations(item, operations):
+    """Apply an update to an item that is about to be put."""
+    for attribute, (operator, operand) in _by_attribute(operations).items():
+        if operator == '$set':
+            item[attribute] = operand
+        elif operator == '$inc':
+            item[attribute] = item.get(attribute, 0) + operand
+        elif operator == '$append':
+            item[attribute] = list(item.get(attribute) or []) + operand
+        elif operator == '$addToSet':
+            item[attribute] = set(item.get(attribute) or ()) | set(operand)
+        elif operator == '$deleteFromSet':
+            remaining = set(item.get(attribute) or ()) - set(operand)
+            if remaining:
+                item[attribute] = remaining
+            else:
+                # DynamoDB drops a set emptied by DELETE
+                item.pop(attribute, None)
+        else:
+            item.pop(attribute, None)
+    return item
+
+
+def _add_update(writes, message_id, operations):
+    last = writes[-1] if writes and 'update' in writes[-1] else None
+    merged = merge_operations(last['update'], operations) if last else None
+    if merged is not None:
+        last['update'] = merged
+        last['message_ids'].append(message_id)
+    else:
+        writes.append({'update': operations, 'message_ids': [message_id]})
+
+
+def plan_writes(messages):
+    """Coalesce queued writes into as few writes per film as possible.
+
+    Returns {film_id: [write]} in queue order, each write being
+    {'put': item, 'then': [write]} or {'update': operations} plus the ids of
+    the messages it covers. A create absorbs the updates after it into its
+    item; they are kept under 'then' as well, because a create of a film
+    that already exists is rejected and they then apply to that film.
+    """
+    plan = {}
+    for message_id, message in messages:
+        writes = plan.setdefault(message['film_id'], [])
+        last = writes[-1] if writes else None
+        if message['op'] == 'create':
+            writes.append({'put': message['payload'], 'then': [], 'message_ids': [message_id]})
+        elif last and 'put' in last:
+            apply_operations(last['put'], message['payload'])
+            _add_update(last['then'], message_id, message['payload'])
+            last['message_ids'].append(message_id)
+        else:
+            _add_update(writes, message_id, message['payload'])
+    return plan
+
+
+def _stamp(item):
+    # Stamped at write time so the change feed sees it after its settle window
+    item.update(change_attributes(item['film_id'], now_iso()))
+    return item
+
+
+def _put_films(puts):
+    """Store coalesced creates; returns (existing film_ids, film_ids that failed).
+
+    Each create is a conditional PutItem (BatchWriteItem cannot carry the
+    not-exists condition), retried with backoff when throttled.
+    """
+    items = [_stamp(write['put']) for write in puts]
+    existing, errors = put_new_items(table_name, items, 'film_id')
+    for item, e in errors:
+        print(f'Create of {item["film_id"]} failed: {e}')
+    return [item['film_id'] for item in existing], {item['film_id'] for item, _ in errors}
+
+
+def _put_film(table, film_id, write, counts):
+    """Create one film; returns the message ids left to retry."""
+    try:
+        retry_throttled(table.put_item, Item=_stamp(write['put']),
+                        ConditionExpression=Attr('film_id').not_exists())
+        return []
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            print(f'Create of {film_id} failed: {e}')
+            return list(write['message_ids'])
+    # The film already exists: the updates queued after the create apply to it
+    counts['QueuedCreatesOfExistingFilms'] += 1
+    return _update_film(table, film_id, write['then'], counts)
+
+
+def _update_film(table, film_id, writes, counts):
+    """Apply a film's writes in order; returns the message ids left to retry."""
+    for position, write in enumerate(writes):
+        if 'put' in write:
+            retry = _put_film(table, film_id, write, counts)
+            if retry:
+                return retry + [id_ for later in writes[position + 1:] for id_ in later['message_ids']]
+            continue
+        _, kwargs = compile_update(film_id, write['update'])
+        try:
+            retry_throttled(table.update_item, Key={'film_id': film_id}, **kwargs)
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                # The film does not exist; retrying will not change that
+                counts['QueuedUpdatesOfMissingFilms'] += 1
+                continue
+            print(f'Update of {film_id} failed: {e}')
+            return [id_ for later in writes[position:] for id_ in later['message_ids']]
+    return []
+
+
+def handler(event, context):
+    # SQS FIFO batch of queued creates and updates (ReportBatchItemFailures)
+    messages = [(record['messageId'], decode_message(record['body'])) for record in event['Records']]
+    plan = plan_writes(messages)
+    table = dynamodb.Table(table_name)
+
+    retry = []
+    counts = Counter()
+    # Films whose only write is a create are put together; anything else
+    # runs in order per film
+    puts = {film_id: writes[0] for film_id, writes in plan.items()
+            if len(writes) == 1 and 'put' in writes[0]}
+    if puts:
+        existing, failed = _put_films(list(puts.values()))
+        for film_id in failed:
+            retry.extend(puts[film_id]['message_ids'])
+        counts['QueuedCreatesOfExistingFilms'] += len(existing)
+        for film_id in existing:
+            retry.extend(_update_film(table, film_id, puts[film_id]['then'], counts))
+    for film_id, writes in plan.items():
+        if film_id not in puts:
+            retry.extend(_update_film(table, film_id, writes, counts))
+
+    metrics.emit(dict(counts, QueuedWrites=len(messages),
+                      CoalescedWrites=sum(len(writes) for writes in plan.values()),
+                      RetriedQueuedWrites=len(retry)),
+                 dimensions={'Consumer': 'writes'})
+    return {'batchItemFailures': [{'itemIdentifier': message_id} for message_id in retry]}
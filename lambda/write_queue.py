@@ -0,0 +1,61 @@
+import json
+import os
+import uuid
+
+import boto3
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+
+from http_encoding import header
+
+sqs = boto3.client('sqs')
+queue_url = os.environ.get('WRITE_QUEUE_URL')
+# 'async' queues every write that can be queued; 'sync' (the default) only
+# those sent with `Prefer: respond-async`
+write_mode = os.environ.get('WRITE_MODE', 'sync')
+
+serializer = TypeSerializer()
+deserializer = TypeDeserializer()
+
+
+def wants_async(event):
+    if not queue_url:
+        return False
+    prefer = (header(event, 'Prefer') or '').lower()
+    return write_mode == 'async' or 'respond-async' in prefer
+
+
+def encode_message(message):
+    # DynamoDB's wire format keeps Decimals exact and sets as sets
+    return json.dumps(serializer.serialize(message))
+
+
+def decode_message(body):
+    return deserializer.deserialize(json.loads(body))
+
+
+def enqueue(op, film_id, payload):
+    """Queue a write for the consumer; returns its request id.
+
+    Messages of one film share a FIFO message group, so they are applied
+    in the order they were accepted.
+    """
+    request_id = uuid.uuid4().hex
+    sqs.send_message(
+        QueueUrl=queue_url,
+        MessageBody=encode_message({
+            'request_id': request_id,
+            'op': op,
+            'film_id': film_id,
+            'payload': payload
+        }),
+        MessageGroupId=film_id,
+        MessageDeduplicationId=request_id
+    )
+    return request_id
+
+
+def accepted(request_id):
+    return {
+        'statusCode': 202,
+        'body': json.dumps({'message': 'Write accepted', 'request_id': request_id})
+    }
@@ -0,0 +1,74 @@
+import os
+import sys
+
+import pytest
+from botocore.exceptions import ClientError
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, "lambda"))
+
+import batch_writer  # noqa: E402
+
+
+def _error(code):
+    return ClientError({"Error": {"Code": code, "Message": code}}, "PutItem")
+
+
+class FlakyTable:
+    """Answers each put with the next outcome: an error code, or None for success."""
+
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.puts = 0
+
+    def put_item(self, **kwargs):
+        self.puts += 1
+        outcome = self.outcomes.pop(0) if self.outcomes else None
+        if outcome:
+            raise _error(outcome)
+
+
+@pytest.fixture
+def table(monkeypatch):
+    holder = {}
+
+    class Resource:
+        def Table(self, name):
+            return holder["table"]
+
+    monkeypatch.setattr(batch_writer, "dynamodb", Resource())
+    monkeypatch.setattr(batch_writer.time, "sleep", lambda seconds: None)
+
+    def make(outcomes):
+        holder["table"] = FlakyTable(outcomes)
+        return holder["table"]
+    return make
+
+
+def test_throttled_puts_are_retried(table):
+    flaky = table(["ProvisionedThroughputExceededException", "ThrottlingException"])
+
+    existing, errors = batch_writer.put_new_items("Films", [{"film_id": "f1"}], "film_id")
+
+    assert (existing, errors) == ([], [])
+    assert flaky.puts == 3
+
+
+def test_existing_items_are_reported_not_retried(table):
+    flaky = table(["ConditionalCheckFailedException"])
+
+    existing, errors = batch_writer.put_new_items("Films", [{"film_id": "f1"}], "film_id")
+
+    assert existing == [{"film_id": "f1"}]
+    assert errors == []
+    assert flaky.puts == 1
+
+
+def test_throttling_gives_up_after_max_attempts(table):
+    flaky = table(["ThrottlingException"] * batch_writer.MAX_ATTEMPTS)
+
+    existing, errors = batch_writer.put_new_items("Films", [{"film_id": "f1"}], "film_id")
+
+    assert existing == []
+    assert [e.response["Error"]["Code"] for _, e in errors] == ["ThrottlingException"]
+    assert flaky.puts == batch_writer.MAX_ATTEMPTS
@@ -0,0 +1,44 @@
+import os
+import sys
+from decimal import Decimal
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, "lambda"))
+
+import client_table  # noqa: E402
+
+
+def test_wire_format_decodes_to_json_ready_values():
+    item = {
+        "film_id": {"S": "f1"},
+        "year": {"N": "2024"},
+        "rating": {"N": "7.25"},
+        "precise": {"N": "0.12345678901234567890"},
+        "views": {"N": "123456789012345678901234567890"},
+        "genres": {"SS": ["noir", "drama"]},
+        "cover": {"B": b"\x00\x01"},
+        "credits": {"M": {"cast": {"L": [{"S": "A"}, {"NULL": True}, {"BOOL": False}]}}},
+    }
+
+    decoded = client_table.decode_item(item)
+
+    assert decoded == {
+        "film_id": "f1",
+        "year": 2024,
+        "rating": 7.25,
+        "precise": Decimal("0.12345678901234567890"),
+        "views": Decimal("123456789012345678901234567890"),
+        "genres": ["drama", "noir"],
+        "cover": "AAE=",
+        "credits": {"cast": ["A", None, False]},
+    }
+    assert type(decoded["year"]) is int
+
+
+def test_keys_round_trip_through_the_wire_format():
+    key = {"film_id": "f1", "year": Decimal("2024"), "rank": 7.25}
+
+    encoded = client_table.encode_item(key)
+
+    assert encoded == {"film_id": {"S": "f1"}, "year": {"N": "2024"}, "rank": {"N": "7.25"}}
+    assert client_table.decode_item(encoded) == key
@@ -13,3 +13,59 @@ def test_sqs_queue_created():
 #     template.has_resource_properties("AWS::SQS::Queue", {
 #         "VisibilityTimeout": 300
 #     })
+
+
+def test_films_listing_route_created():
+    app = core.App()
+    stack = FilmContentManagementStack(app, "film-content-management")
+    template = assertions.Template.from_stack(stack)
+
+    template.resource_properties_count_is("AWS::ApiGateway::Method", {
+        "HttpMethod": "GET"
+    }, 9)
+
+
+def test_film_head_route_created():
+    app = core.App()
+    stack = FilmContentManagementStack(app, "film-content-management")
+    template = assertions.Template.from_stack(stack)
+
+    template.has_resource_properties("AWS::ApiGateway::Method", {
+        "HttpMethod": "HEAD"
+    })
+
+
+def test_metadata_table_has_browse_indexes():
+    app = core.App()
+    stack = FilmContentManagementStack(app, "film-content-management")
+    template = assertions.Template.from_stack(stack)
+
+    template.has_resource_properties("AWS::DynamoDB::Table", {
+        "TableName": "MetaDataFilms",
+        "GlobalSecondaryIndexes": assertions.Match.array_with([
+            assertions.Match.object_like({"IndexName": "director-title-index"}),
+            assertions.Match.object_like({"IndexName": "year-title-index"})
+        ])
+    })
+
+
+def test_idempotency_table_expires_records():
+    app = core.App()
+    stack = FilmContentManagementStack(app, "film-content-management")
+    template = assertions.Template.from_stack(stack)
+
+    template.has_resource_properties("AWS::DynamoDB::Table", {
+        "TableName": "FilmIdempotency",
+        "TimeToLiveSpecification": {"AttributeName": "expires_at", "Enabled": True}
+    })
+
+
+def test_api_compresses_responses():
+    app = core.App()
+    stack = FilmContentManagementStack(app, "film-content-management")
+    template = assertions.Template.from_stack(stack)
+
+    template.has_resource_properties("AWS::ApiGateway::RestApi", {
+        "MinimumCompressionSize": 1024,
+        "BinaryMediaTypes": ["*/*"]
+    })
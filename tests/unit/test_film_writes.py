@@ -0,0 +1,45 @@
+import os
+import sys
+from decimal import Decimal
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, "lambda"))
+
+from film_writes import compile_update, parse_operations  # noqa: E402
+
+
+def test_metadata_merges_into_set_without_server_fields():
+    operations, error = parse_operations({
+        "metadata": {"title": "A", "version": 7, "updated_at": "x"},
+        "$set": {"year": Decimal("1999")},
+        "$inc": {"views": 1},
+    })
+
+    assert error is None
+    assert operations == {"$set": {"title": "A", "year": 1999}, "$inc": {"views": 1}}
+    assert type(operations["$set"]["year"]) is int
+
+
+@pytest.mark.parametrize("body, error", [
+    ({}, "No metadata provided for update"),
+    ({"metadata": {"content_key": "content/sha256/x"}}, "No metadata provided for update"),
+    ({"$set": {"year": "soon"}}, "year must be an integer"),
+    ({"$set": {"title": 5}}, "title must be a string"),
+    ({"$inc": {"year": 1}}, "year can only be replaced"),
+    ({"$remove": ["film_id"]}, "film_id cannot be modified"),
+])
+def test_invalid_patches_are_rejected(body, error):
+    assert parse_operations(body) == (None, error)
+
+
+def test_compiled_update_bumps_the_version_at_the_expected_one():
+    operations, _ = parse_operations({"$set": {"title": "A"}})
+
+    _, kwargs = compile_update("f1", operations, expected_version=3)
+
+    assert kwargs["UpdateExpression"].startswith("SET #a0 = :v0, #a1 = :v1")
+    assert "ADD #a4 :v4" in kwargs["UpdateExpression"]
+    assert kwargs["ConditionExpression"] == "attribute_exists(film_id) AND #a5 = :v5"
+    assert kwargs["ExpressionAttributeNames"]["#a5"] == "version"
+    assert kwargs["ExpressionAttributeValues"][":v5"] == 3
@@ -0,0 +1,156 @@
+import json
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+import boto3
+import pytest
+from moto import mock_aws
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("METADATA_TABLE", "MetaDataFilms")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, "lambda"))
+
+
+def _index(name, partition, sort):
+    return {"IndexName": name,
+            "KeySchema": [{"AttributeName": partition, "KeyType": "HASH"},
+                          {"AttributeName": sort, "KeyType": "RANGE"}],
+            "Projection": {"ProjectionType": "ALL"}}
+
+
+def _timestamp(moment):
+    return moment.strftime("%Y-%m-%dT%H:%M:%S.%f+00:00")
+
+
+@pytest.fixture
+def films(monkeypatch):
+    with mock_aws():
+        boto3.client("dynamodb").create_table(
+            TableName="MetaDataFilms",
+            KeySchema=[{"AttributeName": "film_id", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": name, "AttributeType": kind} for name, kind in (
+                ("film_id", "S"), ("director", "S"), ("title", "S"), ("year", "N"),
+                ("change_day", "S"), ("change_seq", "S"))],
+            GlobalSecondaryIndexes=[_index("director-title-index", "director", "title"),
+                                    _index("year-title-index", "year", "title"),
+                                    _index("changes-index", "change_day", "change_seq")],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        import cache
+        import client_table
+        import film_model
+        import get_film_handler
+        monkeypatch.setattr(client_table, "dynamodb", boto3.client("dynamodb"))
+        monkeypatch.setattr(get_film_handler, "film_cache", cache.TTLCache(ttl_seconds=30, max_entries=100))
+
+        # Changed an hour ago, a minute apart, so all of them are settled
+        changed = datetime.now(timezone.utc) - timedelta(hours=1)
+        table = boto3.resource("dynamodb").Table("MetaDataFilms")
+        for number in range(12):
+            film_id = f"f{number:02}"
+            item = film_model.build_item({"film_id": film_id, "title": f"Title {number:02}",
+                                          "director": "Varda" if number % 3 == 0 else "Godard",
+                                          "year": 1960 + number % 4})
+            item.update(film_model.change_attributes(film_id, _timestamp(changed + timedelta(minutes=number))))
+            table.put_item(Item=item)
+        yield get_film_handler
+
+
+def _get(handler, resource="/films", params=None, path=None, method="GET", headers=None, body=None):
+    response = handler.handler({"resource": resource, "httpMethod": method, "queryStringParameters": params,
+                                "pathParameters": path, "headers": headers, "body": body}, None)
+    return response["statusCode"], json.loads(response["body"]) if response["body"] else None, response
+
+
+def test_listing_pages_through_every_film(films):
+    film_ids = []
+    params = {"limit": "5"}
+    while True:
+        status, body, _ = _get(films, params=params)
+        assert status == 200
+        film_ids += [item["film_id"] for item in body["items"]]
+        if not body["next_token"]:
+            break
+        params = {"limit": "5", "next_token": body["next_token"]}
+
+    assert sorted(film_ids) == [f"f{number:02}" for number in range(12)]
+
+
+def test_film_hides_change_feed_keys_and_answers_conditional_requests(films):
+    status, body, response = _get(films, "/films/{film_id}", path={"film_id": "f01"})
+
+    assert status == 200
+    assert body["title"] == "Title 01"
+    assert "change_day" not in body and "change_seq" not in body
+    etag = response["headers"]["ETag"]
+    assert etag == '"v1"'
+
+    status, body, response = _get(films, "/films/{film_id}", path={"film_id": "f01"}, method="HEAD")
+    assert (status, body, response["headers"]["ETag"]) == (200, None, etag)
+
+    status, _, _ = _get(films, "/films/{film_id}", path={"film_id": "f01"}, headers={"If-None-Match": etag})
+    assert status == 304
+    status, body, _ = _get(films, "/films/{film_id}", path={"film_id": "nope"})
+    assert (status, body) == (404, {"error": "Film not found"})
+
+
+def test_director_and_year_queries_use_their_indexes(films):
+    status, body, _ = _get(films, params={"director": "Varda"})
+    assert status == 200
+    assert [item["title"] for item in body["items"]] == ["Title 00", "Title 03", "Title 06", "Title 09"]
+
+    titles = []
+    params = {"year_from": "1961", "year_to": "1962", "limit": "4"}
+    while True:
+        status, body, _ = _get(films, params=params)
+        assert status == 200
+        titles += [item["title"] for item in body["items"]]
+        if not body["next_token"]:
+            break
+        params = dict(params, next_token=body["next_token"])
+    assert titles == ["Title 01", "Title 05", "Title 09", "Title 02", "Title 06", "Title 10"]
+
+    status, body, _ = _get(films, params={"year_from": "1961"})
+    assert status == 400
+
+
+def test_batch_reads_keep_request_order(films):
+    status, body, _ = _get(films, params={"ids": "f03,missing,f01", "fields": "title"})
+
+    assert status == 200
+    assert body["items"] == [{"film_id": "f03", "title": "Title 03"},
+                             {"film_id": "missing", "error": "Film not found"},
+                             {"film_id": "f01", "title": "Title 01"}]
+
+    status, body, _ = _get(films, "/films:batchGet", method="POST",
+                           body=json.dumps({"ids": ["f02", "f04"]}))
+    assert status == 200
+    assert [item["film_id"] for item in body["items"]] == ["f02", "f04"]
+    assert all("change_seq" not in item for item in body["items"])
+
+
+def test_change_feed_merges_shards_in_change_order(films):
+    status, body, _ = _get(films, "/films/changes")
+    assert status == 200 and body["items"] == [] and not body["has_more"]
+
+    since = films.encode_token({"seq": _timestamp(datetime.now(timezone.utc) - timedelta(days=2))})
+    film_ids = []
+    while True:
+        status, body, _ = _get(films, "/films/changes", params={"since": since, "limit": "5"})
+        assert status == 200
+        film_ids += [item["film_id"] for item in body["items"]]
+        assert all("change_day" not in item for item in body["items"])
+        since = body["next_cursor"]
+        if not body["has_more"]:
+            break
+
+    assert film_ids == [f"f{number:02}" for number in range(12)]
+
+
+def test_change_feed_rejects_cursors_past_retention(films):
+    since = films.encode_token({"seq": _timestamp(datetime.now(timezone.utc) - timedelta(days=45))})
+
+    status, _, _ = _get(films, "/films/changes", params={"since": since})
+
+    assert status == 410
@@ -0,0 +1,41 @@
+import base64
+import gzip
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, "lambda"))
+
+import http_encoding  # noqa: E402
+
+
+def _event(accept_encoding):
+    return {"headers": {"accept-encoding": accept_encoding}}
+
+
+def test_large_bodies_are_gzipped_for_clients_that_accept_it():
+    body = json.dumps({"items": [{"title": "Film", "year": 2024}] * 200})
+    response = {"statusCode": 200, "body": body, "headers": {"ETag": '"abc"'}}
+
+    encoded = http_encoding.encode_response(_event("deflate, gzip;q=0.8"), response)
+
+    assert encoded["isBase64Encoded"] is True
+    assert encoded["headers"]["Content-Encoding"] == "gzip"
+    assert encoded["headers"]["ETag"] == 'W/"abc"'
+    assert encoded["headers"]["Vary"] == "Accept-Encoding"
+    assert gzip.decompress(base64.b64decode(encoded["body"])).decode("utf-8") == body
+
+
+def test_small_or_refused_bodies_are_sent_as_is():
+    small = {"statusCode": 200, "body": '{"ok":true}'}
+    large = {"statusCode": 200, "body": "x" * 4096}
+
+    assert http_encoding.encode_response(_event("gzip"), small)["body"] == small["body"]
+    assert "Content-Encoding" not in http_encoding.encode_response(_event("gzip;q=0, br;q=0"), large)["headers"]
+    assert http_encoding.negotiate(None) is None
+
+
+def test_base64_request_bodies_are_decoded():
+    event = {"body": base64.b64encode(b'{"title": "Film"}').decode("ascii"), "isBase64Encoded": True}
+
+    assert http_encoding.request_body(event) == '{"title": "Film"}'
@@ -0,0 +1,136 @@
+import os
+import struct
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, "lambda"))
+
+from media_probe import BufferedReader, ProbeError, probe  # noqa: E402
+
+
+def reader_for(data, block_size=64):
+    return BufferedReader(lambda offset, length: data[offset:offset + length], len(data), block_size)
+
+
+def box(kind, payload=b""):
+    return struct.pack(">I4s", 8 + len(payload), kind.encode("latin-1")) + payload
+
+
+def full_box(kind, payload, version=0):
+    return box(kind, bytes([version, 0, 0, 0]) + payload)
+
+
+def mp4_track(handler, codec, timescale, duration, width=0, height=0):
+    tkhd = full_box("tkhd", bytes(76) + struct.pack(">II", width << 16, height << 16))
+    mdhd = full_box("mdhd", struct.pack(">IIII", 0, 0, timescale, duration) + bytes(4))
+    hdlr = full_box("hdlr", bytes(4) + handler.encode() + bytes(12) + b"\0")
+    entry = box(codec, bytes(8) + bytes(16) + struct.pack(">HH", width, height) + bytes(50))
+    stsd = full_box("stsd", struct.pack(">I", 1) + entry)
+    minf = box("minf", box("stbl", stsd))
+    return box("trak", tkhd + box("mdia", mdhd + hdlr + minf))
+
+
+def mp4_file(moov_last=False, mdat_size=100000):
+    mvhd = full_box("mvhd", struct.pack(">IIII", 0, 0, 1000, 90500) + bytes(80))
+    moov = box("moov", mvhd + mp4_track("vide", "avc1", 24000, 2172000, 1920, 1080)
+               + mp4_track("soun", "mp4a", 48000, 4344000))
+    ftyp = box("ftyp", b"isom" + bytes(4) + b"isomavc1")
+    mdat = struct.pack(">I4s", 8 + mdat_size, b"mdat") + bytes(mdat_size)
+    return ftyp + (mdat + moov if moov_last else moov + mdat)
+
+
+def ebml_id(element_id):
+    length = (element_id.bit_length() + 7) // 8
+    return element_id.to_bytes(length, "big")
+
+
+def element(element_id, payload):
+    size = len(payload)
+    if size < 0x7F:
+        encoded = bytes([0x80 | size])
+    else:
+        encoded = (0x10 << 24 | size).to_bytes(4, "big")
+    return ebml_id(element_id) + encoded + payload
+
+
+def uint(element_id, value):
+    return element(element_id, value.to_bytes(max(1, (value.bit_length() + 7) // 8), "big"))
+
+
+def mkv_file(doc_type=b"matroska", with_seek_head=False, clusters_first=False):
+    header = element(0x1A45DFA3, element(0x4282, doc_type))
+    info = element(0x1549A966, uint(0x2AD7B1, 1000000) + element(0x4489, struct.pack(">d", 7250.0)))
+    video = element(0xAE, uint(0x83, 1) + element(0x86, b"V_VP9")
+                    + element(0xE0, uint(0xB0, 3840) + uint(0xBA, 2160)))
+    audio = element(0xAE, uint(0x83, 2) + element(0x86, b"A_OPUS"))
+    tracks = element(0x1654AE6B, video + audio)
+    cluster = element(0x1F43B675, bytes(5000))
+    if clusters_first:
+        def seek_head(info_position):
+            return element(0x114D9B74, b"".join(
+                element(0x4DBB, element(0x53AB, ebml_id(target)) + element(0x53AC, struct.pack(">I", position)))
+                for target, position in ((0x1549A966, info_position), (0x1654AE6B, info_position + len(info)))
+            ))
+        # Positions are relative to the segment payload; the SeekHead's own
+        # size does not depend on them
+        info_position = len(seek_head(0)) + len(cluster)
+        body = seek_head(info_position) + cluster + info + tracks
+    else:
+        body = info + tracks + cluster
+    return header + element(0x18538067, body)
+
+
+def test_mp4_header_before_media_data():
+    data = mp4_file()
+    result = probe(reader_for(data))
+
+    assert result["container"] == "mp4"
+    assert result["duration_seconds"] == 90.5
+    assert (result["width"], result["height"]) == (1920, 1080)
+    assert result["video_codec"] == "h264"
+    assert result["audio_codecs"] == ["aac"]
+    assert result["size"] == len(data)
+    assert result["bitrate"] == int(len(data) * 8 / 90.5)
+
+
+def test_mp4_moov_after_mdat_skips_media_data():
+    data = mp4_file(moov_last=True, mdat_size=1000000)
+    reader = reader_for(data, block_size=4096)
+
+    result = probe(reader)
+
+    assert result["video_codec"] == "h264"
+    assert reader.reads <= 4
+
+
+def test_matroska_tracks_and_duration():
+    result = probe(reader_for(mkv_file()))
+
+    assert result["container"] == "matroska"
+    assert result["duration_seconds"] == 7.25
+    assert (result["width"], result["height"]) == (3840, 2160)
+    assert result["video_codec"] == "vp9"
+    assert result["audio_codecs"] == ["opus"]
+
+
+def test_webm_header_found_through_seek_head():
+    result = probe(reader_for(mkv_file(doc_type=b"webm", clusters_first=True)))
+
+    assert result["container"] == "webm"
+    assert result["video_codec"] == "vp9"
+    assert result["duration_seconds"] == 7.25
+
+
+def test_unrecognized_container():
+    with pytest.raises(ProbeError):
+        probe(reader_for(b"GIF89a" + bytes(100)))
+
+
+def test_truncated_mp4_header():
+    # mvhd declares less than its timescale and duration fields need
+    moov = box("moov", full_box("mvhd", bytes(6)))
+    data = box("ftyp", b"isom" + bytes(4)) + moov
+
+    with pytest.raises(ProbeError):
+        probe(reader_for(data))
@@ -0,0 +1,75 @@
+import os
+import sys
+
+import boto3
+import pytest
+from moto import mock_aws
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, "lambda"))
+
+
+@pytest.fixture
+def search_index(monkeypatch):
+    with mock_aws():
+        boto3.client("dynamodb").create_table(
+            TableName="FilmSearchRanks",
+            KeySchema=[{"AttributeName": "token", "KeyType": "HASH"},
+                       {"AttributeName": "rank", "KeyType": "RANGE"}],
+            AttributeDefinitions=[{"AttributeName": "token", "AttributeType": "S"},
+                                  {"AttributeName": "rank", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        import search_index
+        monkeypatch.setattr(search_index, "dynamodb", boto3.resource("dynamodb"))
+        monkeypatch.setattr(search_index, "PROBE_LIMIT", 5)
+        table = search_index.dynamodb.Table("FilmSearchRanks")
+        with table.batch_writer() as batch:
+            for number in range(40):
+                title = f"The Story {number}" if number % 10 else f"The Last Story {number}"
+                for entry in search_index.index_entries({"film_id": f"f{number:02}", "title": title,
+                                                         "director": "Someone"}).values():
+                    batch.put_item(Item=entry)
+        yield search_index
+
+
+def test_common_words_do_not_truncate_matches(search_index):
+    results, next_state = search_index.search("the story last", 10)
+
+    assert [result["film_id"] for result in results] == ["f00", "f10", "f20", "f30"]
+    assert results[0]["score"] == 24
+    assert next_state is None
+
+
+def test_single_word_pages_follow_rank_order(search_index):
+    film_ids = []
+    state = None
+    while True:
+        results, state = search_index.search("story", 15, state)
+        assert len(results) <= 15
+        film_ids += [result["film_id"] for result in results]
+        if state is None:
+            break
+
+    assert len(film_ids) == 40
+    # Whole-word title matches rank by title: "The Last Story ..." before "The Story ..."
+    assert film_ids[:4] == ["f00", "f10", "f20", "f30"]
+
+
+def test_multi_word_pages_cap_the_entries_read(search_index, monkeypatch):
+    monkeypatch.setattr(search_index, "MAX_CANDIDATES", 12)
+
+    results, state = search_index.search("story someone", 50)
+
+    assert len(results) == 12
+    assert state is not None
+    rest, state = search_index.search("story someone", 50, state)
+    assert len(rest) == 12
+    assert not {result["film_id"] for result in results} & {result["film_id"] for result in rest}
+
+
+def test_foreign_state_is_rejected(search_index):
+    _, state = search_index.search("story", 5)
+
+    with pytest.raises(search_index.InvalidPageRequest):
+        search_index.search("last", 5, state)
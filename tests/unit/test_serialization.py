@@ -0,0 +1,59 @@
+import json
+import os
+import sys
+from decimal import Decimal
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, "lambda"))
+
+import serialization  # noqa: E402
+
+ENCODERS = ["json"] + (["orjson"] if serialization._fragments else [])
+
+
+@pytest.mark.parametrize("encoder", ENCODERS)
+def test_dynamodb_values_are_encoded_losslessly(encoder):
+    item = {
+        "year": Decimal("2024"),
+        "rating": Decimal("7.25"),
+        "genres": {"noir", "drama"},
+        "title": "Amélie"
+    }
+
+    encoded = serialization.dumps(item, sort_keys=True, encoder=encoder)
+
+    assert encoded == '{"genres":["drama","noir"],"rating":7.25,"title":"Amélie","year":2024}'
+    assert json.loads(encoded)["year"] == 2024
+
+
+def test_encoders_agree():
+    item = {"film_id": "f1", "year": Decimal("1999"), "score": Decimal("0.5"), "tags": {"a"}}
+
+    outputs = {serialization.dumps(item, sort_keys=True, encoder=encoder) for encoder in ENCODERS}
+
+    assert len(outputs) == 1
+
+
+@pytest.mark.parametrize("encoder", ENCODERS)
+def test_decimals_keep_their_exact_digits(encoder):
+    item = {
+        "price": Decimal("0.1000000000000000055511151231257827"),
+        "ratio": Decimal("2.50"),
+        "views": Decimal("123456789012345678901234567890"),
+        "negative": Decimal("-18446744073709551617")
+    }
+
+    encoded = serialization.dumps(item, sort_keys=True, encoder=encoder)
+
+    assert encoded == ('{"negative":-18446744073709551617,"price":0.1000000000000000055511151231257827,'
+                       '"ratio":2.50,"views":123456789012345678901234567890}')
+    assert json.loads(encoded, parse_float=Decimal)["price"] == item["price"]
+
+
+def test_orjson_without_fragments_falls_back_to_json(monkeypatch):
+    monkeypatch.setattr(serialization, "_fragments", False)
+
+    assert serialization.dumps({"ratio": Decimal("2.50")}, encoder="auto") == '{"ratio":2.50}'
+    with pytest.raises(RuntimeError):
+        serialization.dumps({}, encoder="orjson")
@@ -0,0 +1,61 @@
+import os
+import re
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, "lambda"))
+
+from update_expression import InvalidUpdate, UpdateBuilder  # noqa: E402
+
+
+def test_operations_compile_to_one_expression_with_placeholders():
+    update = UpdateBuilder()
+    update.apply({
+        "$remove": ["tagline"],
+        "$inc": {"views": 1},
+        "$set": {"name": "x"},
+        "$addToSet": {"genres": ["noir"]},
+    })
+
+    kwargs = update.kwargs()
+
+    # Actions group by keyword whatever order the operators came in
+    assert kwargs["UpdateExpression"] == "SET #a0 = :v0 ADD #a1 :v1, #a3 :v2 REMOVE #a2"
+    assert kwargs["ExpressionAttributeNames"] == {"#a0": "name", "#a1": "views", "#a2": "tagline",
+                                                  "#a3": "genres"}
+    assert kwargs["ExpressionAttributeValues"] == {":v0": "x", ":v1": 1, ":v2": {"noir"}}
+
+
+def test_append_and_set_default_start_from_missing_attributes():
+    update = UpdateBuilder()
+    update.append("cast", ["A"])
+    update.set_default("created_at", "2026-01-01")
+
+    assert update.expression() == ("SET #a0 = list_append(if_not_exists(#a0, :v0), :v1), "
+                                   "#a1 = if_not_exists(#a1, :v2)")
+    assert update.values == {":v0": [], ":v1": ["A"], ":v2": "2026-01-01"}
+
+
+def test_condition_names_do_not_count_as_updates():
+    update = UpdateBuilder()
+    update.name("version")
+
+    assert update.empty
+    assert "ExpressionAttributeValues" not in update.kwargs()
+
+
+@pytest.mark.parametrize("operations, message", [
+    ({"$set": {"film_id": "other"}}, "film_id cannot be modified"),
+    ({"$inc": {"title": 1}}, "title can only be replaced"),
+    ({"$set": {"views": 1}, "$inc": {"views": 1}}, "views appears in more than one operation"),
+    ({"$inc": {"views": "1"}}, "$inc.views must be a number"),
+    ({"$addToSet": {"genres": ["noir", 1]}}, "$addToSet.genres values must be all strings or all numbers"),
+    ({"$append": {"cast": []}}, "$append.cast needs a non-empty list"),
+    ({"$remove": "tagline"}, "$remove must be a list of attribute names"),
+])
+def test_invalid_operations_are_rejected(operations, message):
+    update = UpdateBuilder(protected=("film_id",), set_only=("title",))
+
+    with pytest.raises(InvalidUpdate, match=re.escape(message)):
+        update.apply(operations)
@@ -0,0 +1,69 @@
+import os
+import sys
+
+import boto3
+import pytest
+from boto3.dynamodb.types import TypeSerializer
+from moto import mock_aws
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("VIEWS_TABLE", "FilmViews")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, "lambda"))
+
+serializer = TypeSerializer()
+
+
+def _record(event_name, old=None, new=None):
+    images = {}
+    if old:
+        images["OldImage"] = {key: serializer.serialize(value) for key, value in old.items()}
+    if new:
+        images["NewImage"] = {key: serializer.serialize(value) for key, value in new.items()}
+    return {"eventName": event_name, "dynamodb": dict(images, ApproximateCreationDateTime=1700000000)}
+
+
+@pytest.fixture
+def views():
+    with mock_aws():
+        boto3.client("dynamodb").create_table(
+            TableName="FilmViews",
+            KeySchema=[{"AttributeName": "view_id", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "view_id", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        import views_handler
+        views_handler.dynamodb = boto3.resource("dynamodb")
+        yield views_handler
+
+
+def _count(views, view_id):
+    item = views.dynamodb.Table("FilmViews").get_item(Key={"view_id": view_id}).get("Item", {})
+    return item.get("film_count", 0)
+
+
+def test_replayed_batches_do_not_skew_year_counts(views):
+    film = {"film_id": "f1", "title": "T", "director": "D", "year": 1994}
+    moved = dict(film, year=2001)
+    batch = [
+        _record("INSERT", new=film),
+        _record("INSERT", new=dict(film, film_id="f2")),
+        _record("MODIFY", old=film, new=moved),
+    ]
+
+    views.handler({"Records": batch}, None)
+    # The stream retries the whole batch, then each half of it
+    views.handler({"Records": batch}, None)
+    views.handler({"Records": batch[:1]}, None)
+    views.handler({"Records": batch[1:]}, None)
+
+    assert _count(views, "year#1994") == 1
+    assert _count(views, "year#2001") == 1
+    assert _count(views, "decade#1990") == 1
+    assert _count(views, "decade#2000") == 1
+
+    delete = [_record("REMOVE", old=moved)]
+    views.handler({"Records": delete}, None)
+    views.handler({"Records": delete}, None)
+
+    assert _count(views, "year#2001") == 0
+    assert _count(views, "decade#2000") == 0
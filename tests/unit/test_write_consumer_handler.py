@@ -0,0 +1,70 @@
+import os
+import sys
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("METADATA_TABLE", "MetaDataFilms")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, "lambda"))
+
+from write_consumer_handler import merge_operations, plan_writes  # noqa: E402
+
+
+def test_later_set_and_remove_replace_earlier_operations():
+    merged = merge_operations({"$inc": {"views": 1}, "$set": {"title": "A"}},
+                              {"$set": {"views": 10}, "$remove": ["title"]})
+
+    assert merged == {"$set": {"views": 10}, "$remove": ["title"]}
+
+
+def test_increments_and_appends_fold_into_earlier_values():
+    merged = merge_operations({"$inc": {"views": 2}, "$set": {"cast": ["A"]}},
+                              {"$inc": {"views": 3}, "$append": {"cast": ["B"]}})
+
+    assert merged == {"$inc": {"views": 5}, "$set": {"cast": ["A", "B"]}}
+
+
+def test_set_operations_merge_only_with_the_same_operator():
+    assert merge_operations({"$addToSet": {"genres": ["noir"]}},
+                            {"$addToSet": {"genres": ["noir", "drama"]}}) == {
+        "$addToSet": {"genres": ["noir", "drama"]}}
+    assert merge_operations({"$addToSet": {"genres": ["noir"]}},
+                            {"$deleteFromSet": {"genres": ["noir"]}}) is None
+
+
+def test_conflicting_updates_do_not_merge():
+    assert merge_operations({"$set": {"title": "A"}}, {"$inc": {"title": 1}}) is None
+    assert merge_operations({"$addToSet": {"tags": ["a"]}}, {"$addToSet": {"tags": [1]}}) is None
+
+
+def test_plan_coalesces_updates_per_film_in_queue_order():
+    plan = plan_writes([
+        ("m1", {"op": "update", "film_id": "f1", "payload": {"$inc": {"views": 1}}}),
+        ("m2", {"op": "update", "film_id": "f2", "payload": {"$set": {"title": "B"}}}),
+        ("m3", {"op": "update", "film_id": "f1", "payload": {"$inc": {"views": 2}}}),
+        ("m4", {"op": "update", "film_id": "f1", "payload": {"$set": {"views": "x"}}}),
+        ("m5", {"op": "update", "film_id": "f1", "payload": {"$inc": {"views": 1}}}),
+    ])
+
+    assert plan == {
+        "f1": [
+            {"update": {"$set": {"views": "x"}}, "message_ids": ["m1", "m3", "m4"]},
+            {"update": {"$inc": {"views": 1}}, "message_ids": ["m5"]},
+        ],
+        "f2": [{"update": {"$set": {"title": "B"}}, "message_ids": ["m2"]}],
+    }
+
+
+def test_plan_folds_updates_into_a_preceding_create():
+    plan = plan_writes([
+        ("m1", {"op": "update", "film_id": "f1", "payload": {"$set": {"title": "Old"}}}),
+        ("m2", {"op": "create", "film_id": "f1", "payload": {"film_id": "f1", "title": "A", "version": 1}}),
+        ("m3", {"op": "update", "film_id": "f1", "payload": {"$addToSet": {"genres": ["noir"]}}}),
+        ("m4", {"op": "update", "film_id": "f1", "payload": {"$set": {"title": "B"}}}),
+    ])
+
+    update, put = plan["f1"]
+    assert update == {"update": {"$set": {"title": "Old"}}, "message_ids": ["m1"]}
+    assert put["put"] == {"film_id": "f1", "title": "B", "version": 1, "genres": {"noir"}}
+    assert put["message_ids"] == ["m2", "m3", "m4"]
+    # Kept for the case where the film already exists and the create is rejected
+    assert put["then"] == [{"update": {"$addToSet": {"genres": ["noir"]}, "$set": {"title": "B"}},
+                            "message_ids": ["m3", "m4"]}]